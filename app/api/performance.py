@@ -1,18 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text, func
 from app.database import get_db
 from app.models import User
 from app.core.auth import get_current_user
 from app.core.permissions import require_permissions, Permission
+from app.core.cache import get_cache_stats, get_response_time_percentiles
+from app.core.perf_sampler import cpu_sampler
 from typing import Dict, List, Any, Optional
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 import asyncio
+import hashlib
+import orjson
+import numpy as np
 import psutil
 import time
+from functools import lru_cache
 
 router = APIRouter(prefix="/api/performance", tags=["performance"])
 
+# Statements are built once at import so SQLAlchemy's compiled cache is hit
+# on every poll instead of re-constructing and re-compiling the text clause
+_Q_USER_COUNT = text("SELECT COUNT(*) FROM users")
+_Q_DASHBOARD_STATS = text("""
+    WITH c AS (
+        SELECT COUNT(*) AS total_connections
+        FROM pg_stat_activity WHERE datname = current_database()
+    ), u AS (
+        SELECT COUNT(*) AS total_users FROM users
+    ), a AS (
+        SELECT COUNT(*) AS logs_last_hour,
+               AVG(EXTRACT(EPOCH FROM (updated_at - created_at))) AS avg_response_time
+        FROM audit_logs
+        WHERE created_at > :cutoff
+    )
+    SELECT c.total_connections, u.total_users, a.logs_last_hour, a.avg_response_time
+    FROM c, u, a
+""")
+
+# Performance thresholds
+PERFORMANCE_THRESHOLDS = {
+    "cpu_warning": 70,
+    "cpu_critical": 90,
+    "memory_warning": 80,
+    "memory_critical": 95,
+    "response_time_warning": 1.0,
+    "response_time_critical": 2.0
+}
+
+_GB = 1024 ** 3
+
+@dataclass(slots=True, frozen=True)
+class SystemSnapshot:
+    """Point-in-time host resource readings"""
+    cpu_percent: float
+    memory_percent: float
+    memory_available: int
+    disk_used: int
+    disk_total: int
+    disk_free: int
+    
+    @classmethod
+    def capture(cls) -> "SystemSnapshot":
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        return cls(
+            cpu_percent=cpu_sampler.cpu_percent(),
+            memory_percent=memory.percent,
+            memory_available=memory.available,
+            disk_used=disk.used,
+            disk_total=disk.total,
+            disk_free=disk.free
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "cpu_percent": self.cpu_percent,
+            "memory_percent": self.memory_percent,
+            "memory_available_gb": round(self.memory_available / _GB, 2),
+            "disk_usage_percent": round((self.disk_used / self.disk_total) * 100, 1),
+            "disk_free_gb": round(self.disk_free / _GB, 2)
+        }
+
+@dataclass(slots=True, frozen=True)
+class PerformanceAlert:
+    """A metric that breached its warning or critical threshold"""
+    level: str
+    metric: str
+    value: float
+    threshold: float
+    message: str
+    endpoint: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        alert = {"level": self.level, "metric": self.metric}
+        if self.endpoint is not None:
+            alert["endpoint"] = self.endpoint
+        alert["value"] = self.value
+        alert["threshold"] = self.threshold
+        alert["message"] = self.message
+        return alert
+
+def _conditional_json(request: Request, payload: Dict[str, Any]) -> Response:
+    """
+    Serialize payload with an ETag, answering 304 when the client's copy is current.
+    
+    The payload is encoded once with sorted keys; the ETag is a hash of
+    those bytes, which are also the response body. Only for payloads that
+    are stable between polls - live gauges would change the tag every time.
+    """
+    body = orjson.dumps(
+        payload, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    )
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers={"ETag": etag})
+    
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @router.get("/metrics")
 async def get_performance_metrics(
     current_user: User = Depends(get_current_user),
@@ -21,55 +131,37 @@ async def get_performance_metrics(
     """Get comprehensive performance metrics"""
     require_permissions(current_user, [Permission.ADMIN])
     
-    # System metrics
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
-    
-    # Database performance
-    db_stats = db.execute(text("""
-        SELECT 
-            COUNT(*) as total_connections,
-            (SELECT COUNT(*) FROM users) as total_users,
-            (SELECT COUNT(*) FROM audit_logs WHERE created_at > NOW() - INTERVAL '1 hour') as logs_last_hour,
-            (SELECT AVG(EXTRACT(EPOCH FROM (updated_at - created_at))) FROM audit_logs WHERE created_at > NOW() - INTERVAL '1 hour') as avg_response_time
-    """)).fetchone()
-    
-    # API response times (simulated for now - would integrate with actual monitoring)
-    response_times = {
-        "/api/campaigns": 0.25,
-        "/api/users": 0.18,
-        "/api/analytics": 0.45,
-        "/api/billing": 0.32,
-        "/api/compliance": 0.28
-    }
+    # Not conditional: CPU and memory readings differ on every poll, so an
+    # ETag would never match
+    return _collect_performance_metrics(db)
+
+def _collect_performance_metrics(db: Session) -> Dict[str, Any]:
+    """Collect system, database and API metrics into a response payload"""
+    # System metrics - captured once into a slotted snapshot shared by
+    # scoring, alerting and the response body
+    system = SystemSnapshot.capture()
     
-    # Performance thresholds
-    thresholds = {
-        "cpu_warning": 70,
-        "cpu_critical": 90,
-        "memory_warning": 80,
-        "memory_critical": 95,
-        "response_time_warning": 1.0,
-        "response_time_critical": 2.0
+    # Database performance - every dashboard stat in one round-trip, with a
+    # single scan of the last hour of audit logs feeding both aggregates
+    db_stats = db.execute(
+        _Q_DASHBOARD_STATS, {"cutoff": datetime.utcnow() - timedelta(hours=1)}
+    ).fetchone()
+    
+    # API response times - rolling p95 per endpoint, recorded by the
+    # response timing middleware
+    response_percentiles = get_response_time_percentiles()
+    response_times = {
+        endpoint: stats["p95"] for endpoint, stats in response_percentiles.items()
     }
     
     # Calculate performance score
-    cpu_score = max(0, 100 - cpu_percent)
-    memory_score = max(0, 100 - memory.percent)
-    response_score = max(0, 100 - (max(response_times.values()) * 50))
-    
-    overall_score = (cpu_score + memory_score + response_score) / 3
+    cpu_score = max(0, 100 - system.cpu_percent)
+    memory_score = max(0, 100 - system.memory_percent)
+    response_score = max(0, 100 - (max(response_times.values(), default=0) * 50))
     
     return {
-        "overall_score": round(overall_score, 1),
-        "system_metrics": {
-            "cpu_percent": cpu_percent,
-            "memory_percent": memory.percent,
-            "memory_available_gb": round(memory.available / (1024**3), 2),
-            "disk_usage_percent": round((disk.used / disk.total) * 100, 1),
-            "disk_free_gb": round(disk.free / (1024**3), 2)
-        },
+        "overall_score": round((cpu_score + memory_score + response_score) / 3, 1),
+        "system_metrics": system.to_dict(),
         "database_metrics": {
             "total_connections": db_stats.total_connections,
             "total_users": db_stats.total_users,
@@ -77,73 +169,103 @@ async def get_performance_metrics(
             "avg_response_time": round(float(db_stats.avg_response_time or 0), 3)
         },
         "api_response_times": response_times,
-        "thresholds": thresholds,
-        "alerts": _generate_performance_alerts(
-            cpu_percent, memory.percent, response_times, thresholds
-        ),
+        "api_response_percentiles": response_percentiles,
+        "thresholds": PERFORMANCE_THRESHOLDS,
+        "alerts": [
+            alert.to_dict() for alert in _generate_performance_alerts(
+                system.cpu_percent, system.memory_percent, response_times, PERFORMANCE_THRESHOLDS
+            )
+        ],
         "timestamp": datetime.utcnow().isoformat()
     }
 
-def _generate_performance_alerts(cpu_percent, memory_percent, response_times, thresholds):
+def _generate_performance_alerts(
+    cpu_percent: float,
+    memory_percent: float,
+    response_times: Dict[str, float],
+    thresholds: Dict[str, float]
+) -> List[PerformanceAlert]:
     """Generate performance alerts based on thresholds"""
-    alerts = []
+    alerts: List[PerformanceAlert] = []
     
     if cpu_percent > thresholds["cpu_critical"]:
-        alerts.append({
-            "level": "critical",
-            "metric": "CPU",
-            "value": cpu_percent,
-            "threshold": thresholds["cpu_critical"],
-            "message": f"Critical CPU usage: {cpu_percent}%"
-        })
+        alerts.append(PerformanceAlert(
+            level="critical",
+            metric="CPU",
+            value=cpu_percent,
+            threshold=thresholds["cpu_critical"],
+            message=f"Critical CPU usage: {cpu_percent}%"
+        ))
     elif cpu_percent > thresholds["cpu_warning"]:
-        alerts.append({
-            "level": "warning",
-            "metric": "CPU",
-            "value": cpu_percent,
-            "threshold": thresholds["cpu_warning"],
-            "message": f"High CPU usage: {cpu_percent}%"
-        })
+        alerts.append(PerformanceAlert(
+            level="warning",
+            metric="CPU",
+            value=cpu_percent,
+            threshold=thresholds["cpu_warning"],
+            message=f"High CPU usage: {cpu_percent}%"
+        ))
     
     if memory_percent > thresholds["memory_critical"]:
-        alerts.append({
-            "level": "critical",
-            "metric": "Memory",
-            "value": memory_percent,
-            "threshold": thresholds["memory_critical"],
-            "message": f"Critical memory usage: {memory_percent}%"
-        })
+        alerts.append(PerformanceAlert(
+            level="critical",
+            metric="Memory",
+            value=memory_percent,
+            threshold=thresholds["memory_critical"],
+            message=f"Critical memory usage: {memory_percent}%"
+        ))
     elif memory_percent > thresholds["memory_warning"]:
-        alerts.append({
-            "level": "warning",
-            "metric": "Memory",
-            "value": memory_percent,
-            "threshold": thresholds["memory_warning"],
-            "message": f"High memory usage: {memory_percent}%"
-        })
+        alerts.append(PerformanceAlert(
+            level="warning",
+            metric="Memory",
+            value=memory_percent,
+            threshold=thresholds["memory_warning"],
+            message=f"High memory usage: {memory_percent}%"
+        ))
+    
+    # Threshold every endpoint in one vectorized pass and only build alerts
+    # for the endpoints that actually breach a threshold
+    endpoints = tuple(response_times)
+    times = np.fromiter(response_times.values(), dtype=np.float64, count=len(endpoints))
+    critical_mask = times > thresholds["response_time_critical"]
+    warning_mask = (times > thresholds["response_time_warning"]) & ~critical_mask
     
-    for endpoint, response_time in response_times.items():
-        if response_time > thresholds["response_time_critical"]:
-            alerts.append({
-                "level": "critical",
-                "metric": "Response Time",
-                "endpoint": endpoint,
-                "value": response_time,
-                "threshold": thresholds["response_time_critical"],
-                "message": f"Critical response time for {endpoint}: {response_time}s"
-            })
-        elif response_time > thresholds["response_time_warning"]:
-            alerts.append({
-                "level": "warning",
-                "metric": "Response Time",
-                "endpoint": endpoint,
-                "value": response_time,
-                "threshold": thresholds["response_time_warning"],
-                "message": f"Slow response time for {endpoint}: {response_time}s"
-            })
+    for i in np.flatnonzero(critical_mask | warning_mask):
+        endpoint = endpoints[i]
+        response_time = response_times[endpoint]
+        if critical_mask[i]:
+            alerts.append(PerformanceAlert(
+                level="critical",
+                metric="Response Time",
+                endpoint=endpoint,
+                value=response_time,
+                threshold=thresholds["response_time_critical"],
+                message=f"Critical response time for {endpoint}: {response_time}s"
+            ))
+        else:
+            alerts.append(PerformanceAlert(
+                level="warning",
+                metric="Response Time",
+                endpoint=endpoint,
+                value=response_time,
+                threshold=thresholds["response_time_warning"],
+                message=f"Slow response time for {endpoint}: {response_time}s"
+            ))
     
     return alerts
 
+@router.get("/cache-stats")
+async def get_cache_statistics(
+    current_user: User = Depends(get_current_user)
+):
+    """Get Redis cache statistics and rolling response time percentiles"""
+    require_permissions(current_user, [Permission.ADMIN])
+    
+    return {
+        "cache": get_cache_stats(),
+        "response_times": get_response_time_percentiles(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @router.get("/optimization-recommendations")
 async def get_optimization_recommendations(
     current_user: User = Depends(get_current_user),
@@ -153,7 +275,7 @@ async def get_optimization_recommendations(
     require_permissions(current_user, [Permission.ADMIN])
     
     # Analyze current performance
-    metrics = await get_performance_metrics(current_user, db)
+    metrics = _collect_performance_metrics(db)
     
     recommendations = []
     
@@ -298,6 +420,7 @@ async def _run_optimization(optimization_type: str):
 
 @router.get("/scaling-plan")
 async def get_scaling_plan(
+    request: Request,
     target_users: int = 10000,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -305,7 +428,15 @@ async def get_scaling_plan(
     """Generate scaling plan for target user count"""
     require_permissions(current_user, [Permission.ADMIN])
     
-    current_users = db.execute(text("SELECT COUNT(*) FROM users")).scalar()
+    current_users = db.execute(_Q_USER_COUNT).scalar()
+    
+    # Plans are pure functions of the two user counts; the cached tree is
+    # shared and only ever serialized, never mutated.
+    return _conditional_json(request, _build_scaling_plan(current_users, target_users))
+
+@lru_cache(maxsize=128)
+def _build_scaling_plan(current_users: int, target_users: int) -> Dict[str, Any]:
+    """Build the scaling plan for a (current, target) user count pair"""
     scale_factor = target_users / max(current_users, 1)
     
     scaling_plan = {
@@ -2,7 +2,8 @@
 Attribution Engine Database Models
 SQLAlchemy models for persisting attribution data
 """
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, JSON, Text, ForeignKey, Index
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, JSON, Text, ForeignKey, Index, DDL, event, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -11,6 +12,11 @@ from datetime import datetime
 import json
 
 
+# List-of-strings column: native text[] on PostgreSQL (GIN-indexable, filterable
+# with @> / ANY), plain JSON elsewhere so SQLite dev/test databases still work
+StringArray = JSON().with_variant(ARRAY(String), "postgresql")
+
+
 class AttributionTouchpoint(Base):
     """
     Individual touchpoint event in a customer journey
@@ -18,11 +24,13 @@ class AttributionTouchpoint(Base):
     """
     __tablename__ = "attribution_touchpoints"
 
-    # Primary key
+    # Primary key - includes the partition key, as PostgreSQL requires for
+    # unique constraints on range-partitioned tables
     id = Column(String, primary_key=True)  # event_id from TouchpointEvent
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
 
     # Journey relationship
-    journey_id = Column(String, ForeignKey("attribution_journeys.id"), nullable=False, index=True)
+    journey_id = Column(String, ForeignKey("attribution_journeys.id"), nullable=False)
 
     # User identification
     user_id = Column(String, index=True)  # May be null for anonymous
@@ -30,7 +38,6 @@ class AttributionTouchpoint(Base):
     # Event details
     event_type = Column(String, nullable=False)  # click, impression, view, etc.
     platform = Column(String, nullable=False, index=True)  # meta, google_ads, linkedin, etc.
-    timestamp = Column(DateTime, nullable=False, index=True)
 
     # Campaign details
     campaign_id = Column(String, index=True)
@@ -69,14 +76,109 @@ class AttributionTouchpoint(Base):
     # Indexes for common queries
     __table_args__ = (
         Index('idx_touchpoint_user_timestamp', 'user_id', 'timestamp'),
+        Index('idx_touchpoint_journey_timestamp', 'journey_id', 'timestamp'),
         Index('idx_touchpoint_platform_timestamp', 'platform', 'timestamp'),
         Index('idx_touchpoint_campaign', 'campaign_id', 'timestamp'),
+        # Append-only, time-ordered inserts: a BRIN index serves time-window
+        # range scans at a tiny fraction of a btree's size
+        Index('idx_touchpoint_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+        # Monthly range partitions on PostgreSQL; indexes above are created on
+        # the parent and propagated to every partition
+        {"postgresql_partition_by": "RANGE (timestamp)"},
     )
 
     def __repr__(self):
         return f"<Touchpoint(id='{self.id}', platform='{self.platform}', type='{self.event_type}')>"
 
 
+def ensure_touchpoint_partitions(connection, months_ahead: int = 3, start: Optional[datetime] = None) -> List[str]:
+    """
+    Create monthly attribution_touchpoints partitions (PostgreSQL only)
+
+    Creates one partition per month from start (default: current month)
+    through months_ahead months later. Safe to call repeatedly - run it from
+    a scheduled job so partitions always exist before rows for them arrive.
+    Rows outside every monthly range land in the default partition; if a
+    month's rows already sit there, they are moved into its new partition.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+
+    start = start or datetime.utcnow()
+    year, month = start.year, start.month
+    created = []
+    for _ in range(months_ahead + 1):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        name = f"attribution_touchpoints_{year:04d}_{month:02d}"
+        if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            _create_touchpoint_partition(
+                connection, name, f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+            )
+        created.append(name)
+        year, month = next_year, next_month
+    return created
+
+
+def _create_touchpoint_partition(connection, name: str, lower: str, upper: str) -> None:
+    """
+    Create one monthly partition, adopting any of its rows from the default
+
+    PostgreSQL refuses to create a range partition while the default partition
+    holds rows in that range. In that case the default is detached, the new
+    partition created, the stranded rows re-inserted through the parent (which
+    routes them to the new partition) and the default re-attached, all in the
+    caller's transaction.
+    """
+    bounds = {"lower": lower, "upper": upper}
+    create = text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF attribution_touchpoints "
+        f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    )
+
+    has_default = connection.execute(
+        text("SELECT to_regclass('attribution_touchpoints_default')")
+    ).scalar() is not None
+    stranded = has_default and connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM attribution_touchpoints_default "
+        "WHERE timestamp >= :lower AND timestamp < :upper)"
+    ), bounds).scalar()
+    if not stranded:
+        connection.execute(create)
+        return
+
+    connection.execute(text(
+        "ALTER TABLE attribution_touchpoints DETACH PARTITION attribution_touchpoints_default"
+    ))
+    connection.execute(create)
+    connection.execute(text(
+        "WITH moved AS ("
+        "DELETE FROM attribution_touchpoints_default "
+        "WHERE timestamp >= :lower AND timestamp < :upper RETURNING *"
+        ") INSERT INTO attribution_touchpoints SELECT * FROM moved"
+    ), bounds)
+    connection.execute(text(
+        "ALTER TABLE attribution_touchpoints ATTACH PARTITION attribution_touchpoints_default DEFAULT"
+    ))
+
+
+# A partitioned parent accepts no rows on its own: always provide a catch-all
+# default partition plus the upcoming monthly partitions at table creation
+event.listen(
+    AttributionTouchpoint.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS attribution_touchpoints_default "
+        "PARTITION OF attribution_touchpoints DEFAULT"
+    ).execute_if(dialect="postgresql")
+)
+event.listen(
+    AttributionTouchpoint.__table__,
+    "after_create",
+    lambda target, connection, **kw: ensure_touchpoint_partitions(connection)
+)
+
+
 class AttributionConversion(Base):
     """
     Conversion event (purchase, lead, signup, etc.)
@@ -95,7 +197,7 @@ class AttributionConversion(Base):
 
     # Conversion details
     conversion_type = Column(String, nullable=False)  # purchase, lead, signup, etc.
-    timestamp = Column(DateTime, nullable=False, index=True)
+    timestamp = Column(DateTime, nullable=False)
 
     # Value
     revenue = Column(Float, default=0.0)
@@ -107,7 +209,7 @@ class AttributionConversion(Base):
 
     # Order/transaction details
     order_id = Column(String, index=True)
-    product_ids = Column(JSON, default=list)  # List of product IDs
+    product_ids = Column(StringArray, default=list)  # List of product IDs
     product_names = Column(JSON, default=list)
 
     # Context
@@ -123,7 +225,9 @@ class AttributionConversion(Base):
     # Indexes
     __table_args__ = (
         Index('idx_conversion_user_timestamp', 'user_id', 'timestamp'),
-        Index('idx_conversion_timestamp', 'timestamp'),
+        Index('idx_conversion_timestamp_brin', 'timestamp',
+              postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+        Index('idx_conversion_product_ids_gin', 'product_ids', postgresql_using='gin'),
     )
 
     def __repr__(self):
@@ -141,7 +245,7 @@ class AttributionJourney(Base):
     id = Column(String, primary_key=True)  # journey_id
 
     # User identification
-    user_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)
 
     # Tenant (for multi-tenancy)
     tenant_id = Column(String, index=True)
@@ -153,7 +257,7 @@ class AttributionJourney(Base):
     # Journey metrics
     total_touchpoints = Column(Integer, default=0)
     unique_platforms = Column(Integer, default=0)
-    platform_list = Column(JSON, default=list)  # List of platform names
+    platform_list = Column(StringArray, default=list)  # List of platform names
 
     # Timeline
     first_touch_at = Column(DateTime, index=True)
@@ -169,8 +273,19 @@ class AttributionJourney(Base):
     journey_type = Column(String)  # ecommerce, lead_gen, saas, etc.
 
     # Relationships
-    touchpoints = relationship("AttributionTouchpoint", backref="journey", lazy="dynamic")
-    conversion = relationship("AttributionConversion", backref="journey", uselist=False)
+    touchpoints = relationship(
+        "AttributionTouchpoint",
+        backref="journey",
+        order_by="AttributionTouchpoint.timestamp"
+    )
+    # conversions.journey_id is the owning side; journeys.conversion_id is a
+    # denormalized pointer back, so name the join column explicitly
+    conversion = relationship(
+        "AttributionConversion",
+        backref="journey",
+        uselist=False,
+        foreign_keys="AttributionConversion.journey_id"
+    )
     attribution_results = relationship("AttributionResult", backref="journey", lazy="dynamic")
 
     # Metadata
@@ -179,9 +294,11 @@ class AttributionJourney(Base):
 
     # Indexes
     __table_args__ = (
-        Index('idx_journey_user_converted', 'user_id', 'converted'),
+        # Matches get_journey_for_user: filter on (user_id, converted), newest first
+        Index('idx_journey_user_converted_created', 'user_id', 'converted', 'created_at'),
         Index('idx_journey_converted_timestamp', 'converted', 'conversion_at'),
         Index('idx_journey_tenant', 'tenant_id', 'created_at'),
+        Index('idx_journey_platforms_gin', 'platform_list', postgresql_using='gin'),
     )
 
     def __repr__(self):
@@ -284,7 +401,11 @@ class AttributionModelState(Base):
 
     # Indexes
     __table_args__ = (
-        Index('idx_model_state_active', 'model_type', 'is_active', 'tenant_id'),
+        Index('idx_model_state_lookup', 'model_type', 'tenant_id', 'is_active', 'is_trained'),
+        # At most one active state per model and tenant. COALESCE folds the
+        # shared (NULL tenant) models into one key, since NULLs never collide
+        Index('uq_model_state_active', 'model_type', text("COALESCE(tenant_id, '')"), unique=True,
+              postgresql_where=text('is_active'), sqlite_where=text('is_active')),
     )
 
     def __repr__(self):
@@ -2,10 +2,21 @@
 Attribution Database Service Layer
 Handles all database operations for attribution engine
 """
-from typing import List, Optional, Dict, Any
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Iterator, List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import JSON, and_, bindparam, column, event, or_, desc, func, inspect, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from cachetools import TTLCache
+import numpy as np
+import copy
+import threading
 import uuid
 import logging
 
@@ -21,7 +32,9 @@ from app.attribution.event_schema import (
     TouchpointEvent,
     ConversionEvent,
     CustomerJourney,
-    Platform
+    EventType,
+    Platform,
+    journey_columns
 )
 from app.attribution.models import (
     AttributionResult as AttributionResultModel,
@@ -30,6 +43,95 @@ from app.attribution.models import (
 
 logger = logging.getLogger(__name__)
 
+# Dialect-specific INSERTs that support ON CONFLICT upserts
+_UPSERT_INSERTS = {
+    "postgresql": pg_insert,
+    "sqlite": sqlite_insert
+}
+
+# Active model states per (model_type, tenant_id); shared across requests
+# because a service instance only lives for one request. Entries are frozen
+# column snapshots; only found states are cached, so a newly trained model
+# is visible as soon as it is committed
+MODEL_STATE_CACHE_TTL_SECONDS = 60
+_model_state_cache = TTLCache(maxsize=64, ttl=MODEL_STATE_CACHE_TTL_SECONDS)
+_model_state_cache_lock = threading.Lock()
+# Bumped on every invalidation, so a read that raced a save cannot cache
+# the state it loaded before the save
+_model_state_generation = 0
+
+# AttributionTouchpoint column <-> TouchpointEvent field pairs. The attrgetters
+# read a whole row or event in one call when converting in either direction.
+_TOUCHPOINT_COLUMN_FIELDS = (
+    ("id", "event_id"),
+    ("user_id", "user_id"),
+    ("event_type", "event_type"),
+    ("platform", "platform"),
+    ("timestamp", "timestamp"),
+    ("campaign_id", "campaign_id"),
+    ("campaign_name", "campaign_name"),
+    ("ad_set_id", "ad_set_id"),
+    ("ad_id", "ad_id"),
+    ("utm_source", "utm_source"),
+    ("utm_medium", "utm_medium"),
+    ("utm_campaign", "utm_campaign"),
+    ("utm_content", "utm_content"),
+    ("utm_term", "utm_term"),
+    ("page_url", "page_url"),
+    ("referrer_url", "referrer_url"),
+    ("device_type", "device_type"),
+    ("browser", "browser"),
+    ("country", "country"),
+    ("region", "region"),
+    ("city", "city"),
+    ("time_spent", "time_on_page"),
+    ("custom_data", "custom_data")
+)
+_TOUCHPOINT_COLUMNS, _TOUCHPOINT_FIELDS = zip(*_TOUCHPOINT_COLUMN_FIELDS)
+_get_touchpoint_columns = attrgetter(*_TOUCHPOINT_COLUMNS)
+_get_touchpoint_fields = attrgetter(*_TOUCHPOINT_FIELDS)
+
+# Rows per server-side cursor fetch when streaming journeys
+JOURNEY_STREAM_CHUNK_SIZE = 1000
+
+# Set-returning functions that expand a JSON array into one row per element
+_JSON_ARRAY_ELEMENTS = {
+    "postgresql": "json_array_elements",
+    "sqlite": "json_each"
+}
+
+# Journey columns refreshed when an existing journey is upserted
+JOURNEY_UPSERT_FIELDS = (
+    "converted",
+    "total_touchpoints",
+    "unique_platforms",
+    "platform_list",
+    "last_touch_at"
+)
+JOURNEY_CONVERSION_FIELDS = (
+    "conversion_at",
+    "conversion_value",
+    "conversion_type",
+    "days_to_convert"
+)
+
+# Latest journey for a user, built once for the per-event tracking path;
+# rebuilding the ORM query on every call costs more than running it
+_SELECT_LATEST_JOURNEY = select(AttributionJourney)\
+    .where(AttributionJourney.user_id == bindparam("user_id"))\
+    .order_by(desc(AttributionJourney.created_at))\
+    .limit(1)
+_SELECT_LATEST_ACTIVE_JOURNEY = _SELECT_LATEST_JOURNEY\
+    .where(AttributionJourney.converted == False)
+
+# The same lookups with the journey's touchpoints and conversion loaded too
+_JOURNEY_EVENTS = (
+    selectinload(AttributionJourney.touchpoints),
+    selectinload(AttributionJourney.conversion)
+)
+_SELECT_LATEST_FULL_JOURNEY = _SELECT_LATEST_JOURNEY.options(*_JOURNEY_EVENTS)
+_SELECT_LATEST_ACTIVE_FULL_JOURNEY = _SELECT_LATEST_ACTIVE_JOURNEY.options(*_JOURNEY_EVENTS)
+
 
 class AttributionDatabaseService:
     """Service for attribution database operations"""
@@ -37,45 +139,103 @@ class AttributionDatabaseService:
     def __init__(self, db: Session):
         self.db = db
 
+    @contextmanager
+    def unit_of_work(self) -> Iterator["AttributionDatabaseService"]:
+        """
+        Group writes into a single transaction
+
+        Writer methods only flush by default; everything done inside the
+        block is committed once on exit, or rolled back if it raises.
+        """
+        try:
+            yield self
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _finish_write(self, flush_only: bool) -> None:
+        """Flush pending writes, committing only when asked to"""
+        if flush_only:
+            self.db.flush()
+        else:
+            self.db.commit()
+
     # ==================== TOUCHPOINT OPERATIONS ====================
 
-    def save_touchpoint(self, touchpoint: TouchpointEvent, journey_id: str) -> AttributionTouchpoint:
+    def save_touchpoint(
+        self,
+        touchpoint: TouchpointEvent,
+        journey_id: str,
+        flush_only: bool = True
+    ) -> AttributionTouchpoint:
         """Save a touchpoint event to database"""
-        db_touchpoint = AttributionTouchpoint(
-            id=touchpoint.event_id,
-            journey_id=journey_id,
-            user_id=touchpoint.user_id,
-            event_type=touchpoint.event_type.value if hasattr(touchpoint.event_type, 'value') else touchpoint.event_type,
-            platform=touchpoint.platform.value,
-            timestamp=touchpoint.timestamp,
-            campaign_id=touchpoint.campaign_id,
-            campaign_name=touchpoint.campaign_name,
-            ad_set_id=touchpoint.ad_set_id,
-            ad_id=touchpoint.ad_id,
-            utm_source=touchpoint.utm_source,
-            utm_medium=touchpoint.utm_medium,
-            utm_campaign=touchpoint.utm_campaign,
-            utm_content=touchpoint.utm_content,
-            utm_term=touchpoint.utm_term,
-            page_url=touchpoint.page_url,
-            referrer_url=touchpoint.referrer_url,
-            device_type=touchpoint.device_type,
-            browser=touchpoint.browser,
-            country=touchpoint.country,
-            region=touchpoint.region,
-            city=touchpoint.city,
-            engagement_score=touchpoint.engagement_score,
-            time_spent=touchpoint.time_spent,
-            custom_data=touchpoint.custom_data
-        )
+        db_touchpoint = AttributionTouchpoint(**self._touchpoint_row(touchpoint, journey_id))
 
         self.db.add(db_touchpoint)
-        self.db.commit()
-        self.db.refresh(db_touchpoint)
+        self._finish_write(flush_only)
 
         logger.info(f"Saved touchpoint {touchpoint.event_id} for journey {journey_id}")
         return db_touchpoint
 
+    def save_touchpoints_bulk(
+        self,
+        touchpoints: List[TouchpointEvent],
+        journey_id: str,
+        flush_only: bool = True
+    ) -> int:
+        """
+        Save many touchpoint events for a journey in one round-trip
+
+        Rows go out as a single executemany INSERT, instead of an INSERT per
+        touchpoint; touchpoints already stored are skipped. Returns the number
+        of touchpoints submitted.
+        """
+        if not touchpoints:
+            return 0
+
+        rows = [self._touchpoint_row(tp, journey_id) for tp in touchpoints]
+        self._insert_touchpoint_rows(rows)
+        self._finish_write(flush_only)
+
+        logger.info(f"Saved {len(rows)} touchpoints for journey {journey_id}")
+        return len(rows)
+
+    def save_touchpoints_for_journeys(
+        self,
+        touchpoints: List[Tuple[TouchpointEvent, str]],
+        flush_only: bool = True
+    ) -> int:
+        """
+        Save (touchpoint, journey_id) pairs spanning many journeys in one round-trip
+
+        Like save_touchpoints_bulk, but a mixed batch still goes out as a
+        single executemany INSERT. Returns the number of touchpoints submitted.
+        """
+        if not touchpoints:
+            return 0
+
+        rows = [self._touchpoint_row(tp, journey_id) for tp, journey_id in touchpoints]
+        self._insert_touchpoint_rows(rows)
+        self._finish_write(flush_only)
+
+        logger.info(f"Saved {len(rows)} touchpoints across journeys")
+        return len(rows)
+
+    def _insert_touchpoint_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Insert touchpoint rows as one executemany INSERT ... ON CONFLICT DO NOTHING
+
+        Event ids are unique, so a touchpoint that is already stored (a client
+        retry, or an event replayed after a failed batch) is skipped instead of
+        failing every other row in the batch.
+        """
+        insert = _UPSERT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(AttributionTouchpoint).on_conflict_do_nothing(
+            index_elements=[AttributionTouchpoint.id, AttributionTouchpoint.timestamp]
+        )
+        self.db.execute(stmt, rows)
+
     def get_touchpoints_for_journey(self, journey_id: str) -> List[AttributionTouchpoint]:
         """Get all touchpoints for a journey"""
         return self.db.query(AttributionTouchpoint)\
@@ -102,7 +262,12 @@ class AttributionDatabaseService:
 
     # ==================== CONVERSION OPERATIONS ====================
 
-    def save_conversion(self, conversion: ConversionEvent, journey_id: str) -> AttributionConversion:
+    def save_conversion(
+        self,
+        conversion: ConversionEvent,
+        journey_id: str,
+        flush_only: bool = True
+    ) -> AttributionConversion:
         """Save a conversion event to database"""
         db_conversion = AttributionConversion(
             id=conversion.conversion_id,
@@ -123,8 +288,7 @@ class AttributionDatabaseService:
         )
 
         self.db.add(db_conversion)
-        self.db.commit()
-        self.db.refresh(db_conversion)
+        self._finish_write(flush_only)
 
         logger.info(f"Saved conversion {conversion.conversion_id} for journey {journey_id}")
         return db_conversion
@@ -140,52 +304,52 @@ class AttributionDatabaseService:
     def create_or_update_journey(
         self,
         journey: CustomerJourney,
-        tenant_id: Optional[str] = None
+        tenant_id: Optional[str] = None,
+        flush_only: bool = True
     ) -> AttributionJourney:
-        """Create or update a customer journey"""
-        # Check if journey already exists
-        db_journey = self.db.query(AttributionJourney)\
-            .filter(AttributionJourney.id == journey.journey_id)\
-            .first()
-
-        if db_journey:
-            # Update existing journey
-            db_journey.total_touchpoints = journey.total_touchpoints
-            db_journey.unique_platforms = journey.unique_platforms
-            db_journey.platform_list = [p.value for p in journey.get_platforms()]
-            db_journey.last_touch_at = journey.last_touch_at
-            db_journey.converted = journey.converted
-
-            if journey.conversion:
-                db_journey.conversion_at = journey.conversion.timestamp
-                db_journey.conversion_value = journey.conversion.revenue
-                db_journey.conversion_type = journey.conversion.conversion_type
-                db_journey.days_to_convert = journey.days_to_convert
-        else:
-            # Create new journey
-            db_journey = AttributionJourney(
-                id=journey.journey_id,
-                user_id=journey.user_id,
-                tenant_id=tenant_id,
-                converted=journey.converted,
-                total_touchpoints=journey.total_touchpoints,
-                unique_platforms=journey.unique_platforms,
-                platform_list=[p.value for p in journey.get_platforms()],
-                first_touch_at=journey.first_touch_at,
-                last_touch_at=journey.last_touch_at,
-                journey_type=journey.journey_type
+        """
+        Create or update a customer journey
+
+        Issued as a single INSERT ... ON CONFLICT (id) DO UPDATE ... RETURNING,
+        so there is no existence check and no read-modify-write race.
+        """
+        values = {
+            "id": journey.journey_id,
+            "user_id": journey.user_id,
+            "tenant_id": tenant_id,
+            "converted": journey.converted,
+            "total_touchpoints": journey.total_touchpoints,
+            "unique_platforms": journey.unique_platforms,
+            "platform_list": journey.get_platform_values(),
+            "first_touch_at": journey.first_touch,
+            "last_touch_at": journey.last_touch
+        }
+        update_fields = JOURNEY_UPSERT_FIELDS
+
+        if journey.conversion:
+            values.update(
+                conversion_at=journey.conversion.timestamp,
+                conversion_value=journey.conversion.revenue,
+                conversion_type=journey.conversion.conversion_type,
+                days_to_convert=journey.days_to_convert
             )
+            update_fields = update_fields + JOURNEY_CONVERSION_FIELDS
+
+        insert = _UPSERT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = insert(AttributionJourney).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AttributionJourney.id],
+            set_={
+                **{field: stmt.excluded[field] for field in update_fields},
+                "updated_at": func.now()
+            }
+        )
+        db_journey = self.db.scalars(
+            stmt.returning(AttributionJourney),
+            execution_options={"populate_existing": True}
+        ).one()
 
-            if journey.conversion:
-                db_journey.conversion_at = journey.conversion.timestamp
-                db_journey.conversion_value = journey.conversion.revenue
-                db_journey.conversion_type = journey.conversion.conversion_type
-                db_journey.days_to_convert = journey.days_to_convert
-
-            self.db.add(db_journey)
-
-        self.db.commit()
-        self.db.refresh(db_journey)
+        self._finish_write(flush_only)
 
         logger.info(f"Saved journey {journey.journey_id} for user {journey.user_id}")
         return db_journey
@@ -202,34 +366,138 @@ class AttributionDatabaseService:
         active_only: bool = True
     ) -> Optional[AttributionJourney]:
         """Get the most recent journey for a user"""
+        statement = _SELECT_LATEST_ACTIVE_JOURNEY if active_only else _SELECT_LATEST_JOURNEY
+        return self.db.execute(statement, {"user_id": user_id}).scalars().first()
+
+    def get_journeys_for_users(
+        self,
+        user_ids: List[str],
+        active_only: bool = True
+    ) -> Dict[str, AttributionJourney]:
+        """Get the most recent journey for each of many users in one query"""
+        if not user_ids:
+            return {}
+
         query = self.db.query(AttributionJourney)\
-            .filter(AttributionJourney.user_id == user_id)
+            .filter(AttributionJourney.user_id.in_(user_ids))
 
         if active_only:
             query = query.filter(AttributionJourney.converted == False)
 
-        return query.order_by(desc(AttributionJourney.created_at)).first()
+        # Newest first, so the first journey seen per user is the latest
+        latest = {}
+        for db_journey in query.order_by(desc(AttributionJourney.created_at)):
+            latest.setdefault(db_journey.user_id, db_journey)
+        return latest
 
     def build_journey_from_db(self, journey_id: str) -> Optional[CustomerJourney]:
         """Build a CustomerJourney object from database"""
-        db_journey = self.get_journey(journey_id)
+        # Journey, touchpoints and conversion in one query plus two IN loads
+        db_journey = self.db.query(AttributionJourney)\
+            .options(*_JOURNEY_EVENTS)\
+            .filter(AttributionJourney.id == journey_id)\
+            .first()
         if not db_journey:
             return None
 
-        # Get touchpoints
-        db_touchpoints = self.get_touchpoints_for_journey(journey_id)
-        touchpoints = [self._touchpoint_db_to_model(tp) for tp in db_touchpoints]
+        return self._journey_db_to_model(db_journey)
 
-        # Get conversion
-        db_conversion = self.get_conversion_for_journey(journey_id)
-        conversion = self._conversion_db_to_model(db_conversion) if db_conversion else None
+    def get_full_journey_for_user(
+        self,
+        user_id: str,
+        active_only: bool = True
+    ) -> Tuple[Optional[AttributionJourney], Optional[CustomerJourney]]:
+        """
+        Get a user's most recent journey row together with its built journey
+
+        One lookup loads the row, its touchpoints and its conversion, instead
+        of get_journey_for_user followed by build_journey_from_db fetching the
+        same row again. Returns (None, None) if the user has no journey.
+        """
+        statement = _SELECT_LATEST_ACTIVE_FULL_JOURNEY if active_only else _SELECT_LATEST_FULL_JOURNEY
+        db_journey = self.db.execute(statement, {"user_id": user_id}).scalars().first()
+        if not db_journey:
+            return None, None
 
-        # Build journey
-        return CustomerJourney.from_touchpoints(
-            user_id=db_journey.user_id,
-            touchpoints=touchpoints,
-            conversion=conversion
-        )
+        return db_journey, self._journey_db_to_model(db_journey)
+
+    def build_journeys_from_db(self, journey_ids: List[str]) -> List[CustomerJourney]:
+        """Build CustomerJourney objects for many journeys in three queries"""
+        if not journey_ids:
+            return []
+
+        db_journeys = self.db.query(AttributionJourney)\
+            .filter(AttributionJourney.id.in_(journey_ids))\
+            .all()
+
+        # Touchpoints come back in timestamp order, so each group is already sorted
+        touchpoints_by_journey = defaultdict(list)
+        db_touchpoints = self.db.query(AttributionTouchpoint)\
+            .filter(AttributionTouchpoint.journey_id.in_(journey_ids))\
+            .order_by(AttributionTouchpoint.timestamp)
+        for db_touchpoint in db_touchpoints:
+            touchpoints_by_journey[db_touchpoint.journey_id].append(
+                self._touchpoint_db_to_model(db_touchpoint)
+            )
+
+        conversions_by_journey = {
+            db_conversion.journey_id: self._conversion_db_to_model(db_conversion)
+            for db_conversion in self.db.query(AttributionConversion)
+                .filter(AttributionConversion.journey_id.in_(journey_ids))
+        }
+
+        journeys_by_id = {}
+        for db_journey in db_journeys:
+            touchpoints = touchpoints_by_journey.get(db_journey.id)
+            if not touchpoints:
+                continue
+            journeys_by_id[db_journey.id] = CustomerJourney.from_touchpoints(
+                user_id=db_journey.user_id,
+                touchpoints=touchpoints,
+                conversion=conversions_by_journey.get(db_journey.id),
+                assume_sorted=True
+            )
+
+        # Preserve the caller's ordering
+        return [journeys_by_id[jid] for jid in journey_ids if jid in journeys_by_id]
+
+    def get_journey_columns(self, journey_ids: List[str]) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Load touchpoints for many journeys straight into column arrays
+
+        Selects only the columns attribution models read and skips ORM and
+        Pydantic hydration entirely. Returns {journey_id: columns} in the
+        CustomerJourney.to_columns() layout.
+        """
+        if not journey_ids:
+            return {}
+
+        rows = self.db.execute(
+            select(
+                AttributionTouchpoint.journey_id,
+                AttributionTouchpoint.platform,
+                AttributionTouchpoint.event_type,
+                AttributionTouchpoint.timestamp,
+                AttributionTouchpoint.campaign_id
+            )
+            .where(AttributionTouchpoint.journey_id.in_(journey_ids))
+            .order_by(AttributionTouchpoint.journey_id, AttributionTouchpoint.timestamp)
+        ).all()
+        if not rows:
+            return {}
+
+        journey_col, platforms, event_types, timestamps, campaign_ids = zip(*rows)
+        packed = journey_columns(platforms, event_types, timestamps, campaign_ids)
+
+        # Rows are grouped by journey, so each journey is one contiguous slice
+        journey_col = np.array(journey_col, dtype=object)
+        starts = np.flatnonzero(np.r_[True, journey_col[1:] != journey_col[:-1]])
+        ends = np.r_[starts[1:], len(journey_col)]
+
+        return {
+            journey_col[start]: {name: values[start:end] for name, values in packed.items()}
+            for start, end in zip(starts, ends)
+        }
 
     def get_recent_journeys(
         self,
@@ -240,6 +508,70 @@ class AttributionDatabaseService:
         tenant_id: Optional[str] = None
     ) -> List[AttributionJourney]:
         """Get recent journeys"""
+        query = self._journeys_query(converted_only, start_date, end_date, tenant_id)
+        return query.order_by(desc(AttributionJourney.created_at)).limit(limit).all()
+
+    def iter_journeys(
+        self,
+        converted_only: bool = False,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        tenant_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        chunk_size: int = JOURNEY_STREAM_CHUNK_SIZE
+    ) -> Iterator[AttributionJourney]:
+        """
+        Stream journeys for large scans such as model training
+
+        Rows are fetched through a server-side cursor chunk_size at a time, so
+        memory stays bounded by the chunk rather than the result set. Iterate
+        the result; wrapping it in list() defeats the point.
+        """
+        query = self._journeys_query(converted_only, start_date, end_date, tenant_id)\
+            .order_by(desc(AttributionJourney.created_at))
+        if limit is not None:
+            query = query.limit(limit)
+
+        return iter(
+            query.execution_options(stream_results=True).yield_per(chunk_size)
+        )
+
+    def iter_customer_journeys(
+        self,
+        converted_only: bool = False,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        tenant_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        min_touchpoints: int = 0,
+        chunk_size: int = JOURNEY_STREAM_CHUNK_SIZE
+    ) -> Iterator[CustomerJourney]:
+        """
+        Stream built CustomerJourney objects, chunk_size journeys at a time
+
+        Each chunk of streamed journey rows is built with build_journeys_from_db,
+        so only one chunk's touchpoints are held in memory at once. Journeys
+        with fewer than min_touchpoints touchpoints are skipped.
+        """
+        db_journeys = self.iter_journeys(
+            converted_only, start_date, end_date, tenant_id, limit, chunk_size
+        )
+        while True:
+            journey_ids = [db_journey.id for db_journey in islice(db_journeys, chunk_size)]
+            if not journey_ids:
+                return
+            for journey in self.build_journeys_from_db(journey_ids):
+                if len(journey.touchpoints) >= min_touchpoints:
+                    yield journey
+
+    def _journeys_query(
+        self,
+        converted_only: bool,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        tenant_id: Optional[str]
+    ):
+        """Base journey query with the common listing filters applied"""
         query = self.db.query(AttributionJourney)
 
         if converted_only:
@@ -254,46 +586,23 @@ class AttributionDatabaseService:
         if tenant_id:
             query = query.filter(AttributionJourney.tenant_id == tenant_id)
 
-        return query.order_by(desc(AttributionJourney.created_at)).limit(limit).all()
+        return query
 
     # ==================== ATTRIBUTION RESULT OPERATIONS ====================
 
     def save_attribution_result(
         self,
         result: AttributionResultModel,
-        journey_id: str
+        journey_id: str,
+        flush_only: bool = True
     ) -> AttributionResult:
         """Save attribution analysis result"""
-        # Serialize platform and campaign attribution
-        platform_attr = [
-            {
-                "platform": pa.platform.value,
-                "credit": pa.credit,
-                "touchpoint_count": pa.touchpoint_count,
-                "revenue_attributed": pa.revenue_attributed,
-                "cost": pa.cost,
-                "roi": pa.roi
-            }
-            for pa in result.platform_attribution
-        ]
-
-        campaign_attr = [
-            {
-                "campaign_id": ca.campaign_id,
-                "campaign_name": ca.campaign_name,
-                "platform": ca.platform.value,
-                "credit": ca.credit,
-                "touchpoint_count": ca.touchpoint_count,
-                "revenue_attributed": ca.revenue_attributed,
-                "cost": ca.cost,
-                "roas": ca.roas,
-                "first_touch_count": ca.first_touch_count,
-                "last_touch_count": ca.last_touch_count,
-                "middle_touch_count": ca.middle_touch_count
-            }
-            for ca in result.campaign_attribution
-        ]
+        # Serialize platform and campaign attribution (enums become their values)
+        platform_attr = [pa.model_dump(mode="json") for pa in result.platform_attribution]
+        campaign_attr = [ca.model_dump(mode="json") for ca in result.campaign_attribution]
 
+        # id and analyzed_at are generated client-side, so the INSERT needs no
+        # RETURNING and nothing has to be re-read after the flush
         db_result = AttributionResult(
             id=str(uuid.uuid4()),
             journey_id=journey_id,
@@ -313,8 +622,7 @@ class AttributionDatabaseService:
         )
 
         self.db.add(db_result)
-        self.db.commit()
-        self.db.refresh(db_result)
+        self._finish_write(flush_only)
 
         logger.info(f"Saved attribution result for journey {journey_id} using {result.model_type.value}")
         return db_result
@@ -340,17 +648,19 @@ class AttributionDatabaseService:
         model_type: str,
         model_state: Dict[str, Any],
         training_journeys_count: int,
-        tenant_id: Optional[str] = None
+        tenant_id: Optional[str] = None,
+        flush_only: bool = True
     ) -> AttributionModelState:
         """Save trained model state"""
-        # Deactivate previous model states
+        # Deactivate previous model states in one UPDATE, without loading or
+        # reconciling the affected rows in the session
         self.db.query(AttributionModelState)\
             .filter(
                 AttributionModelState.model_type == model_type,
                 AttributionModelState.tenant_id == tenant_id,
                 AttributionModelState.is_active == True
             )\
-            .update({"is_active": False})
+            .update({"is_active": False}, synchronize_session=False)
 
         db_state = AttributionModelState(
             id=str(uuid.uuid4()),
@@ -364,8 +674,15 @@ class AttributionDatabaseService:
         )
 
         self.db.add(db_state)
-        self.db.commit()
-        self.db.refresh(db_state)
+
+        # Drop the cached state now for readers on this session, and again
+        # once the new state is committed and visible to every other session
+        key = (model_type, tenant_id)
+        _invalidate_model_state(key)
+        event.listen(
+            self.db, "after_commit", lambda session: _invalidate_model_state(key), once=True
+        )
+        self._finish_write(flush_only)
 
         logger.info(f"Saved model state for {model_type}")
         return db_state
@@ -375,8 +692,21 @@ class AttributionDatabaseService:
         model_type: str,
         tenant_id: Optional[str] = None
     ) -> Optional[AttributionModelState]:
-        """Get active model state"""
-        return self.db.query(AttributionModelState)\
+        """
+        Get active model state
+
+        Served from a short-lived in-process cache, since the active state only
+        changes when a model is retrained. Each call gets its own detached
+        copy, so changes a caller makes never reach other callers.
+        """
+        key = (model_type, tenant_id)
+        with _model_state_cache_lock:
+            cached = _model_state_cache.get(key)
+            generation = _model_state_generation
+        if cached is not None:
+            return _model_state_from_snapshot(cached)
+
+        db_state = self.db.query(AttributionModelState)\
             .filter(
                 AttributionModelState.model_type == model_type,
                 AttributionModelState.tenant_id == tenant_id,
@@ -384,59 +714,94 @@ class AttributionDatabaseService:
                 AttributionModelState.is_trained == True
             )\
             .first()
+        if not db_state:
+            return None
+
+        snapshot = _model_state_snapshot(db_state)
+        with _model_state_cache_lock:
+            if generation == _model_state_generation:
+                _model_state_cache[key] = snapshot
+        return _model_state_from_snapshot(snapshot)
 
     # ==================== HELPER METHODS ====================
 
-    def _touchpoint_db_to_model(self, db_touchpoint: AttributionTouchpoint) -> TouchpointEvent:
-        """Convert database touchpoint to model"""
-        return TouchpointEvent(
-            event_id=db_touchpoint.id,
-            user_id=db_touchpoint.user_id,
-            event_type=db_touchpoint.event_type,
-            platform=Platform(db_touchpoint.platform),
-            timestamp=db_touchpoint.timestamp,
-            campaign_id=db_touchpoint.campaign_id,
-            campaign_name=db_touchpoint.campaign_name,
-            ad_set_id=db_touchpoint.ad_set_id,
-            ad_id=db_touchpoint.ad_id,
-            utm_source=db_touchpoint.utm_source,
-            utm_medium=db_touchpoint.utm_medium,
-            utm_campaign=db_touchpoint.utm_campaign,
-            utm_content=db_touchpoint.utm_content,
-            utm_term=db_touchpoint.utm_term,
-            page_url=db_touchpoint.page_url,
-            referrer_url=db_touchpoint.referrer_url,
-            device_type=db_touchpoint.device_type,
-            browser=db_touchpoint.browser,
-            country=db_touchpoint.country,
-            region=db_touchpoint.region,
-            city=db_touchpoint.city,
-            engagement_score=db_touchpoint.engagement_score,
-            time_spent=db_touchpoint.time_spent,
-            custom_data=db_touchpoint.custom_data
+    def _touchpoint_row(self, touchpoint: TouchpointEvent, journey_id: str) -> Dict[str, Any]:
+        """Map a touchpoint event to AttributionTouchpoint column values"""
+        row = dict(zip(_TOUCHPOINT_COLUMNS, _get_touchpoint_fields(touchpoint)))
+        row["journey_id"] = journey_id
+        event_type = row["event_type"]
+        row["event_type"] = event_type.value if hasattr(event_type, 'value') else event_type
+        row["platform"] = row["platform"].value
+        return row
+
+    def _journey_db_to_model(self, db_journey: AttributionJourney) -> CustomerJourney:
+        """Build a CustomerJourney from a journey row with its events loaded"""
+        touchpoints = [self._touchpoint_db_to_model(tp) for tp in db_journey.touchpoints]
+        conversion = self._conversion_db_to_model(db_journey.conversion) if db_journey.conversion else None
+
+        return CustomerJourney.from_touchpoints(
+            user_id=db_journey.user_id,
+            touchpoints=touchpoints,
+            conversion=conversion,
+            assume_sorted=True
         )
 
+    def _touchpoint_db_to_model(self, db_touchpoint: AttributionTouchpoint) -> TouchpointEvent:
+        """
+        Convert database touchpoint to model
+
+        Rows were validated on the way in, so model_construct skips the
+        per-field validation that dominates bulk rehydration.
+        """
+        fields = dict(zip(_TOUCHPOINT_FIELDS, _get_touchpoint_columns(db_touchpoint)))
+        fields["event_type"] = EventType.from_value(fields["event_type"])
+        fields["platform"] = Platform.from_value(fields["platform"])
+        fields["custom_data"] = fields["custom_data"] or {}
+        return TouchpointEvent.model_construct(**fields)
+
     def _conversion_db_to_model(self, db_conversion: AttributionConversion) -> ConversionEvent:
-        """Convert database conversion to model"""
-        return ConversionEvent(
+        """Convert database conversion to model, skipping validation like touchpoints"""
+        return ConversionEvent.model_construct(
             conversion_id=db_conversion.id,
             user_id=db_conversion.user_id,
             conversion_type=db_conversion.conversion_type,
             timestamp=db_conversion.timestamp,
-            revenue=db_conversion.revenue,
-            currency=db_conversion.currency,
-            quantity=db_conversion.quantity,
+            revenue=db_conversion.revenue or 0.0,
+            currency=db_conversion.currency or "USD",
             attribution_window_days=db_conversion.attribution_window_days,
             order_id=db_conversion.order_id,
-            product_ids=db_conversion.product_ids,
-            product_names=db_conversion.product_names,
-            conversion_page_url=db_conversion.conversion_page_url,
-            device_type=db_conversion.device_type,
-            custom_data=db_conversion.custom_data
+            product_ids=list(db_conversion.product_ids or []),
+            custom_data=db_conversion.custom_data or {}
         )
 
     # ==================== ANALYTICS QUERIES ====================
 
+    def _json_array_elements(self, json_column):
+        """
+        One row per element of a JSON array column, as a table-valued FROM item
+
+        Lets reporting queries group and sum inside the database instead of
+        hydrating every result row and its JSON payload in Python.
+        """
+        dialect = self.db.get_bind().dialect.name
+        elements = getattr(func, _JSON_ARRAY_ELEMENTS[dialect])(json_column)\
+            .table_valued(column("value", JSON))
+        if dialect == "postgresql":
+            # Scalar set-returning functions need an explicit column alias
+            elements = elements.render_derived()
+        return elements
+
+    def _results_in_range(self, query, start_date: datetime, end_date: datetime, tenant_id: Optional[str]):
+        """Restrict an AttributionResult query to a reporting window and tenant"""
+        query = query.filter(
+            AttributionResult.analyzed_at >= start_date,
+            AttributionResult.analyzed_at <= end_date
+        )
+        if tenant_id:
+            query = query.join(AttributionJourney, AttributionJourney.id == AttributionResult.journey_id)\
+                .filter(AttributionJourney.tenant_id == tenant_id)
+        return query
+
     def get_platform_performance(
         self,
         start_date: datetime,
@@ -444,9 +809,32 @@ class AttributionDatabaseService:
         tenant_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get aggregated platform performance"""
-        # This would use SQL aggregation for efficient reporting
-        # Placeholder for now
-        pass
+        elements = self._json_array_elements(AttributionResult.platform_attribution)
+        value = elements.c.value
+        platform = value["platform"].as_string().label("platform")
+
+        query = self.db.query(
+            platform,
+            func.sum(value["credit"].as_float()).label("total_credit"),
+            func.sum(value["touchpoint_count"].as_integer()).label("touchpoint_count"),
+            func.sum(value["revenue_attributed"].as_float()).label("revenue_attributed"),
+            func.sum(value["cost"].as_float()).label("cost"),
+            func.count(func.distinct(AttributionResult.journey_id)).label("journey_count")
+        ).select_from(AttributionResult)\
+            .join(elements, true())
+
+        query = self._results_in_range(query, start_date, end_date, tenant_id)
+        rows = query.group_by(platform)\
+            .order_by(desc("revenue_attributed"))\
+            .all()
+
+        return [
+            {
+                **row._asdict(),
+                "roi": _ratio(row.revenue_attributed, row.cost)
+            }
+            for row in rows
+        ]
 
     def get_campaign_performance(
         self,
@@ -456,5 +844,64 @@ class AttributionDatabaseService:
         tenant_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get aggregated campaign performance"""
-        # This would use SQL aggregation for efficient reporting
-        pass
+        elements = self._json_array_elements(AttributionResult.campaign_attribution)
+        value = elements.c.value
+        campaign_id = value["campaign_id"].as_string().label("campaign_id")
+        campaign_name = value["campaign_name"].as_string().label("campaign_name")
+        campaign_platform = value["platform"].as_string().label("platform")
+
+        query = self.db.query(
+            campaign_id,
+            campaign_name,
+            campaign_platform,
+            func.sum(value["credit"].as_float()).label("total_credit"),
+            func.sum(value["touchpoint_count"].as_integer()).label("touchpoint_count"),
+            func.sum(value["revenue_attributed"].as_float()).label("revenue_attributed"),
+            func.sum(value["cost"].as_float()).label("cost"),
+            func.sum(value["first_touch_count"].as_integer()).label("first_touch_count"),
+            func.sum(value["last_touch_count"].as_integer()).label("last_touch_count"),
+            func.sum(value["middle_touch_count"].as_integer()).label("middle_touch_count"),
+            func.count(func.distinct(AttributionResult.journey_id)).label("journey_count")
+        ).select_from(AttributionResult)\
+            .join(elements, true())
+
+        if platform:
+            query = query.filter(campaign_platform.element == platform)
+
+        query = self._results_in_range(query, start_date, end_date, tenant_id)
+        rows = query.group_by(campaign_id, campaign_name, campaign_platform)\
+            .order_by(desc("revenue_attributed"))\
+            .all()
+
+        return [
+            {**row._asdict(), "roas": _ratio(row.revenue_attributed, row.cost)}
+            for row in rows
+        ]
+
+
+def _invalidate_model_state(key: Tuple[str, Optional[str]]) -> None:
+    """Forget a cached model state and fence off reads already in flight"""
+    global _model_state_generation
+    with _model_state_cache_lock:
+        _model_state_cache.pop(key, None)
+        _model_state_generation += 1
+
+
+def _model_state_snapshot(db_state: AttributionModelState) -> MappingProxyType:
+    """Read-only deep copy of a model state's column values"""
+    return MappingProxyType(copy.deepcopy({
+        attr.key: getattr(db_state, attr.key)
+        for attr in inspect(AttributionModelState).column_attrs
+    }))
+
+
+def _model_state_from_snapshot(snapshot: MappingProxyType) -> AttributionModelState:
+    """Fresh instance bound to no session, with its own copy of the JSON columns"""
+    return AttributionModelState(**copy.deepcopy(dict(snapshot)))
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
+    """Divide aggregated sums, treating a missing or zero denominator as undefined"""
+    if not denominator or numerator is None:
+        return None
+    return numerator / denominator
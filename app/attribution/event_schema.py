@@ -3,10 +3,12 @@ Unified Event Schema for Multi-Platform Attribution
 Tracks customer touchpoints across Meta, Google, LinkedIn, TikTok, etc.
 """
 from enum import Enum
+from functools import cached_property
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from pydantic import BaseModel, Field
-import hashlib
+import numpy as np
+import xxhash
 
 
 class EventType(str, Enum):
@@ -31,6 +33,14 @@ class EventType(str, Enum):
     EMAIL_OPEN = "email_open"
     EMAIL_CLICK = "email_click"
 
+    @classmethod
+    def from_value(cls, value: str) -> "EventType":
+        """Look up a member by value without going through Enum.__call__"""
+        try:
+            return _EVENT_TYPE_BY_VALUE[value]
+        except KeyError:
+            return cls(value)
+
 
 class Platform(str, Enum):
     """Marketing platforms"""
@@ -46,6 +56,22 @@ class Platform(str, Enum):
     DIRECT = "direct"
     REFERRAL = "referral"
 
+    @classmethod
+    def from_value(cls, value: str) -> "Platform":
+        """Look up a member by value without going through Enum.__call__"""
+        try:
+            return _PLATFORM_BY_VALUE[value]
+        except KeyError:
+            return cls(value)
+
+
+# Marks journey ids derived with xxh3 (older rows hold bare MD5 hex digests)
+JOURNEY_ID_PREFIX = "x_"
+
+# Value -> member maps used when rehydrating large batches of stored events
+_EVENT_TYPE_BY_VALUE = {e.value: e for e in EventType}
+_PLATFORM_BY_VALUE = {p.value: p for p in Platform}
+
 
 class TouchpointEvent(BaseModel):
     """
@@ -102,16 +128,15 @@ class TouchpointEvent(BaseModel):
     # Metadata
     custom_data: Dict[str, Any] = Field(default_factory=dict, description="Platform-specific data")
 
-    @property
+    @cached_property
     def attribution_key(self) -> str:
-        """Generate unique key for deduplication"""
-        key_parts = [
-            str(self.user_id or ""),
-            str(self.timestamp.timestamp()),
-            self.event_type.value,
-            self.platform.value
-        ]
-        return hashlib.md5("_".join(key_parts).encode()).hexdigest()
+        """Generate unique key for deduplication (computed once per event)"""
+        # Integer microseconds avoid float repr; the unit separator can't appear
+        # in ids or enum values, so parts never run together
+        ts_us = round(self.timestamp.timestamp() * 1_000_000)
+        return xxhash.xxh3_64_hexdigest(
+            f"{self.user_id or ''}\x1f{ts_us}\x1f{self.event_type.value}\x1f{self.platform.value}"
+        )
 
 
 class ConversionEvent(BaseModel):
@@ -172,23 +197,36 @@ class CustomerJourney(BaseModel):
         cls,
         user_id: str,
         touchpoints: List[TouchpointEvent],
-        conversion: Optional[ConversionEvent] = None
+        conversion: Optional[ConversionEvent] = None,
+        *,
+        assume_sorted: bool = False
     ) -> "CustomerJourney":
-        """Construct journey from list of touchpoints"""
+        """
+        Construct journey from list of touchpoints
+
+        Pass assume_sorted=True when touchpoints are already in chronological
+        order (e.g. loaded with ORDER BY timestamp) to skip the sort.
+        """
         if not touchpoints:
             raise ValueError("Journey must have at least one touchpoint")
 
         # Sort chronologically
-        sorted_touchpoints = sorted(touchpoints, key=lambda t: t.timestamp)
+        if assume_sorted:
+            sorted_touchpoints = touchpoints
+        else:
+            sorted_touchpoints = sorted(touchpoints, key=lambda t: t.timestamp)
 
         first_touch = sorted_touchpoints[0].timestamp
         last_touch = sorted_touchpoints[-1].timestamp
 
-        journey_id = hashlib.md5(
-            f"{user_id}_{first_touch.timestamp()}_{last_touch.timestamp()}".encode()
-        ).hexdigest()
+        # Prefixed so these ids never collide with legacy 32-char MD5 ids
+        journey_id = JOURNEY_ID_PREFIX + xxhash.xxh3_64_hexdigest(
+            f"{user_id}_{first_touch.timestamp()}_{last_touch.timestamp()}"
+        )
 
-        unique_platforms = len(set(t.platform for t in touchpoints))
+        # One pass yields the first-touch-ordered platforms; first/last touch
+        # come free from the sorted ends
+        platforms = list(dict.fromkeys(t.platform for t in sorted_touchpoints))
 
         days_to_convert = None
         conversion_time = None
@@ -196,7 +234,7 @@ class CustomerJourney(BaseModel):
             conversion_time = conversion.timestamp
             days_to_convert = (conversion_time - first_touch).total_seconds() / 86400
 
-        return cls(
+        journey = cls(
             journey_id=journey_id,
             user_id=user_id,
             first_touch=first_touch,
@@ -206,14 +244,23 @@ class CustomerJourney(BaseModel):
             conversion=conversion,
             converted=conversion is not None,
             total_touchpoints=len(touchpoints),
-            unique_platforms=unique_platforms,
+            unique_platforms=len(platforms),
             days_to_convert=days_to_convert
         )
+        return journey
 
     def get_touchpoints_by_platform(self, platform: Platform) -> List[TouchpointEvent]:
         """Get all touchpoints from specific platform"""
         return [t for t in self.touchpoints if t.platform == platform]
 
+    def get_platforms(self) -> List[Platform]:
+        """Get unique platforms in journey, in order of first touch"""
+        return list(dict.fromkeys(t.platform for t in self.touchpoints))
+
+    def get_platform_values(self) -> List[str]:
+        """Unique platform values in first-touch order, as stored in platform_list"""
+        return [p.value for p in self.get_platforms()]
+
     def get_conversion_path(self) -> List[str]:
         """Get simplified conversion path (platforms only)"""
         return [t.platform.value for t in self.touchpoints]
@@ -226,6 +273,35 @@ class CustomerJourney(BaseModel):
                 campaigns.add(t.campaign_id)
         return list(campaigns)
 
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Column-oriented view of the touchpoints
+
+        Attribution models only read a handful of fields per touchpoint, so
+        bulk analysis works on one array per field (see JOURNEY_COLUMNS)
+        rather than walking full TouchpointEvent objects.
+        """
+        return journey_columns(
+            [t.platform.value for t in self.touchpoints],
+            [t.event_type.value for t in self.touchpoints],
+            [t.timestamp for t in self.touchpoints],
+            [t.campaign_id for t in self.touchpoints]
+        )
+
+
+# Keys of the per-journey column arrays used by bulk attribution analysis
+JOURNEY_COLUMNS = ("platforms", "event_types", "timestamps", "campaign_ids")
+
+
+def journey_columns(platforms, event_types, timestamps, campaign_ids) -> Dict[str, np.ndarray]:
+    """Pack per-touchpoint sequences into the JOURNEY_COLUMNS array layout"""
+    return {
+        "platforms": np.array(platforms, dtype=object),
+        "event_types": np.array(event_types, dtype=object),
+        "timestamps": np.array(timestamps, dtype="datetime64[us]"),
+        "campaign_ids": np.array(campaign_ids, dtype=object)
+    }
+
 
 class AttributionWindow(BaseModel):
     """Configuration for attribution window"""
@@ -5,9 +5,15 @@ Uses probabilistic transitions to calculate channel credit
 Based on Markov chain theory - models customer journeys as state transitions
 Answers: "What is the probability of conversion given this path?"
 """
-from typing import List, Dict, Set, Tuple, Optional
-from collections import defaultdict
+from typing import Any, Iterable, List, Dict, Set, Tuple, Optional
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import itemgetter
 import logging
+import math
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
 
 from app.attribution.models import (
     AttributionModel,
@@ -18,6 +24,40 @@ from app.attribution.event_schema import CustomerJourney, Platform
 
 logger = logging.getLogger(__name__)
 
+START_STATE = "START"
+CONVERSION_STATE = "CONVERSION"
+NULL_STATE = "NULL"
+
+# Every state the chain can visit; the two end states sort last so a single
+# comparison tells them apart from START and the platform states
+MARKOV_STATES: Tuple[str, ...] = (
+    START_STATE,
+    *(platform.value for platform in Platform),
+    CONVERSION_STATE,
+    NULL_STATE
+)
+_STATE_TO_ID: Dict[str, int] = {state: i for i, state in enumerate(MARKOV_STATES)}
+START_ID = _STATE_TO_ID[START_STATE]
+CONVERSION_ID = _STATE_TO_ID[CONVERSION_STATE]
+NULL_ID = _STATE_TO_ID[NULL_STATE]
+
+# Platform member -> state ID, so hot paths never go through .value strings.
+# Platform is a str enum, so members hash with str's cached C-level hash;
+# a plain dict probe beats np.searchsorted over platform names, which first
+# has to build a string array from .value of every touchpoint
+PLATFORM_ID: Dict[Platform, int] = {
+    platform: _STATE_TO_ID[platform.value] for platform in Platform
+}
+
+# Placeholder ID matching no state, for "remove nothing"
+NO_STATE_ID = -1
+
+# Probability assumed for transitions and states never seen in training
+UNSEEN_PROBABILITY = 0.1
+
+# Distinct paths whose removal probabilities are memoised per trained model
+PATH_CACHE_SIZE = 65536
+
 
 class MarkovChainAttributionModel(AttributionModel):
     """
@@ -57,8 +97,9 @@ class MarkovChainAttributionModel(AttributionModel):
         """
         self.min_support = min_support
 
-        # Transition probabilities: (from_state, to_state) -> probability
-        self.transitions: Dict[Tuple[str, str], float] = {}
+        # Running transition counts by state ID; the sufficient statistic
+        # every probability is derived from
+        self._counts: csr_matrix = self._empty_counts()
 
         # Transition counts (for learning)
         self.transition_counts: Dict[Tuple[str, str], int] = defaultdict(int)
@@ -66,75 +107,201 @@ class MarkovChainAttributionModel(AttributionModel):
         # State counts
         self.state_counts: Dict[str, int] = defaultdict(int)
 
-        # Conversion probability from each state
-        self.conversion_probs: Dict[str, float] = {}
+        # Conversion probability from each state, indexed by state ID
+        self.conv_prob: Optional[np.ndarray] = None
+
+        # Row-normalised transition matrix indexed by state ID
+        self.P: Optional[csr_matrix] = None
+
+        # Dense log(P) with unseen transitions filled in, for path scoring
+        self._log_transitions: Optional[np.ndarray] = None
+
+        # Path -> removal probabilities, rebuilt whenever the model is retrained
+        self._path_probabilities = lru_cache(maxsize=PATH_CACHE_SIZE)(
+            self._score_path
+        )
+
+        # Journeys the counts were learned from
+        self.journey_count = 0
 
         self.is_trained = False
 
-    def train(self, journeys: List[CustomerJourney]):
+    def train(self, journeys: Iterable[CustomerJourney]):
         """
         Train Markov model on historical journeys
 
         Learns:
         - Transition probabilities between channels
         - Conversion probabilities from each channel
+
+        Journeys are consumed in a single pass, so a generator streaming
+        them from the database works without materialising them all.
         """
-        logger.info(f"Training Markov model on {len(journeys)} journeys")
+        self._counts = self._empty_counts()
+        self._accumulate(journeys)
+        self._finalize()
 
-        # Reset counts
-        self.transition_counts = defaultdict(int)
-        self.state_counts = defaultdict(int)
-        conversion_counts = defaultdict(int)
+        logger.info(f"Trained Markov model on {self.journey_count} journeys")
 
-        for journey in journeys:
-            # Extract state sequence (platform names)
-            states = [t.platform.value for t in journey.touchpoints]
+    def update(self, journeys: Iterable[CustomerJourney]):
+        """
+        Fold new journeys into the model without revisiting old ones
 
-            # Add START state
-            states = ["START"] + states
+        Transition counts are additive, so the cost is proportional to the
+        new journeys only; the result matches training on all journeys seen
+        so far.
+        """
+        seen = self.journey_count
+        self._accumulate(journeys)
+        self._finalize()
 
-            # Add CONVERSION or NULL end state
-            if journey.converted:
-                states.append("CONVERSION")
-            else:
-                states.append("NULL")
+        logger.info(f"Updated Markov model with {self.journey_count - seen} journeys")
 
-            # Count transitions
-            for i in range(len(states) - 1):
-                from_state = states[i]
-                to_state = states[i + 1]
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Compact, JSON-safe snapshot of the model for persistence
 
-                self.transition_counts[(from_state, to_state)] += 1
-                self.state_counts[from_state] += 1
+        Only the non-zero transition counts are stored, as parallel state-ID
+        lists alongside the state names they index; every probability is
+        re-derived from them by from_state.
+        """
+        counts = self._counts.tocoo()
+        return {
+            "states": list(MARKOV_STATES),
+            "min_support": self.min_support,
+            "from_ids": counts.row.tolist(),
+            "to_ids": counts.col.tolist(),
+            "counts": counts.data.astype(np.int64).tolist()
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "MarkovChainAttributionModel":
+        """Rebuild a model from a to_state snapshot"""
+        model = cls(min_support=state["min_support"])
+        if not state["counts"]:
+            return model
+
+        # Map saved IDs through the state names, so snapshots survive
+        # platforms being added to the enum
+        saved_ids = np.array([_STATE_TO_ID[name] for name in state["states"]])
+        num_states = len(MARKOV_STATES)
+        model._counts = coo_matrix(
+            (
+                np.asarray(state["counts"], dtype=float),
+                (saved_ids[state["from_ids"]], saved_ids[state["to_ids"]])
+            ),
+            shape=(num_states, num_states)
+        ).tocsr()
+        model._finalize()
+        return model
+
+    @staticmethod
+    def _empty_counts() -> csr_matrix:
+        num_states = len(MARKOV_STATES)
+        return csr_matrix((num_states, num_states))
+
+    def _accumulate(self, journeys: Iterable[CustomerJourney]):
+        """Add the journeys' transitions to the running count matrix"""
+        # One flat state-ID sequence: START, the journey's platforms, then its
+        # end state, for every journey back to back
+        platform_ids = PLATFORM_ID
+        sequence: List[int] = []
+        for journey in journeys:
+            sequence.append(START_ID)
+            sequence.extend([platform_ids[t.platform] for t in journey.touchpoints])
+            sequence.append(CONVERSION_ID if journey.converted else NULL_ID)
+
+        sequence = np.asarray(sequence, dtype=np.int32)
+        from_ids, to_ids = sequence[:-1], sequence[1:]
+
+        # End states only ever close a journey, so pairs leaving them are the
+        # seams between consecutive journeys rather than real transitions
+        within_journey = from_ids < CONVERSION_ID
+        from_ids, to_ids = from_ids[within_journey], to_ids[within_journey]
+
+        num_states = len(MARKOV_STATES)
+        self._counts = self._counts + coo_matrix(
+            (np.ones(len(from_ids)), (from_ids, to_ids)),
+            shape=(num_states, num_states)
+        ).tocsr()  # duplicate (from, to) pairs are summed here
+
+    def _finalize(self):
+        """Derive every probability from the running count matrix"""
+        counts = self._counts
+        num_states = len(MARKOV_STATES)
+        row_totals = counts.sum(axis=1).A1
+        conversion_totals = counts.getcol(CONVERSION_ID).toarray().ravel()
+
+        inverse_totals = np.divide(
+            1.0, row_totals, out=np.zeros(num_states), where=row_totals > 0
+        )
+        self.P = csr_matrix(counts.multiply(inverse_totals[:, None]))
 
-                # Track conversions from each state
-                if to_state == "CONVERSION":
-                    conversion_counts[from_state] += 1
+        # The state space is bounded by the Platform enum, so a dense table
+        # is tiny and lets a whole path be gathered with one fancy index
+        observed = self.P.tocoo()
+        self._log_transitions = np.full(
+            (num_states, num_states), math.log(UNSEEN_PROBABILITY)
+        )
+        self._log_transitions[observed.row, observed.col] = np.log(observed.data)
 
-        # Calculate transition probabilities
-        for (from_state, to_state), count in self.transition_counts.items():
-            if self.state_counts[from_state] > 0:
-                self.transitions[(from_state, to_state)] = (
-                    count / self.state_counts[from_state]
-                )
+        # Name-keyed views of the counts for callers that report on them
+        self.transition_counts = defaultdict(int)
+        entries = counts.tocoo()
+        for i, j, count in zip(entries.row, entries.col, entries.data):
+            self.transition_counts[(MARKOV_STATES[i], MARKOV_STATES[j])] = int(count)
 
-        # Calculate conversion probabilities from each state
-        for state, total_count in self.state_counts.items():
-            if total_count >= self.min_support:
-                conv_count = conversion_counts.get(state, 0)
-                self.conversion_probs[state] = conv_count / total_count
-            else:
-                # Not enough data - use overall average
-                total_conv = sum(conversion_counts.values())
-                total_all = sum(self.state_counts.values())
-                self.conversion_probs[state] = total_conv / total_all if total_all > 0 else 0
+        self.state_counts = defaultdict(int)
+        for i in np.flatnonzero(row_totals):
+            self.state_counts[MARKOV_STATES[i]] = int(row_totals[i])
+
+        # Every journey leaves START exactly once
+        self.journey_count = int(row_totals[START_ID])
+
+        # Conversion probability from each state; states with too little data
+        # use the overall average, and states never left stay at the default
+        seen = row_totals > 0
+        total_all = row_totals.sum()
+        fallback = conversion_totals.sum() / total_all if total_all > 0 else 0.0
+        self.conv_prob = np.full(num_states, UNSEEN_PROBABILITY)
+        self.conv_prob[seen] = fallback
+        supported = seen & (row_totals >= self.min_support)
+        self.conv_prob[supported] = conversion_totals[supported] / row_totals[supported]
+
+        # Scores memoised against the previous parameters are now stale
+        self._path_probabilities = lru_cache(maxsize=PATH_CACHE_SIZE)(
+            self._score_path
+        )
 
         self.is_trained = True
         logger.info(
-            f"Trained on {len(self.transitions)} transitions, "
+            f"Model has {self.P.nnz} transitions, "
             f"{len(self.state_counts)} states"
         )
 
+    @property
+    def transitions(self) -> Dict[Tuple[str, str], float]:
+        """Transition probabilities keyed by (from_state, to_state) names"""
+        if self.P is None:
+            return {}
+        entries = self.P.tocoo()
+        return {
+            (MARKOV_STATES[i], MARKOV_STATES[j]): probability
+            for i, j, probability in zip(
+                entries.row.tolist(), entries.col.tolist(), entries.data.tolist()
+            )
+        }
+
+    @property
+    def conversion_probs(self) -> Dict[str, float]:
+        """Conversion probability keyed by name for every state seen in training"""
+        if self.conv_prob is None:
+            return {}
+        return {
+            state: float(self.conv_prob[_STATE_TO_ID[state]])
+            for state in self.state_counts
+        }
+
     def calculate_attribution(self, journey: CustomerJourney) -> AttributionResult:
         """
         Calculate Markov attribution for a journey
@@ -151,40 +318,33 @@ class MarkovChainAttributionModel(AttributionModel):
             )
             return self._fallback_linear(journey)
 
-        # Get unique platforms in journey
-        platforms = list(set(t.platform for t in journey.touchpoints))
-
-        # Calculate removal effect for each platform
-        removal_effects = {}
-        baseline_conversion_prob = self._calculate_conversion_probability(
-            journey, remove_platform=None
-        )
-
-        for platform in platforms:
-            # Probability if we remove this platform
-            prob_without = self._calculate_conversion_probability(
-                journey, remove_platform=platform
-            )
+        # Get unique platforms in journey, in first-touch order
+        platforms = list(dict.fromkeys(t.platform for t in journey.touchpoints))
 
-            # Removal effect = baseline - without
-            removal_effect = baseline_conversion_prob - prob_without
-            removal_effects[platform] = max(removal_effect, 0)  # Can't be negative
-
-        # Total removal effect
-        total_removal = sum(removal_effects.values())
-
-        # Calculate credits (normalize removal effects)
-        if total_removal > 0:
-            touchpoint_credits = {}
-            for idx, touchpoint in enumerate(journey.touchpoints):
-                credit = removal_effects[touchpoint.platform] / total_removal
-                touchpoint_credits[idx] = credit
+        if len(platforms) == 1:
+            # Removing the only channel leaves no path at all, so it carries
+            # the whole conversion; no path scoring needed
+            removal_effects = {platforms[0]: 1.0}
+            touchpoint_credits = self._equal_credits(journey)
         else:
-            # Equal distribution if no clear signal
-            touchpoint_credits = {
-                idx: 1.0 / len(journey.touchpoints)
-                for idx in range(len(journey.touchpoints))
-            }
+            removal_effects = self._removal_effects(journey, platforms)
+
+            # Total removal effect
+            total_removal = sum(removal_effects.values())
+
+            # Calculate credits (normalize removal effects); a platform's
+            # share is split evenly over its touchpoints, as in the
+            # single-platform case, so credits sum to 1
+            if total_removal > 0:
+                touch_counts = Counter(t.platform for t in journey.touchpoints)
+                touchpoint_credits = {}
+                for idx, touchpoint in enumerate(journey.touchpoints):
+                    platform = touchpoint.platform
+                    credit = removal_effects[platform] / total_removal / touch_counts[platform]
+                    touchpoint_credits[idx] = credit
+            else:
+                # Equal distribution if no clear signal
+                touchpoint_credits = self._equal_credits(journey)
 
         # Generate platform and campaign attribution
         platform_attribution = self._generate_platform_attribution(
@@ -216,6 +376,33 @@ class MarkovChainAttributionModel(AttributionModel):
             insights=insights
         )
 
+    def _removal_effects(
+        self,
+        journey: CustomerJourney,
+        platforms: List[Platform]
+    ) -> Dict[Platform, float]:
+        """Drop in conversion probability when each platform is removed"""
+        # Full-path and per-platform-removed probabilities, scored in one pass
+        # and shared by every journey that follows the same path
+        conversion_probs = self._path_probabilities(
+            self._path_key(journey.touchpoints)
+        )
+        baseline_conversion_prob = conversion_probs[NO_STATE_ID]
+
+        # Removal effect = baseline - without; it can't be negative
+        return {
+            platform: max(
+                baseline_conversion_prob - conversion_probs[PLATFORM_ID[platform]],
+                0
+            )
+            for platform in platforms
+        }
+
+    @staticmethod
+    def _equal_credits(journey: CustomerJourney) -> Dict[int, float]:
+        n = len(journey.touchpoints)
+        return {idx: 1.0 / n for idx in range(n)}
+
     def _calculate_conversion_probability(
         self,
         journey: CustomerJourney,
@@ -227,36 +414,111 @@ class MarkovChainAttributionModel(AttributionModel):
         If remove_platform is specified, calculate probability
         without that platform's touchpoints
         """
-        # Filter touchpoints
-        if remove_platform:
-            touchpoints = [
-                t for t in journey.touchpoints
-                if t.platform != remove_platform
-            ]
-        else:
-            touchpoints = journey.touchpoints
+        conversion_probs = self._path_probabilities(
+            self._path_key(journey.touchpoints)
+        )
+        baseline = conversion_probs[NO_STATE_ID]
+        if not remove_platform:
+            return baseline
+        # Removing a platform that is not on the path changes nothing
+        return conversion_probs.get(PLATFORM_ID[remove_platform], baseline)
+
+    @staticmethod
+    def _path_key(touchpoints: List) -> Tuple[int, ...]:
+        """Platform state IDs of a journey's touchpoints, in order"""
+        platform_ids = PLATFORM_ID
+        return tuple([platform_ids[t.platform] for t in touchpoints])
+
+    def _score_path(self, path: Tuple[int, ...]) -> Dict[int, float]:
+        """
+        Conversion probability of a path, intact and without each platform
+
+        Keyed by the removed platform's state ID, with NO_STATE_ID for the
+        intact path. Called through the per-model path cache, so the
+        returned dict is shared and must not be mutated.
+        """
+        removed = [NO_STATE_ID, *dict.fromkeys(path)]
+        probabilities = self._conversion_probabilities(
+            np.array(path, dtype=np.intp), np.array(removed, dtype=np.intp)
+        )
+        return dict(zip(removed, probabilities.tolist()))
 
-        if not touchpoints:
-            return 0.0
+    def _conversion_probabilities(
+        self,
+        path: np.ndarray,
+        removed: np.ndarray
+    ) -> np.ndarray:
+        """
+        Conversion probability of a path once per entry of removed
 
-        # Build state sequence
-        states = ["START"] + [t.platform.value for t in touchpoints]
+        Row r drops every touchpoint whose state is removed[r] (NO_STATE_ID
+        drops nothing) and links each kept state to the previous kept one,
+        all as array operations over an R x L grid.
+        """
+        states = np.concatenate(([START_ID], path))
+        keep = states[None, :] != removed[:, None]  # START is never removed
+
+        # Running max of kept positions = the predecessor each kept step links to
+        positions = np.where(keep, np.arange(len(states)), 0)
+        previous = np.maximum.accumulate(positions, axis=1)
+
+        # Sum log-probabilities of every kept step instead of chaining
+        # products, and only leave log space once at the end
+        step_logs = self._log_transitions[states[previous[:, :-1]], states[1:]]
+        log_probability = np.where(keep[:, 1:], step_logs, 0.0).sum(axis=1)
+
+        # Conversion probability from the last kept state
+        last = previous[:, -1]
+        conv_prob = self.conv_prob[states[last]]
+        with np.errstate(divide="ignore"):
+            log_probability += np.log(conv_prob)
+
+        probability = np.exp(log_probability)
+        probability[last == 0] = 0.0  # nothing left after START
+        return probability
 
-        # Calculate probability of this path
-        probability = 1.0
-        for i in range(len(states) - 1):
-            from_state = states[i]
-            to_state = states[i + 1]
+    def conversion_probabilities(self, journeys: List[CustomerJourney]) -> np.ndarray:
+        """
+        Probability of each journey's full path converting
 
-            # Get transition probability
-            transition_prob = self.transitions.get((from_state, to_state), 0.1)
-            probability *= transition_prob
+        Bulk counterpart of _calculate_conversion_probability: every path is
+        laid end to end in one state-ID sequence, scored with one gather,
+        and summed back per journey.
+        """
+        if not self.is_trained:
+            raise ValueError("Markov model must be trained before scoring journeys")
 
-        # Multiply by conversion probability from last state
-        last_state = states[-1]
-        conv_prob = self.conversion_probs.get(last_state, 0.1)
-        probability *= conv_prob
+        platform_ids = PLATFORM_ID
+        sequence: List[int] = []
+        for journey in journeys:
+            sequence.append(START_ID)
+            sequence.extend([platform_ids[t.platform] for t in journey.touchpoints])
+        sequence = np.asarray(sequence, dtype=np.intp)
+
+        # Position of each journey's START, and which journey each step is in
+        lengths = np.fromiter(
+            (len(journey.touchpoints) for journey in journeys),
+            dtype=np.intp,
+            count=len(journeys)
+        )
+        starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        ends = starts + lengths
+
+        # START is never entered mid-journey, so steps into it are the seams
+        from_ids, to_ids = sequence[:-1], sequence[1:]
+        within_journey = to_ids != START_ID
+        journey_of_step = np.repeat(np.arange(len(journeys)), lengths)
+        log_probability = np.bincount(
+            journey_of_step,
+            weights=self._log_transitions[from_ids[within_journey], to_ids[within_journey]],
+            minlength=len(journeys)
+        )
+
+        with np.errstate(divide="ignore"):
+            log_probability += np.log(self.conv_prob[sequence[ends]])
 
+        probability = np.exp(log_probability)
+        probability[lengths == 0] = 0.0
         return probability
 
     def _fallback_linear(self, journey: CustomerJourney) -> AttributionResult:
@@ -316,20 +578,17 @@ class MarkovChainAttributionModel(AttributionModel):
         """Generate human-readable insights"""
         insights = []
 
-        # Identify most critical platform
+        # Identify most critical platform; removal_effects follows first-touch
+        # order and max() keeps the first maximum, so ties always go to the
+        # platform seen earliest
         if removal_effects:
-            max_removal = max(removal_effects.values())
-            critical_platforms = [
-                p for p, effect in removal_effects.items()
-                if effect == max_removal
-            ]
-
-            if critical_platforms:
-                platform_name = critical_platforms[0].value.title()
-                insights.append(
-                    f"{platform_name} was most critical - conversion probability "
-                    f"drops {max_removal*100:.1f}% without it"
-                )
+            critical_platform, max_removal = max(
+                removal_effects.items(), key=itemgetter(1)
+            )
+            insights.append(
+                f"{critical_platform.value.title()} was most critical - conversion "
+                f"probability drops {max_removal*100:.1f}% without it"
+            )
 
         # Multi-channel synergy
         if len(removal_effects) > 1:
@@ -362,18 +621,16 @@ class MarkovChainAttributionModel(AttributionModel):
             return []
 
         # This would require tracking complete paths during training
-        # Simplified version: return top individual transitions to conversion
-
-        conversion_transitions = [
-            ((from_state, to_state), prob)
-            for (from_state, to_state), prob in self.transitions.items()
-            if to_state == "CONVERSION"
-        ]
+        # Simplified version: return top individual transitions to conversion,
+        # read straight off the CONVERSION column of the transition matrix
+        to_conversion = self.P.getcol(CONVERSION_ID).toarray().ravel()
+        from_ids = np.flatnonzero(to_conversion)
 
-        # Sort by probability
-        conversion_transitions.sort(key=lambda x: x[1], reverse=True)
+        # Stable sort keeps ties in state order
+        order = np.argsort(-to_conversion[from_ids], kind="stable")[:n]
+        top_ids = from_ids[order]
 
         return [
-            ([from_state], prob)
-            for (from_state, _), prob in conversion_transitions[:n]
+            ([MARKOV_STATES[state_id]], prob)
+            for state_id, prob in zip(top_ids.tolist(), to_conversion[top_ids].tolist())
         ]
@@ -8,13 +8,16 @@ from app.attribution.platform_integrations.meta_conversions import (
     MetaUserData,
     MetaCustomData,
     MetaConversionEvent,
-    get_meta_client
+    MetaCircuitOpenError,
+    get_meta_client,
+    close_meta_client
 )
 from app.attribution.platform_integrations.google_analytics import (
     GA4MeasurementProtocolClient,
     GA4Event,
     GA4UserProperties,
-    get_ga4_client
+    get_ga4_client,
+    close_ga4_client
 )
 
 __all__ = [
@@ -23,10 +26,13 @@ __all__ = [
     "MetaUserData",
     "MetaCustomData",
     "MetaConversionEvent",
+    "MetaCircuitOpenError",
     "get_meta_client",
+    "close_meta_client",
     # Google Analytics 4
     "GA4MeasurementProtocolClient",
     "GA4Event",
     "GA4UserProperties",
     "get_ga4_client",
+    "close_ga4_client",
 ]
@@ -5,21 +5,51 @@ Server-side event tracking for Google Analytics 4
 Documentation: https://developers.google.com/analytics/devguides/collection/protocol/ga4
 """
 import os
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Awaitable, Callable, Optional, Dict, Any, List, Set, Tuple
 from datetime import datetime
 import httpx
+import orjson
 from pydantic import BaseModel, Field
 import uuid
 
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Connection pool for the shared HTTP client; keep-alive avoids a TLS
+# handshake per event
+GA4_TIMEOUT_SECONDS = 10.0
+GA4_CONNECTION_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+
+# Payloads are encoded with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Failures of either transport that mean the request did not complete
+TRANSPORT_ERRORS: Tuple[type, ...] = (httpx.HTTPError,)
+if AIOHTTP_AVAILABLE:
+    TRANSPORT_ERRORS += (aiohttp.ClientError, asyncio.TimeoutError)
+
+# Measurement Protocol accepts at most 25 events per request; buffered events
+# wait at most this long for others to share their request
+GA4_MAX_EVENTS_PER_REQUEST = 25
+GA4_FLUSH_INTERVAL_SECONDS = 0.25
+
 
 class GA4Event(BaseModel):
     """Google Analytics 4 event"""
     name: str = Field(..., description="Event name (purchase, lead, page_view, etc.)")
     params: Dict[str, Any] = Field(default_factory=dict, description="Event parameters")
 
+    def to_payload(self) -> Dict[str, Any]:
+        """Wire format of the event, built directly rather than via model_dump"""
+        return {"name": self.name, "params": self.params}
+
 
 class GA4UserProperties(BaseModel):
     """User properties for GA4"""
@@ -28,6 +58,68 @@ class GA4UserProperties(BaseModel):
     engagement_time_msec: Optional[int] = None  # Engagement time in milliseconds
 
 
+class _EventBuffer:
+    """
+    Coalesces events per (client_id, user_id) into shared requests
+
+    A bucket is sent as soon as it holds a full request's worth of events;
+    anything else goes out when the flush timer armed by the first buffered
+    event fires.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, List[GA4Event], Optional[str]], Awaitable[bool]],
+        max_events: int = GA4_MAX_EVENTS_PER_REQUEST,
+        flush_interval: float = GA4_FLUSH_INTERVAL_SECONDS
+    ):
+        self._send = send
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self._buckets: Dict[Tuple[str, Optional[str]], List[GA4Event]] = {}
+        self._flush_timer: Optional[asyncio.Task] = None
+        # Strong references keep in-flight sends from being garbage collected
+        self._in_flight: Set[asyncio.Task] = set()
+
+    def add(self, client_id: str, user_id: Optional[str], event: GA4Event):
+        """Buffer an event, sending its bucket right away once it is full"""
+        key = (client_id, user_id)
+        bucket = self._buckets.setdefault(key, [])
+        bucket.append(event)
+
+        if len(bucket) >= self.max_events:
+            del self._buckets[key]
+            self._dispatch(key, bucket)
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_after_interval())
+
+    async def flush(self):
+        """Send every buffered event and wait for all sends to finish"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._dispatch_all()
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _flush_after_interval(self):
+        await asyncio.sleep(self.flush_interval)
+        self._flush_timer = None
+        self._dispatch_all()
+
+    def _dispatch_all(self):
+        buckets, self._buckets = self._buckets, {}
+        for key, events in buckets.items():
+            self._dispatch(key, events)
+
+    def _dispatch(self, key: Tuple[str, Optional[str]], events: List[GA4Event]):
+        client_id, user_id = key
+        task = asyncio.create_task(self._send(client_id, events, user_id))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+
 class GA4MeasurementProtocolClient:
     """
     Client for Google Analytics 4 Measurement Protocol
@@ -37,7 +129,8 @@ class GA4MeasurementProtocolClient:
     def __init__(
         self,
         measurement_id: Optional[str] = None,
-        api_secret: Optional[str] = None
+        api_secret: Optional[str] = None,
+        use_aiohttp: bool = AIOHTTP_AVAILABLE
     ):
         """
         Initialize GA4 Measurement Protocol client
@@ -45,12 +138,22 @@ class GA4MeasurementProtocolClient:
         Args:
             measurement_id: GA4 Measurement ID (G-XXXXXXXXXX)
             api_secret: GA4 Measurement Protocol API Secret
+            use_aiohttp: Send over aiohttp (faster under high volume) rather
+                than httpx; defaults to aiohttp when it is installed
         """
         self.measurement_id = measurement_id or os.getenv('GA4_MEASUREMENT_ID')
         self.api_secret = api_secret or os.getenv('GA4_API_SECRET')
 
         self.base_url = "https://www.google-analytics.com"
 
+        # Created on first use and reused for every request
+        self.use_aiohttp = use_aiohttp and AIOHTTP_AVAILABLE
+        self._client: Optional[httpx.AsyncClient] = None
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+        # Helper events sent with buffer=True are coalesced into shared requests
+        self._buffer = _EventBuffer(self._send_buffered)
+
         if not self.measurement_id:
             logger.warning("GA4_MEASUREMENT_ID not configured")
         if not self.api_secret:
@@ -61,6 +164,60 @@ class GA4MeasurementProtocolClient:
         """Check if API is properly configured"""
         return bool(self.measurement_id and self.api_secret)
 
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=GA4_TIMEOUT_SECONDS,
+                limits=GA4_CONNECTION_LIMITS
+            )
+        return self._client
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """Get the shared aiohttp session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                timeout=aiohttp.ClientTimeout(total=GA4_TIMEOUT_SECONDS),
+                connector=aiohttp.TCPConnector(limit=GA4_CONNECTION_LIMITS.max_connections)
+            )
+        return self._session
+
+    async def _post(
+        self,
+        path: str,
+        params: Dict[str, str],
+        payload: Dict[str, Any]
+    ) -> Tuple[int, bytes]:
+        """POST an orjson-encoded payload; returns (status, body)"""
+        body = orjson.dumps(payload)
+
+        if self.use_aiohttp:
+            async with self._get_session().post(
+                path, params=params, data=body, headers=JSON_HEADERS
+            ) as response:
+                return response.status, await response.read()
+
+        response = await self._get_client().post(
+            path, params=params, content=body, headers=JSON_HEADERS
+        )
+        return response.status_code, response.content
+
+    async def flush(self):
+        """Send every buffered helper event and wait for the requests"""
+        await self._buffer.flush()
+
+    async def aclose(self):
+        """Flush buffered events, then close the shared HTTP clients"""
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def send_event(
         self,
         client_id: str,
@@ -86,7 +243,7 @@ class GA4MeasurementProtocolClient:
             logger.error("GA4 Measurement Protocol not configured")
             return False
 
-        url = f"{self.base_url}/mp/collect"
+        url = "/mp/collect"
         params = {
             "measurement_id": self.measurement_id,
             "api_secret": self.api_secret
@@ -95,7 +252,7 @@ class GA4MeasurementProtocolClient:
         # Build payload
         payload = {
             "client_id": client_id,
-            "events": [event.dict() for event in events]
+            "events": [event.to_payload() for event in events]
         }
 
         if user_id:
@@ -108,28 +265,57 @@ class GA4MeasurementProtocolClient:
             payload["timestamp_micros"] = timestamp_micros
 
         # Send request
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    params=params,
-                    json=payload,
-                    timeout=10.0
-                )
-
-                # GA4 Measurement Protocol returns 2xx even with validation errors
-                # Use debug endpoint to check for errors
-                if response.status_code >= 400:
-                    logger.error(f"GA4 error: {response.status_code} - {response.text}")
-                    return False
-
-                logger.info(f"GA4 events sent: {[e.name for e in events]} (client: {client_id})")
-                return True
-
-            except httpx.HTTPError as e:
-                logger.error(f"GA4 request error: {e}")
+        try:
+            status, body = await self._post(url, params, payload)
+
+            # GA4 Measurement Protocol returns 2xx even with validation errors
+            # Use debug endpoint to check for errors
+            if status >= 400:
+                logger.error(f"GA4 error: {status} - {body.decode(errors='replace')}")
                 return False
 
+            logger.info(f"GA4 events sent: {[e.name for e in events]} (client: {client_id})")
+            return True
+
+        except TRANSPORT_ERRORS as e:
+            logger.error(f"GA4 request error: {e}")
+            return False
+
+    async def _send_buffered(
+        self,
+        client_id: str,
+        events: List[GA4Event],
+        user_id: Optional[str]
+    ) -> bool:
+        return await self.send_event(client_id=client_id, events=events, user_id=user_id)
+
+    async def _submit(
+        self,
+        client_id: str,
+        user_id: Optional[str],
+        event: GA4Event,
+        buffer: bool
+    ) -> bool:
+        """
+        Send one helper event now, or buffer it to share a request
+
+        A buffered event's delivery is only logged; True means it was
+        accepted into the buffer, not that GA4 received it.
+        """
+        if not buffer:
+            return await self.send_event(
+                client_id=client_id,
+                events=[event],
+                user_id=user_id
+            )
+
+        if not self.is_configured:
+            logger.error("GA4 Measurement Protocol not configured")
+            return False
+
+        self._buffer.add(client_id, user_id, event)
+        return True
+
     async def validate_event(
         self,
         client_id: str,
@@ -150,7 +336,7 @@ class GA4MeasurementProtocolClient:
         if not self.is_configured:
             return {"error": "GA4 not configured"}
 
-        url = f"{self.base_url}/debug/mp/collect"
+        url = "/debug/mp/collect"
         params = {
             "measurement_id": self.measurement_id,
             "api_secret": self.api_secret
@@ -158,25 +344,19 @@ class GA4MeasurementProtocolClient:
 
         payload = {
             "client_id": client_id,
-            "events": [event.dict() for event in events]
+            "events": [event.to_payload() for event in events]
         }
 
         if user_id:
             payload["user_id"] = user_id
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    params=params,
-                    json=payload,
-                    timeout=10.0
-                )
-                return response.json()
+        try:
+            _, body = await self._post(url, params, payload)
+            return orjson.loads(body)
 
-            except Exception as e:
-                logger.error(f"GA4 validation error: {e}")
-                return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"GA4 validation error: {e}")
+            return {"error": str(e)}
 
     async def send_purchase(
         self,
@@ -188,7 +368,8 @@ class GA4MeasurementProtocolClient:
         items: Optional[List[Dict[str, Any]]] = None,
         coupon: Optional[str] = None,
         shipping: Optional[float] = None,
-        tax: Optional[float] = None
+        tax: Optional[float] = None,
+        buffer: bool = False
     ) -> bool:
         """
         Send purchase event to GA4
@@ -203,9 +384,12 @@ class GA4MeasurementProtocolClient:
             coupon: Coupon code used
             shipping: Shipping cost
             tax: Tax amount
+            buffer: Buffer the event to share a request with others instead
+                of sending it now
 
         Returns:
-            True if successful
+            True if successful, False otherwise; with buffer=True, True once
+            the event is buffered (delivery failures are only logged)
         """
         params = {
             "transaction_id": transaction_id,
@@ -224,20 +408,17 @@ class GA4MeasurementProtocolClient:
 
         event = GA4Event(name="purchase", params=params)
 
-        return await self.send_event(
-            client_id=client_id,
-            events=[event],
-            user_id=user_id
-        )
+        return await self._submit(client_id, user_id, event, buffer)
 
     async def send_lead(
         self,
         client_id: str,
         user_id: Optional[str],
         value: Optional[float] = None,
-        currency: str = "USD"
+        currency: str = "USD",
+        buffer: bool = False
     ) -> bool:
-        """Send lead generation event to GA4"""
+        """Send lead generation event to GA4; returns as send_purchase does"""
         params = {}
         if value:
             params["value"] = value
@@ -245,11 +426,7 @@ class GA4MeasurementProtocolClient:
 
         event = GA4Event(name="generate_lead", params=params)
 
-        return await self.send_event(
-            client_id=client_id,
-            events=[event],
-            user_id=user_id
-        )
+        return await self._submit(client_id, user_id, event, buffer)
 
     async def send_page_view(
         self,
@@ -257,9 +434,10 @@ class GA4MeasurementProtocolClient:
         user_id: Optional[str],
         page_location: str,
         page_title: Optional[str] = None,
-        page_referrer: Optional[str] = None
+        page_referrer: Optional[str] = None,
+        buffer: bool = False
     ) -> bool:
-        """Send page view event to GA4"""
+        """Send page view event to GA4; returns as send_purchase does"""
         params = {
             "page_location": page_location
         }
@@ -271,11 +449,7 @@ class GA4MeasurementProtocolClient:
 
         event = GA4Event(name="page_view", params=params)
 
-        return await self.send_event(
-            client_id=client_id,
-            events=[event],
-            user_id=user_id
-        )
+        return await self._submit(client_id, user_id, event, buffer)
 
     async def send_add_to_cart(
         self,
@@ -283,9 +457,10 @@ class GA4MeasurementProtocolClient:
         user_id: Optional[str],
         items: List[Dict[str, Any]],
         value: Optional[float] = None,
-        currency: str = "USD"
+        currency: str = "USD",
+        buffer: bool = False
     ) -> bool:
-        """Send add_to_cart event to GA4"""
+        """Send add_to_cart event to GA4; returns as send_purchase does"""
         params = {
             "items": items
         }
@@ -296,11 +471,7 @@ class GA4MeasurementProtocolClient:
 
         event = GA4Event(name="add_to_cart", params=params)
 
-        return await self.send_event(
-            client_id=client_id,
-            events=[event],
-            user_id=user_id
-        )
+        return await self._submit(client_id, user_id, event, buffer)
 
     async def test_connection(self) -> bool:
         """Test if GA4 Measurement Protocol is working"""
@@ -341,3 +512,9 @@ def get_ga4_client() -> GA4MeasurementProtocolClient:
     if _ga4_client is None:
         _ga4_client = GA4MeasurementProtocolClient()
     return _ga4_client
+
+
+async def close_ga4_client():
+    """Close the global GA4 client's connections, if it was ever created"""
+    if _ga4_client is not None:
+        await _ga4_client.aclose()
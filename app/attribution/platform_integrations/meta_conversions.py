@@ -5,19 +5,169 @@ Server-side event tracking for Meta (Facebook/Instagram) ads
 Documentation: https://developers.facebook.com/docs/marketing-api/conversions-api
 """
 import os
+import asyncio
 import hashlib
+import random
 import time
 import logging
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from functools import cached_property, lru_cache
+from typing import Awaitable, Callable, ClassVar, Optional, Dict, Any, List, Tuple
 import httpx
+import orjson
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
+# The /events endpoint takes up to 1000 events per request; a queued event
+# waits at most this long for others to share its request
+META_MAX_EVENTS_PER_REQUEST = 1000
+META_FLUSH_INTERVAL_SECONDS = 0.05
+
+# Connection pool for the shared HTTP/2 client; one multiplexed connection
+# carries concurrent requests without a handshake each. Idle connections are
+# kept for minutes rather than httpx's 5s default so quiet spells between
+# event bursts don't cost a fresh DNS lookup, TCP connect and TLS handshake
+META_TIMEOUT_SECONDS = 10.0
+META_KEEPALIVE_EXPIRY_SECONDS = 300.0
+META_CONNECTION_LIMITS = httpx.Limits(
+    max_keepalive_connections=32,
+    max_connections=128,
+    keepalive_expiry=META_KEEPALIVE_EXPIRY_SECONDS
+)
+
+# Payloads are encoded with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Transient failures (transport errors, 429, 5xx) are retried with jittered
+# exponential backoff; after enough failed requests in a row the circuit
+# opens and requests fail fast until the reset timeout has passed
+META_MAX_ATTEMPTS = 3
+META_RETRY_INITIAL_SECONDS = 0.1
+META_RETRY_MAX_SECONDS = 2.0
+META_BREAKER_FAIL_MAX = 20
+META_BREAKER_RESET_SECONDS = 30.0
+
+# str.translate table deleting every non-digit in Latin-1; phones are
+# almost always ASCII, so this one C-level pass covers nearly every event
+_PHONE_NON_DIGITS = str.maketrans(
+    '', '', ''.join(chr(c) for c in range(256) if not chr(c).isdigit())
+)
+
+
+@lru_cache(maxsize=100_000)
+def _sha256_hex(value: str) -> str:
+    """
+    SHA256 hash for PII
+
+    Memoised on the normalised value: the same customer's email, phone and
+    name recur across the events of a session, so most calls skip hashing.
+    """
+    # digest().hex() skips hexdigest()'s intermediate formatting; same output
+    return hashlib.sha256(value.encode()).digest().hex()
+
+
+class _CachedPayloadModel(BaseModel):
+    """Model whose Meta payload is a cached_property dropped on any change"""
+    _payload_attr: ClassVar[str]
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        # Any field change makes the cached payload stale
+        self.__dict__.pop(self._payload_attr, None)
+
+    def model_copy(self, *args, **kwargs):
+        copy = super().model_copy(*args, **kwargs)
+        copy.__dict__.pop(self._payload_attr, None)
+        return copy
+
+
+class MetaCircuitOpenError(httpx.HTTPError):
+    """Raised without a request while Meta is failing consistently"""
+
+
+def _is_transient(error: httpx.HTTPError) -> bool:
+    """Whether a failed request is worth retrying"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def _is_rejection(error: Exception) -> bool:
+    """
+    Whether Meta refused a request over its content
 
-class MetaUserData(BaseModel):
+    A 4xx other than auth failures and rate limiting means some event in the
+    request is invalid; resending the same request cannot succeed, but its
+    other events can on their own.
+    """
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status not in (401, 403, 429)
+
+
+def _event_result(result: Dict[str, Any], batch_size: int) -> Dict[str, Any]:
+    """
+    One submitter's view of its batch's response
+
+    When Meta took the whole batch, each event was received, so its
+    submitter sees events_received 1 rather than the batch count. A
+    partially received batch can't be split per event, so the response is
+    passed on as is.
+    """
+    event_result = dict(result)
+    if result.get("events_received") == batch_size:
+        event_result["events_received"] = 1
+    return event_result
+
+
+class _CircuitBreaker:
+    """
+    Counts consecutive failed requests and fails fast once there are too many
+
+    While open, check() raises MetaCircuitOpenError. After reset_timeout the
+    next request is let through again; one more failure reopens the circuit
+    and a success closes it.
+    """
+
+    def __init__(
+        self,
+        fail_max: int = META_BREAKER_FAIL_MAX,
+        reset_timeout: float = META_BREAKER_RESET_SECONDS
+    ):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return (
+            self._opened_at is not None
+            and time.monotonic() - self._opened_at < self.reset_timeout
+        )
+
+    def check(self):
+        if self.is_open:
+            raise MetaCircuitOpenError(
+                f"Meta Conversions API circuit open after {self._failures} failed requests"
+            )
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self._failures >= self.fail_max:
+            self._opened_at = time.monotonic()
+
+
+class MetaUserData(_CachedPayloadModel):
     """User data for Meta Conversions API (hashed for privacy)"""
+    _payload_attr: ClassVar[str] = "meta_payload"
+
     email: Optional[str] = None  # Will be hashed
     phone: Optional[str] = None  # Will be hashed
     first_name: Optional[str] = None  # Will be hashed
@@ -34,29 +184,42 @@ class MetaUserData(BaseModel):
 
     def to_meta_format(self) -> Dict[str, str]:
         """Convert to Meta Conversions API format with hashing"""
+        return dict(self.meta_payload)
+
+    @cached_property
+    def meta_payload(self) -> Dict[str, str]:
+        """
+        Meta format of this user, normalised and hashed once per instance
+
+        The same MetaUserData usually rides along on every event of a
+        session; later events reuse this dict, so it must not be mutated.
+        """
         data = {}
 
         # Hash PII fields
         if self.email:
-            data['em'] = self._hash(self.email.lower().strip())
+            data['em'] = _sha256_hex(self.email.lower().strip())
         if self.phone:
             # Remove all non-digits
-            clean_phone = ''.join(filter(str.isdigit, self.phone))
-            data['ph'] = self._hash(clean_phone)
+            if self.phone.isascii():
+                clean_phone = self.phone.translate(_PHONE_NON_DIGITS)
+            else:
+                clean_phone = ''.join(filter(str.isdigit, self.phone))
+            data['ph'] = _sha256_hex(clean_phone)
         if self.first_name:
-            data['fn'] = self._hash(self.first_name.lower().strip())
+            data['fn'] = _sha256_hex(self.first_name.lower().strip())
         if self.last_name:
-            data['ln'] = self._hash(self.last_name.lower().strip())
+            data['ln'] = _sha256_hex(self.last_name.lower().strip())
         if self.city:
-            data['ct'] = self._hash(self.city.lower().strip())
+            data['ct'] = _sha256_hex(self.city.lower().strip())
         if self.state:
-            data['st'] = self._hash(self.state.lower().strip())
+            data['st'] = _sha256_hex(self.state.lower().strip())
         if self.zip_code:
-            data['zp'] = self._hash(self.zip_code.strip())
+            data['zp'] = _sha256_hex(self.zip_code.strip())
         if self.country:
-            data['country'] = self._hash(self.country.lower().strip())
+            data['country'] = _sha256_hex(self.country.lower().strip())
         if self.external_id:
-            data['external_id'] = self._hash(str(self.external_id))
+            data['external_id'] = _sha256_hex(str(self.external_id))
 
         # Non-hashed fields
         if self.client_ip_address:
@@ -70,14 +233,11 @@ class MetaUserData(BaseModel):
 
         return data
 
-    @staticmethod
-    def _hash(value: str) -> str:
-        """SHA256 hash for PII"""
-        return hashlib.sha256(value.encode('utf-8')).hexdigest()
 
-
-class MetaCustomData(BaseModel):
+class MetaCustomData(_CachedPayloadModel):
     """Custom data for the conversion event"""
+    _payload_attr: ClassVar[str] = "meta_dict"
+
     value: Optional[float] = None  # Revenue
     currency: Optional[str] = "USD"
     content_name: Optional[str] = None  # Product name
@@ -90,6 +250,16 @@ class MetaCustomData(BaseModel):
     search_string: Optional[str] = None  # Search query if applicable
     status: Optional[str] = None  # Order status
 
+    @cached_property
+    def meta_dict(self) -> Dict[str, Any]:
+        """
+        Set fields of this custom data, dumped once per instance
+
+        Shared by every request the event goes out in, including retries;
+        must not be mutated.
+        """
+        return self.model_dump(exclude_none=True)
+
 
 class MetaConversionEvent(BaseModel):
     """Complete conversion event for Meta"""
@@ -103,6 +273,120 @@ class MetaConversionEvent(BaseModel):
     opt_out: bool = False  # User opted out of tracking
 
 
+def _unix_seconds() -> int:
+    """Current Unix time in whole seconds, without a float round trip"""
+    return time.time_ns() // 1_000_000_000
+
+
+class _EventQueue:
+    """
+    Coalesces concurrently submitted events into shared /events requests
+
+    Each submitter waits on a future that resolves with its own copy of the
+    response of the request its event went out in, with events_received
+    counting just that event (see _event_result); fbtrace_id and messages
+    are still those of the shared request. A batch is sent once it is full
+    or the flush interval after its first event has passed.
+
+    When Meta rejects a batch (see _is_rejection) it is split in half and
+    each half resent, down to single events, so only the submitters of the
+    invalid events get the error.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List["MetaConversionEvent"]], Awaitable[Dict[str, Any]]],
+        max_events: int = META_MAX_EVENTS_PER_REQUEST,
+        flush_interval: float = META_FLUSH_INTERVAL_SECONDS
+    ):
+        self._send_batch = send_batch
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def submit(self, event: "MetaConversionEvent") -> Dict[str, Any]:
+        """Queue an event and wait for the response of its batch"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((event, future))
+        return await future
+
+    async def flush(self):
+        """Wait until every event submitted so far has been sent"""
+        if self._queue is not None and self._flusher is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        """Send everything still queued, then stop the flusher task"""
+        await self.flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+    async def _flush_forever(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send(self, batch: List[Tuple["MetaConversionEvent", asyncio.Future]]):
+        """Send a batch and resolve its futures, bisecting it if Meta rejects it"""
+        try:
+            result = await self._send_batch([event for event, _ in batch])
+        except Exception as e:
+            if len(batch) > 1 and _is_rejection(e):
+                middle = len(batch) // 2
+                logger.warning(
+                    "Meta rejected a batch of %d events (%s), resending as %d + %d",
+                    len(batch), e, middle, len(batch) - middle
+                )
+                await self._send(batch[:middle])
+                await self._send(batch[middle:])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(_event_result(result, len(batch)))
+
+    async def _next_batch(self) -> List[Tuple["MetaConversionEvent", asyncio.Future]]:
+        """Block for the first event, then collect until full or the interval ends"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+
+        while len(batch) < self.max_events:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+
+            getter = asyncio.ensure_future(self._queue.get())
+            await asyncio.wait({getter}, timeout=remaining)
+            if getter.cancel():
+                break
+            # cancel() fails only once the get has completed
+            batch.append(getter.result())
+
+        return batch
+
+
 class MetaConversionsAPIClient:
     """
     Client for Meta Conversions API
@@ -129,6 +413,15 @@ class MetaConversionsAPIClient:
 
         self.base_url = "https://graph.facebook.com/v18.0"
 
+        # Created on first use and reused for every request
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Helper events share /events requests with concurrent ones
+        self._queue = _EventQueue(self.send_events)
+
+        # Fails requests fast while Meta is down instead of waiting on each
+        self._breaker = _CircuitBreaker()
+
         if not self.pixel_id:
             logger.warning("META_PIXEL_ID not configured")
         if not self.access_token:
@@ -139,6 +432,23 @@ class MetaConversionsAPIClient:
         """Check if API is properly configured"""
         return bool(self.pixel_id and self.access_token)
 
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=META_TIMEOUT_SECONDS,
+                limits=META_CONNECTION_LIMITS
+            )
+        return self._client
+
+    async def aclose(self):
+        """Send queued helper events, then close the shared HTTP client"""
+        await self._queue.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def send_event(
         self,
         event: MetaConversionEvent
@@ -155,6 +465,25 @@ class MetaConversionsAPIClient:
         Raises:
             HTTPError if request fails
         """
+        return await self.send_events([event])
+
+    async def send_events(
+        self,
+        events: List[MetaConversionEvent]
+    ) -> Dict[str, Any]:
+        """
+        Send several conversion events to Meta in one request
+
+        Args:
+            events: Up to 1000 MetaConversionEvents to send
+
+        Returns:
+            Response from Meta API
+
+        Raises:
+            HTTPError if request fails after retries, or
+            MetaCircuitOpenError (an HTTPError) while Meta is failing
+        """
         if not self.is_configured:
             logger.error("Meta Conversions API not configured")
             raise ValueError("Meta Pixel ID and Access Token required")
@@ -163,47 +492,88 @@ class MetaConversionsAPIClient:
 
         # Build request payload
         payload = {
-            "data": [{
-                "event_name": event.event_name,
-                "event_time": event.event_time,
-                "action_source": event.action_source,
-                "user_data": event.user_data.to_meta_format(),
-                "opt_out": event.opt_out
-            }],
+            "data": [self._event_data(event) for event in events],
             "access_token": self.access_token
         }
 
-        # Add optional fields
-        if event.event_source_url:
-            payload["data"][0]["event_source_url"] = event.event_source_url
-        if event.custom_data:
-            payload["data"][0]["custom_data"] = event.custom_data.dict(exclude_none=True)
-        if event.event_id:
-            payload["data"][0]["event_id"] = event.event_id
-
         # Add test event code if in test mode
         if self.test_event_code:
             payload["test_event_code"] = self.test_event_code
 
         # Send request
-        async with httpx.AsyncClient() as client:
+        try:
+            self._breaker.check()
+            response = await self._post(url, orjson.dumps(payload))
+            self._breaker.record_success()
+
+            result = orjson.loads(response.content)
+
+            # Lazy %-formatting, and the name/id lists are only built when
+            # INFO is enabled
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Meta events sent: %s (ids: %s)",
+                    [e.event_name for e in events],
+                    [e.event_id for e in events]
+                )
+
+            # Check for errors in response
+            if "events_received" in result and result["events_received"] < len(events):
+                logger.error("Meta rejected events: %s", result)
+
+            return result
+
+        except httpx.HTTPError as e:
+            if _is_transient(e):
+                self._breaker.record_failure()
+            logger.error("Meta Conversions API error: %s", e)
+            raise
+
+    async def _post(self, url: str, body: bytes) -> httpx.Response:
+        """POST body, retrying transient failures with jittered backoff"""
+        client = self._get_client()
+        for attempt in range(1, META_MAX_ATTEMPTS + 1):
             try:
-                response = await client.post(url, json=payload, timeout=10.0)
+                response = await client.post(url, content=body, headers=JSON_HEADERS)
                 response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if attempt == META_MAX_ATTEMPTS or not _is_transient(e):
+                    raise
+                delay = min(
+                    META_RETRY_MAX_SECONDS,
+                    META_RETRY_INITIAL_SECONDS * 2 ** (attempt - 1)
+                )
+                delay += random.uniform(0, META_RETRY_INITIAL_SECONDS)
+                logger.warning(
+                    "Meta request failed (%s), retry %d in %.2fs", e, attempt, delay
+                )
+                await asyncio.sleep(delay)
+
+    async def flush(self):
+        """Wait until every helper event submitted so far has been sent"""
+        await self._queue.flush()
 
-                result = response.json()
-
-                logger.info(f"Meta event sent: {event.event_name} (id: {event.event_id})")
-
-                # Check for errors in response
-                if "events_received" in result and result["events_received"] == 0:
-                    logger.error(f"Meta rejected event: {result}")
+    @staticmethod
+    def _event_data(event: MetaConversionEvent) -> Dict[str, Any]:
+        """One entry of the request's data array"""
+        data = {
+            "event_name": event.event_name,
+            "event_time": event.event_time,
+            "action_source": event.action_source,
+            "user_data": event.user_data.meta_payload,
+            "opt_out": event.opt_out
+        }
 
-                return result
+        # Add optional fields
+        if event.event_source_url:
+            data["event_source_url"] = event.event_source_url
+        if event.custom_data:
+            data["custom_data"] = event.custom_data.meta_dict
+        if event.event_id:
+            data["event_id"] = event.event_id
 
-            except httpx.HTTPError as e:
-                logger.error(f"Meta Conversions API error: {e}")
-                raise
+        return data
 
     async def send_purchase(
         self,
@@ -228,7 +598,12 @@ class MetaConversionsAPIClient:
             event_source_url: URL where purchase occurred
 
         Returns:
-            Meta API response
+            Meta API response for this event's batch, with events_received
+            counting this event only (see _EventQueue)
+
+        Raises:
+            HTTPError if this event's request fails; if Meta rejects a
+            shared request, only the invalid events' callers get the error
         """
         custom_data = MetaCustomData(
             value=revenue,
@@ -241,14 +616,14 @@ class MetaConversionsAPIClient:
 
         event = MetaConversionEvent(
             event_name="Purchase",
-            event_time=int(time.time()),
+            event_time=_unix_seconds(),
             user_data=user_data,
             custom_data=custom_data,
             event_id=event_id,
             event_source_url=event_source_url
         )
 
-        return await self.send_event(event)
+        return await self._queue.submit(event)
 
     async def send_lead(
         self,
@@ -267,7 +642,8 @@ class MetaConversionsAPIClient:
             event_source_url: URL where lead was captured
 
         Returns:
-            Meta API response
+            Meta API response for this event's batch, with events_received
+            counting this event only (see _EventQueue)
         """
         custom_data = MetaCustomData(
             value=value,
@@ -276,14 +652,14 @@ class MetaConversionsAPIClient:
 
         event = MetaConversionEvent(
             event_name="Lead",
-            event_time=int(time.time()),
+            event_time=_unix_seconds(),
             user_data=user_data,
             custom_data=custom_data,
             event_id=event_id,
             event_source_url=event_source_url
         )
 
-        return await self.send_event(event)
+        return await self._queue.submit(event)
 
     async def send_add_to_cart(
         self,
@@ -293,7 +669,7 @@ class MetaConversionsAPIClient:
         currency: str = "USD",
         event_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Send AddToCart event to Meta"""
+        """Send AddToCart event to Meta; returns as send_purchase does"""
         custom_data = MetaCustomData(
             value=value,
             currency=currency,
@@ -303,13 +679,13 @@ class MetaConversionsAPIClient:
 
         event = MetaConversionEvent(
             event_name="AddToCart",
-            event_time=int(time.time()),
+            event_time=_unix_seconds(),
             user_data=user_data,
             custom_data=custom_data,
             event_id=event_id
         )
 
-        return await self.send_event(event)
+        return await self._queue.submit(event)
 
     async def send_page_view(
         self,
@@ -317,16 +693,16 @@ class MetaConversionsAPIClient:
         event_source_url: str,
         event_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Send PageView event to Meta"""
+        """Send PageView event to Meta; returns as send_purchase does"""
         event = MetaConversionEvent(
             event_name="PageView",
-            event_time=int(time.time()),
+            event_time=_unix_seconds(),
             user_data=user_data,
             event_source_url=event_source_url,
             event_id=event_id
         )
 
-        return await self.send_event(event)
+        return await self._queue.submit(event)
 
     async def test_connection(self) -> bool:
         """Test if Meta Conversions API is working"""
@@ -340,11 +716,12 @@ class MetaConversionsAPIClient:
                 client_ip_address="127.0.0.1"
             )
 
+            now = _unix_seconds()
             test_event = MetaConversionEvent(
                 event_name="PageView",
-                event_time=int(time.time()),
+                event_time=now,
                 user_data=test_user,
-                event_id=f"test_{int(time.time())}"
+                event_id=f"test_{now}"
             )
 
             result = await self.send_event(test_event)
@@ -352,7 +729,7 @@ class MetaConversionsAPIClient:
             return result.get("events_received", 0) > 0
 
         except Exception as e:
-            logger.error(f"Meta connection test failed: {e}")
+            logger.error("Meta connection test failed: %s", e)
             return False
 
 
@@ -366,3 +743,9 @@ def get_meta_client() -> MetaConversionsAPIClient:
     if _meta_client is None:
         _meta_client = MetaConversionsAPIClient()
     return _meta_client
+
+
+async def close_meta_client():
+    """Close the global Meta client's connections, if it was ever created"""
+    if _meta_client is not None:
+        await _meta_client.aclose()
@@ -0,0 +1,185 @@
+"""
+Buffered Touchpoint Writer
+Moves touchpoint persistence off the request path
+"""
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.attribution.db_service import AttributionDatabaseService
+from app.attribution.event_schema import TouchpointEvent
+
+logger = logging.getLogger(__name__)
+
+# Flush whichever comes first: a full batch or the oldest event waiting this long
+WRITER_BATCH_SIZE = 500
+WRITER_MAX_WAIT_SECONDS = 1.0
+
+# Bounded so a stalled database applies back-pressure instead of eating memory
+WRITER_QUEUE_SIZE = 10_000
+
+# A failed batch is retried with exponential backoff before it is dropped;
+# inserts skip touchpoints already stored, so a retry never duplicates rows
+WRITER_MAX_ATTEMPTS = 3
+WRITER_RETRY_SECONDS = 0.5
+
+
+class TouchpointWriter:
+    """
+    Background writer that batches touchpoints into bulk inserts
+
+    Request handlers enqueue and return immediately; a single task drains the
+    queue in batches and writes each one in its own transaction on a worker
+    thread, so the event loop never blocks on the database.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = WRITER_BATCH_SIZE,
+        max_wait_seconds: float = WRITER_MAX_WAIT_SECONDS,
+        queue_size: int = WRITER_QUEUE_SIZE,
+        max_attempts: int = WRITER_MAX_ATTEMPTS,
+        retry_seconds: float = WRITER_RETRY_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        # Touchpoints persisted, and given up on after every attempt failed
+        self.written = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Set while anyone is waiting in flush(), so batching stops waiting
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_waiters = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether the background task is accepting touchpoints"""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring the writer"""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+    def start(self) -> None:
+        """Start the background task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="touchpoint-writer")
+        logger.info("Touchpoint writer started")
+
+    async def enqueue(self, touchpoint: TouchpointEvent, journey_id: str) -> None:
+        """Queue a touchpoint for writing; waits only while the queue is full"""
+        await self._queue.put((touchpoint, journey_id))
+
+    async def flush(self) -> None:
+        """Wait until every touchpoint enqueued so far has been written"""
+        if not self.running:
+            return
+        self._flush_waiters += 1
+        self._flush_requested.set()
+        try:
+            await self._queue.join()
+        finally:
+            self._flush_waiters -= 1
+            if not self._flush_waiters:
+                self._flush_requested.clear()
+
+    async def stop(self) -> None:
+        """Write out everything still queued, then stop the background task"""
+        if not self.running:
+            return
+        await self.flush()
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        logger.info("Touchpoint writer stopped")
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write_with_retries(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_with_retries(self, batch: List[Tuple[TouchpointEvent, str]]) -> None:
+        """Write a batch, retrying with backoff; count it as dropped if every attempt fails"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.dropped += len(batch)
+                    logger.error(
+                        f"Dropped {len(batch)} buffered touchpoints after {attempt} attempts: {e}"
+                    )
+                    return
+                logger.warning(
+                    f"Error writing {len(batch)} buffered touchpoints (attempt {attempt}), retrying: {e}"
+                )
+                await asyncio.sleep(self.retry_seconds * 2 ** (attempt - 1))
+
+    async def _next_batch(self) -> List[Tuple[TouchpointEvent, str]]:
+        """
+        Block for the first item, then collect until the batch is full, the max
+        wait elapses, or a flush is requested
+        """
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_seconds
+
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._flush_requested.is_set():
+                break
+
+            getter = asyncio.ensure_future(self._queue.get())
+            flush_waiter = asyncio.ensure_future(self._flush_requested.wait())
+            await asyncio.wait(
+                {getter, flush_waiter}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            flush_waiter.cancel()
+            if getter.cancel():
+                break
+            # cancel() fails only once the get has completed
+            batch.append(getter.result())
+
+        return batch
+
+    def _write_batch(self, batch: List[Tuple[TouchpointEvent, str]]) -> None:
+        db = self.session_factory()
+        try:
+            db_service = AttributionDatabaseService(db)
+            with db_service.unit_of_work():
+                # One INSERT for the whole batch, whichever journeys it spans
+                db_service.save_touchpoints_for_journeys(batch)
+        finally:
+            db.close()
+
+
+# Global writer instance, started and stopped with the application lifespan
+touchpoint_writer = TouchpointWriter()
@@ -9,8 +9,14 @@ from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
+from cachetools import TTLCache
+import asyncio
+import itertools
 import logging
+import secrets
+import threading
 import uuid
+import xxhash
 
 from app.attribution import (
     TouchpointEvent,
@@ -23,23 +29,47 @@ from app.attribution import (
     Platform
 )
 from app.attribution.db_service import AttributionDatabaseService
-from app.database import get_db
+from app.attribution.touchpoint_writer import touchpoint_writer
+from app.database import get_db, SessionLocal
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1/attribution", tags=["Attribution Engine"])
 
+# Journeys up to SHAPLEY_MAX_TOUCHPOINTS long use the default Shapley model.
+# Longer ones use a model with a higher cap instead of being sampled down:
+# the value heuristic is O(n), so scoring every touchpoint stays cheap
+SHAPLEY_MAX_TOUCHPOINTS = 10
+SHAPLEY_LONG_JOURNEY_MAX_TOUCHPOINTS = 500
+
 # Global model instances
 _shapley_model = None
+_long_journey_shapley_model = None
 _markov_model = None
 
-
-def get_shapley_model() -> ShapleyAttributionModel:
-    """Get or create Shapley attribution model"""
-    global _shapley_model
-    if _shapley_model is None:
-        _shapley_model = ShapleyAttributionModel(max_touchpoints=10)
-    return _shapley_model
+# Attribution results per (model, journey fingerprint). Stored touchpoints and
+# conversions never change, so a journey with the same ones gets the same
+# result from the same model; keying on the model instance itself means a
+# retrained Markov model never serves results from its predecessor
+ATTRIBUTION_RESULT_CACHE_SIZE = 4096
+ATTRIBUTION_RESULT_CACHE_TTL_SECONDS = 300
+_result_cache = TTLCache(maxsize=ATTRIBUTION_RESULT_CACHE_SIZE, ttl=ATTRIBUTION_RESULT_CACHE_TTL_SECONDS)
+_result_cache_lock = threading.Lock()
+
+
+def get_shapley_model(n_touchpoints: int = 0) -> ShapleyAttributionModel:
+    """Get or create the Shapley attribution model for journeys of n_touchpoints"""
+    global _shapley_model, _long_journey_shapley_model
+    if n_touchpoints <= SHAPLEY_MAX_TOUCHPOINTS:
+        if _shapley_model is None:
+            _shapley_model = ShapleyAttributionModel(max_touchpoints=SHAPLEY_MAX_TOUCHPOINTS)
+        return _shapley_model
+
+    if _long_journey_shapley_model is None:
+        _long_journey_shapley_model = ShapleyAttributionModel(
+            max_touchpoints=SHAPLEY_LONG_JOURNEY_MAX_TOUCHPOINTS
+        )
+    return _long_journey_shapley_model
 
 
 def get_markov_model() -> MarkovChainAttributionModel:
@@ -50,6 +80,26 @@ def get_markov_model() -> MarkovChainAttributionModel:
     return _markov_model
 
 
+# Event and conversion ID suffixes: a counter behind a random per-process
+# prefix is unique without an OS RNG call per event, and the prefix keeps
+# IDs from restarted or parallel workers apart
+_EVENT_ID_PREFIX = secrets.token_hex(4)
+_event_counter = itertools.count()
+
+
+def _event_id(user_id: str, timestamp: datetime) -> str:
+    """Unique ID for a tracked touchpoint or conversion"""
+    return f"{user_id}_{int(timestamp.timestamp())}_{_EVENT_ID_PREFIX}{next(_event_counter):x}"
+
+
+def _journey_fingerprint(journey: CustomerJourney) -> str:
+    """Hash of the journey's touchpoint and conversion IDs, in order"""
+    ids = [t.event_id for t in journey.touchpoints]
+    if journey.conversion:
+        ids.append(journey.conversion.conversion_id)
+    return xxhash.xxh3_128_hexdigest("|".join(ids))
+
+
 # Request/Response Models
 
 class TrackEventRequest(BaseModel):
@@ -147,7 +197,7 @@ async def track_touchpoint(
 
         # Convert request to TouchpointEvent
         event = TouchpointEvent(
-            event_id=f"{request.user_id}_{int(request.timestamp.timestamp())}_{uuid.uuid4().hex[:8]}",
+            event_id=_event_id(request.user_id, request.timestamp),
             user_id=request.user_id,
             event_type=request.event_type,
             platform=Platform(request.platform),
@@ -167,23 +217,17 @@ async def track_touchpoint(
             custom_data=request.custom_data
         )
 
-        # Get or create journey for this user
-        journey = db_service.get_journey_for_user(request.user_id, active_only=True)
-        if not journey:
-            # Create new journey
-            journey_id = f"journey_{request.user_id}_{uuid.uuid4().hex[:12]}"
-            temp_journey = CustomerJourney(
-                journey_id=journey_id,
-                user_id=request.user_id,
-                touchpoints=[event],
-                conversion=None
-            )
-            db_service.create_or_update_journey(temp_journey)
-        else:
-            journey_id = journey.id
+        # Touchpoints go through the background writer when it is running;
+        # otherwise (e.g. no application lifespan) they are written inline
+        buffered = touchpoint_writer.running
 
-        # Save touchpoint to database
-        db_service.save_touchpoint(event, journey_id)
+        # The journey lookup and any inline write block on the database
+        journey_id = await asyncio.to_thread(
+            _resolve_touchpoint_journey, db_service, event, not buffered
+        )
+
+        if buffered:
+            await touchpoint_writer.enqueue(event, journey_id)
 
         logger.info(f"Tracked touchpoint {event.event_id} for user {request.user_id}")
 
@@ -200,6 +244,37 @@ async def track_touchpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _resolve_touchpoint_journey(
+    db_service: AttributionDatabaseService,
+    event: TouchpointEvent,
+    save_inline: bool
+) -> str:
+    """
+    Get or create the user's active journey, saving the touchpoint too when
+    it is not buffered; runs in a worker thread
+    """
+    with db_service.unit_of_work():
+        # Get or create journey for this user
+        journey = db_service.get_journey_for_user(event.user_id, active_only=True)
+        if not journey:
+            # Create new journey
+            journey_id = f"journey_{event.user_id}_{uuid.uuid4().hex[:12]}"
+            temp_journey = CustomerJourney(
+                journey_id=journey_id,
+                user_id=event.user_id,
+                touchpoints=[event],
+                conversion=None
+            )
+            db_service.create_or_update_journey(temp_journey)
+        else:
+            journey_id = journey.id
+
+        if save_inline:
+            db_service.save_touchpoint(event, journey_id)
+
+    return journey_id
+
+
 @router.post("/track/conversion")
 async def track_conversion(
     request: TrackConversionRequest,
@@ -219,7 +294,7 @@ async def track_conversion(
 
         # Create conversion event
         conversion = ConversionEvent(
-            conversion_id=f"{request.user_id}_{int(request.timestamp.timestamp())}_{uuid.uuid4().hex[:8]}",
+            conversion_id=_event_id(request.user_id, request.timestamp),
             user_id=request.user_id,
             conversion_type=request.conversion_type,
             timestamp=request.timestamp,
@@ -229,34 +304,31 @@ async def track_conversion(
             product_ids=request.product_ids
         )
 
-        # Get existing journey for this user
-        journey = db_service.get_journey_for_user(request.user_id, active_only=True)
-        if not journey:
-            # No journey exists - create one with just the conversion
-            logger.warning(f"No journey found for user {request.user_id}, creating conversion-only journey")
-            journey_id = f"journey_{request.user_id}_{uuid.uuid4().hex[:12]}"
-            temp_journey = CustomerJourney(
-                journey_id=journey_id,
-                user_id=request.user_id,
-                touchpoints=[],
-                conversion=conversion
-            )
-            db_service.create_or_update_journey(temp_journey)
-        else:
-            journey_id = journey.id
-            # Update journey to mark as converted
-            journey.converted = True
-            journey.conversion_id = conversion.conversion_id
-
-        # Save conversion to database
-        db_service.save_conversion(conversion, journey_id)
+        with db_service.unit_of_work():
+            # Get existing journey for this user
+            journey = db_service.get_journey_for_user(request.user_id, active_only=True)
+            if not journey:
+                # No journey exists - create one with just the conversion
+                logger.warning(f"No journey found for user {request.user_id}, creating conversion-only journey")
+                journey_id = f"journey_{request.user_id}_{uuid.uuid4().hex[:12]}"
+                temp_journey = CustomerJourney(
+                    journey_id=journey_id,
+                    user_id=request.user_id,
+                    touchpoints=[],
+                    conversion=conversion
+                )
+                db_service.create_or_update_journey(temp_journey)
+            else:
+                journey_id = journey.id
+                # Update journey to mark as converted
+                journey.converted = True
+                journey.conversion_id = conversion.conversion_id
+
+            # Save conversion to database
+            db_service.save_conversion(conversion, journey_id)
 
         # Queue attribution analysis in background
-        background_tasks.add_task(
-            _analyze_and_save_attribution,
-            journey_id,
-            db
-        )
+        background_tasks.add_task(_analyze_and_save_attribution, journey_id)
 
         logger.info(f"Tracked conversion {conversion.conversion_id} for user {request.user_id}")
 
@@ -291,25 +363,17 @@ async def analyze_journey(
     try:
         db_service = AttributionDatabaseService(db)
 
-        # Get journey from database
-        db_journey = db_service.get_journey_for_user(request.user_id, active_only=False)
+        # Get journey, touchpoints and conversion from database in one lookup
+        db_journey, journey = db_service.get_full_journey_for_user(request.user_id, active_only=False)
         if not db_journey:
             raise HTTPException(
                 status_code=404,
                 detail=f"No journey found for user {request.user_id}"
             )
 
-        # Build CustomerJourney from database
-        journey = db_service.build_journey_from_db(db_journey.id)
-        if not journey:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Could not build journey for user {request.user_id}"
-            )
-
         # Get attribution model
         if request.model_type == AttributionModelType.SHAPLEY:
-            model = get_shapley_model()
+            model = get_shapley_model(len(journey.touchpoints))
         elif request.model_type == AttributionModelType.MARKOV:
             model = get_markov_model()
         else:
@@ -318,11 +382,24 @@ async def analyze_journey(
                 detail=f"Model type {request.model_type} not supported yet"
             )
 
+        # A journey analysed before with the same touchpoints was already
+        # scored and saved by this model
+        cache_key = (model, _journey_fingerprint(journey))
+        with _result_cache_lock:
+            cached = _result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Reused attribution for journey {db_journey.id} using {request.model_type.value}")
+            return cached
+
         # Calculate attribution
         result = model.calculate_attribution(journey)
 
         # Save result to database
-        db_service.save_attribution_result(result, db_journey.id)
+        with db_service.unit_of_work():
+            db_service.save_attribution_result(result, db_journey.id)
+
+        with _result_cache_lock:
+            _result_cache[cache_key] = result
 
         logger.info(f"Analyzed journey {db_journey.id} using {request.model_type.value}")
 
@@ -336,7 +413,10 @@ async def analyze_journey(
 
 
 @router.post("/analyze/batch")
-async def analyze_batch(request: BatchAnalysisRequest) -> Dict[str, Any]:
+def analyze_batch(
+    request: BatchAnalysisRequest,
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
     """
     Analyze attribution for multiple journeys
 
@@ -346,18 +426,23 @@ async def analyze_batch(request: BatchAnalysisRequest) -> Dict[str, Any]:
     - Platform analysis (overall attribution across all users)
 
     Returns aggregated attribution insights.
+
+    A plain function, so FastAPI runs it in the threadpool and the blocking
+    queries and attribution never stall the event loop.
     """
     try:
-        model = get_shapley_model()
+        db_service = AttributionDatabaseService(db)
 
-        # In production: fetch journeys from database
-        # For MVP: analyze sample journeys
+        # Latest journey per user, built in a fixed number of queries
+        user_ids = request.user_ids[:100]  # Limit for MVP
+        db_journeys = db_service.get_journeys_for_users(user_ids, active_only=False)
+        journeys = db_service.build_journeys_from_db(
+            [db_journeys[user_id].id for user_id in user_ids if user_id in db_journeys]
+        )
+        model = get_shapley_model(max((len(j.touchpoints) for j in journeys), default=0))
 
-        results = []
-        for user_id in request.user_ids[:100]:  # Limit for MVP
-            journey = _get_or_create_mock_journey(user_id)
-            result = model.calculate_attribution(journey)
-            results.append(result)
+        # Journeys sharing a platform sequence are scored once
+        results = model.calculate_attributions(journeys)
 
         # Aggregate results
         aggregated = _aggregate_attribution_results(results)
@@ -392,7 +477,7 @@ async def train_markov(
     """
     try:
         # Queue training job (can take minutes for large datasets)
-        background_tasks.add_task(_train_markov_background, request, db)
+        background_tasks.add_task(_train_markov_background, request)
 
         return {
             "status": "training_queued",
@@ -454,14 +539,33 @@ async def health_check() -> Dict[str, Any]:
             "markov_attribution",
             "multi_platform_tracking",
             "real_time_analysis"
-        ]
+        ],
+        "touchpoint_writer": touchpoint_writer.stats
     }
 
 
 # Background tasks
+#
+# These run after the response is sent, when the request's session has
+# already been closed, so each opens and closes its own session. Their
+# database I/O and model work is blocking, so it runs in worker threads
+# and the event loop keeps serving requests meanwhile.
 
-async def _analyze_and_save_attribution(journey_id: str, db: Session):
+async def _analyze_and_save_attribution(journey_id: str):
     """Background task to analyze journey and save attribution result"""
+    try:
+        # Make sure buffered touchpoints for this journey have landed
+        await touchpoint_writer.flush()
+
+        await asyncio.to_thread(_analyze_and_save_attribution_sync, journey_id)
+
+    except Exception as e:
+        logger.error(f"Error in background attribution for journey {journey_id}: {e}")
+
+
+def _analyze_and_save_attribution_sync(journey_id: str):
+    """Build, attribute and save a journey; runs in a worker thread"""
+    db = SessionLocal()
     try:
         db_service = AttributionDatabaseService(db)
 
@@ -472,62 +576,63 @@ async def _analyze_and_save_attribution(journey_id: str, db: Session):
             return
 
         # Analyze with Shapley model
-        shapley = get_shapley_model()
+        shapley = get_shapley_model(len(journey.touchpoints))
         result = shapley.calculate_attribution(journey)
 
         # Save result to database
-        db_service.save_attribution_result(result, journey_id)
+        with db_service.unit_of_work():
+            db_service.save_attribution_result(result, journey_id)
 
         logger.info(f"Attribution complete for journey {journey_id}: {result.insights}")
 
-    except Exception as e:
-        logger.error(f"Error in background attribution for journey {journey_id}: {e}")
+    finally:
+        db.close()
 
 
-async def _train_markov_background(request: TrainMarkovRequest, db: Session):
-    """Background task to train Markov model"""
+def _train_markov_background(request: TrainMarkovRequest):
+    """
+    Background task to train Markov model
+
+    A plain function, so BackgroundTasks runs it in the threadpool.
+    """
+    global _markov_model
+    db = SessionLocal()
     try:
         db_service = AttributionDatabaseService(db)
-        model = get_markov_model()
 
-        # Fetch converted journeys from database for training
-        db_journeys = db_service.get_recent_journeys(
-            limit=1000,
+        # Stream converted journeys from the database into a fresh model, so
+        # only one chunk of journeys is in memory at a time and the serving
+        # model is untouched unless training succeeds
+        journeys = db_service.iter_customer_journeys(
             converted_only=True,
             start_date=request.start_date,
-            end_date=request.end_date
+            end_date=request.end_date,
+            limit=1000,
+            min_touchpoints=request.min_touchpoints
         )
+        model = MarkovChainAttributionModel(min_support=get_markov_model().min_support)
+        model.train(journeys)
 
-        # Build CustomerJourney objects
-        journeys = []
-        for db_journey in db_journeys:
-            journey = db_service.build_journey_from_db(db_journey.id)
-            if journey and len(journey.touchpoints) >= request.min_touchpoints:
-                journeys.append(journey)
-
-        if len(journeys) < 10:
-            logger.warning(f"Only {len(journeys)} journeys available for training, need at least 10")
+        if model.journey_count < 10:
+            logger.warning(f"Only {model.journey_count} journeys available for training, need at least 10")
             return
 
-        # Train model
-        model.train(journeys)
+        _markov_model = model
 
         # Save model state to database
-        model_state = {
-            "transitions": dict(model.transitions),
-            "state_counts": dict(model.state_counts),
-            "conversion_probs": dict(model.conversion_probs)
-        }
-        db_service.save_model_state(
-            model_type="markov",
-            model_state=model_state,
-            training_journeys_count=len(journeys)
-        )
+        with db_service.unit_of_work():
+            db_service.save_model_state(
+                model_type="markov",
+                model_state=model.to_state(),
+                training_journeys_count=model.journey_count
+            )
 
-        logger.info(f"Markov model training complete with {len(journeys)} journeys")
+        logger.info(f"Markov model training complete with {model.journey_count} journeys")
 
     except Exception as e:
         logger.error(f"Error training Markov model: {e}")
+    finally:
+        db.close()
 
 
 # Helper functions
@@ -535,24 +640,26 @@ async def _train_markov_background(request: TrainMarkovRequest, db: Session):
 
 def _aggregate_attribution_results(results: List[AttributionResult]) -> Dict[str, Any]:
     """Aggregate multiple attribution results"""
-    from collections import defaultdict
+    from collections import Counter, defaultdict
 
     platform_totals = defaultdict(lambda: {"credit": 0.0, "revenue": 0.0, "count": 0})
     campaign_totals = defaultdict(lambda: {"credit": 0.0, "revenue": 0.0, "count": 0})
-    all_insights = []
+    insight_counts = Counter()
 
     for result in results:
         for pa in result.platform_attribution:
-            platform_totals[pa.platform.value]["credit"] += pa.credit
-            platform_totals[pa.platform.value]["revenue"] += pa.revenue_attributed
-            platform_totals[pa.platform.value]["count"] += 1
+            totals = platform_totals[pa.platform.value]
+            totals["credit"] += pa.credit
+            totals["revenue"] += pa.revenue_attributed
+            totals["count"] += 1
 
         for ca in result.campaign_attribution:
-            campaign_totals[ca.campaign_id]["credit"] += ca.credit
-            campaign_totals[ca.campaign_id]["revenue"] += ca.revenue_attributed
-            campaign_totals[ca.campaign_id]["count"] += 1
+            totals = campaign_totals[ca.campaign_id]
+            totals["credit"] += ca.credit
+            totals["revenue"] += ca.revenue_attributed
+            totals["count"] += 1
 
-        all_insights.extend(result.insights)
+        insight_counts.update(result.insights)
 
     return {
         "platforms": [
@@ -571,7 +678,7 @@ def _aggregate_attribution_results(results: List[AttributionResult]) -> Dict[str
                 reverse=True
             )[:10]  # Top 10 campaigns
         ],
-        "insights": list(set(all_insights))[:5]  # Top 5 unique insights
+        "insights": [insight for insight, _ in insight_counts.most_common(5)]  # Top 5 most common insights
     }
 
 
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 import psutil
 import asyncio
 from app.core.cache import cache, cached
+from app.core.perf_sampler import cpu_sampler
 
 class AutoScalingManager:
     def __init__(self):
@@ -46,7 +47,7 @@ class AutoScalingManager:
     def get_current_metrics(self) -> Dict[str, float]:
         """Get current system metrics for scaling decisions"""
         return {
-            "cpu_percent": psutil.cpu_percent(interval=1),
+            "cpu_percent": cpu_sampler.cpu_percent(),
             "memory_percent": psutil.virtual_memory().percent,
             "response_time": self._get_avg_response_time(),
             "active_connections": self._get_active_connections(),
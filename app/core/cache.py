@@ -8,7 +8,9 @@ import pickle
 from typing import Any, Optional, Union
 from datetime import timedelta
 import os
+import time
 from functools import wraps
+from collections import defaultdict, deque
 
 # Redis connection
 redis_client = redis.Redis(
@@ -22,13 +24,17 @@ redis_client = redis.Redis(
 class CacheManager:
     def __init__(self):
         self.client = redis_client
+        self.hits = 0
+        self.misses = 0
         
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         try:
             value = self.client.get(key)
             if value is None:
+                self.misses += 1
                 return None
+            self.hits += 1
             
             # Try to parse as JSON first, then pickle
             try:
@@ -118,6 +124,76 @@ def cached(ttl: int = 3600, key_prefix: str = ""):
         return wrapper
     return decorator
 
+# Response timing
+TIMINGS_WINDOW_SECONDS = 300
+TIMINGS_ENDPOINTS_KEY = "timings:endpoints"
+
+# Samples are collected in process and written to Redis in one pipeline per
+# flush; if Redis falls behind, the oldest pending samples are dropped
+TIMINGS_FLUSH_INTERVAL_SECONDS = 1.0
+TIMINGS_MAX_PENDING = 50_000
+
+_pending_timings: deque = deque(maxlen=TIMINGS_MAX_PENDING)
+
+def record_response_time(endpoint: str, elapsed_ms: float) -> None:
+    """Queue a response time sample for endpoint; no I/O on the request path"""
+    _pending_timings.append((time.time(), endpoint, elapsed_ms))
+
+def flush_response_times() -> int:
+    """Write pending response time samples to their rolling windows; returns the count"""
+    samples = defaultdict(dict)
+    for _ in range(len(_pending_timings)):
+        recorded_at, endpoint, elapsed_ms = _pending_timings.popleft()
+        samples[endpoint][f"{recorded_at:.6f}:{elapsed_ms:.3f}"] = recorded_at
+    if not samples:
+        return 0
+    
+    now = time.time()
+    try:
+        # One pipeline per flush: per endpoint, add its samples, trim the
+        # window and keep the key alive only as long as it holds live samples
+        pipe = redis_client.pipeline(transaction=False)
+        for endpoint, members in samples.items():
+            key = f"timings:{endpoint}"
+            pipe.zadd(key, members)
+            pipe.zremrangebyscore(key, "-inf", now - TIMINGS_WINDOW_SECONDS)
+            pipe.expire(key, TIMINGS_WINDOW_SECONDS)
+        pipe.sadd(TIMINGS_ENDPOINTS_KEY, *samples)
+        pipe.execute()
+    except Exception as e:
+        # Timings are best-effort; a failed flush only loses its samples
+        print(f"Response time flush error: {e}")
+        return 0
+    return sum(len(members) for members in samples.values())
+
+def get_response_time_percentiles(window_seconds: int = TIMINGS_WINDOW_SECONDS) -> dict:
+    """Get rolling p50/p95 response times (seconds) per endpoint"""
+    try:
+        endpoints = sorted(redis_client.smembers(TIMINGS_ENDPOINTS_KEY))
+        if not endpoints:
+            return {}
+        
+        cutoff = time.time() - window_seconds
+        pipe = redis_client.pipeline(transaction=False)
+        for endpoint in endpoints:
+            pipe.zrangebyscore(f"timings:{endpoint}", cutoff, "+inf")
+        
+        percentiles = {}
+        for endpoint, members in zip(endpoints, pipe.execute()):
+            if not members:
+                continue
+            samples = sorted(float(m.rsplit(":", 1)[1]) / 1000 for m in members)
+            count = len(samples)
+            percentiles[endpoint] = {
+                "p50": samples[int(0.50 * (count - 1))],
+                "p95": samples[int(0.95 * (count - 1))],
+                "count": count
+            }
+        return percentiles
+    except Exception as e:
+        print(f"Response time percentiles error: {e}")
+        return {}
+
 # Pre-defined cache keys for common operations
 class CacheKeys:
     USER_PROFILE = "user:profile:{user_id}"
@@ -162,7 +238,9 @@ def get_cache_stats():
                 info.get('keyspace_hits', 0) / 
                 max(info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0), 1) * 100, 
                 2
-            )
+            ),
+            "app_cache_hits": cache.hits,
+            "app_cache_misses": cache.misses
         }
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,71 @@
+"""
+Non-blocking system metric sampling
+"""
+
+import os
+import sys
+import threading
+from typing import Optional, Tuple
+
+import psutil
+
+PROC_STAT_PATH = "/proc/stat"
+
+
+class CpuSampler:
+    """
+    CPU utilisation sampler that never sleeps.
+
+    psutil.cpu_percent(interval=1) parks the calling thread for a full
+    second per call. Instead, each call reports utilisation over the interval
+    since the previous call. On Linux the aggregate "cpu" line of /proc/stat
+    is read directly with a single os.read; elsewhere psutil's non-blocking
+    interval=None mode provides the same delta semantics.
+    """
+
+    def __init__(self):
+        self._use_proc_stat = sys.platform.startswith("linux") and os.path.exists(PROC_STAT_PATH)
+        self._lock = threading.Lock()
+        self._last: Optional[Tuple[int, int]] = None
+        # Prime the baseline so the first real sample covers a sane interval
+        self.cpu_percent()
+
+    def _read_proc_stat(self) -> Tuple[int, int]:
+        """Return (idle, total) jiffies from the aggregate cpu line"""
+        fd = os.open(PROC_STAT_PATH, os.O_RDONLY)
+        try:
+            line = os.read(fd, 512).split(b"\n", 1)[0]
+        finally:
+            os.close(fd)
+
+        # cpu user nice system idle iowait irq softirq steal [guest guest_nice]
+        fields = [int(v) for v in line.split()[1:9]]
+        idle = fields[3] + fields[4]
+        return idle, sum(fields)
+
+    def cpu_percent(self) -> float:
+        """CPU utilisation percent since the previous call"""
+        if not self._use_proc_stat:
+            return psutil.cpu_percent(interval=None)
+
+        try:
+            idle, total = self._read_proc_stat()
+        except (OSError, ValueError, IndexError):
+            self._use_proc_stat = False
+            return psutil.cpu_percent(interval=None)
+
+        with self._lock:
+            last, self._last = self._last, (idle, total)
+
+        if last is None:
+            # Utilisation since boot is the best available first reading
+            return round((1 - idle / total) * 100, 1) if total else 0.0
+
+        idle_delta, total_delta = idle - last[0], total - last[1]
+        if total_delta <= 0:
+            return 0.0
+        return round((1 - idle_delta / total_delta) * 100, 1)
+
+
+# Global sampler instance
+cpu_sampler = CpuSampler()
@@ -3,20 +3,33 @@ Database Module - Stub Implementation
 """
 from typing import Generator
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
+import orjson
 import os
 
 # Database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
+
+def _json_serializer(obj) -> str:
+    """orjson for JSON columns; non-str keys are stringified like stdlib json does"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
 # Configure SSL and connection args for Supabase
 connect_args = {}
 engine_args = {
     "echo": False,
+    # Attribution results and model states are large JSON payloads
+    "json_serializer": _json_serializer,
+    "json_deserializer": orjson.loads,
 }
 
-if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
+# Match on the backend rather than the URL prefix, so driver-qualified URLs
+# (postgresql+psycopg2://...) get the same SSL and pool settings
+if DATABASE_URL and make_url(DATABASE_URL).get_backend_name() == "postgresql":
     # Add SSL configuration for PostgreSQL/Supabase
     connect_args = {
         "sslmode": "require",
@@ -37,10 +50,11 @@ if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
         # Direct connection - use QueuePool with connection pooling
         from sqlalchemy.pool import QueuePool
         engine_args["poolclass"] = QueuePool
-        engine_args["pool_size"] = 10
-        engine_args["max_overflow"] = 20
+        engine_args["pool_size"] = 25
+        engine_args["max_overflow"] = 25
         engine_args["pool_pre_ping"] = True
-        engine_args["pool_recycle"] = 300
+        engine_args["pool_recycle"] = 1800
+        engine_args["pool_timeout"] = 10  # Fail fast instead of queueing requests behind a full pool
         print("INFO: Using Supabase Direct Connection with QueuePool")
     
     engine_args["connect_args"] = connect_args
@@ -49,7 +63,9 @@ if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
 engine = create_engine(DATABASE_URL, **engine_args)
 
 # Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False keeps objects returned by a request usable after
+# commit without re-SELECTing every attribute
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Base class for models
 Base = declarative_base()
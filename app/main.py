@@ -6,6 +6,7 @@ Complete backend server with Claude AI chat and platform control
 import os
 from fastapi import FastAPI, HTTPException, Depends, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
 import uvicorn
@@ -17,6 +18,8 @@ import aiohttp
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+import asyncio
+import time
 
 # Configure logging first
 logging.basicConfig(level=logging.INFO)
@@ -306,10 +309,43 @@ from app.pinterest_ads_integration import (
 from app.meta_ai_hybrid_integration import PulseBridgeAIMasterController, CrossPlatformMetrics, AIDecisionLog
 from app.smart_risk_management import SmartRiskManager, ClientReportingManager, RISK_MANAGEMENT_TEMPLATES, CLIENT_REPORTING_TEMPLATES
 from app.hybrid_ai_endpoints import hybrid_ai_router
+from app.core.cache import (
+    TIMINGS_FLUSH_INTERVAL_SECONDS, flush_response_times, record_response_time
+)
 
 # Security
 security = HTTPBearer(auto_error=False)
 
+# Monthly touchpoint partitions are created this often, months ahead, so a
+# long-running process never outlives its partition horizon
+PARTITION_ROLL_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+def _ensure_touchpoint_partitions():
+    """Create any missing monthly touchpoint partitions in one transaction"""
+    from app.database import engine
+    from app.attribution.db_models import ensure_touchpoint_partitions
+    with engine.begin() as connection:
+        ensure_touchpoint_partitions(connection)
+
+
+async def _roll_touchpoint_partitions_forever():
+    """Re-run partition upkeep on a fixed interval for the process lifetime"""
+    while True:
+        await asyncio.sleep(PARTITION_ROLL_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(_ensure_touchpoint_partitions)
+        except Exception as e:
+            logger.error(f"❌ Touchpoint partition upkeep failed: {e}")
+
+
+async def _flush_response_times_forever():
+    """Write collected response timings to Redis on a fixed interval"""
+    while True:
+        await asyncio.sleep(TIMINGS_FLUSH_INTERVAL_SECONDS)
+        await asyncio.to_thread(flush_response_times)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler"""
@@ -330,8 +366,32 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ Database initialization failed: {e}")
 
+    # Partition upkeep is separate so a failure here never blocks startup
+    try:
+        await asyncio.to_thread(_ensure_touchpoint_partitions)
+    except Exception as e:
+        logger.error(f"❌ Touchpoint partition upkeep failed: {e}")
+    partition_task = asyncio.create_task(
+        _roll_touchpoint_partitions_forever(), name="touchpoint-partitions"
+    )
+
+    timings_task = asyncio.create_task(
+        _flush_response_times_forever(), name="response-timings"
+    )
+
+    from app.attribution.touchpoint_writer import touchpoint_writer
+    touchpoint_writer.start()
+
     yield
     logger.info("🔄 PulseBridge.ai Backend Shutting Down...")
+    partition_task.cancel()
+    timings_task.cancel()
+    await asyncio.to_thread(flush_response_times)
+    await touchpoint_writer.stop()
+
+    from app.attribution.platform_integrations import close_ga4_client, close_meta_client
+    await close_ga4_client()
+    await close_meta_client()
 
 # Create FastAPI application
 app = FastAPI(
@@ -340,7 +400,10 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Encode response bodies with orjson; attribution payloads are large
+    # nested lists of floats
+    default_response_class=ORJSONResponse
 )
 
 # Rate limiting setup
@@ -362,6 +425,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_response_timings(request: Request, call_next):
+    """Collect per-route response times for the rolling Redis timing window"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    # Key by route template so path parameters don't explode the keyspace
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", None)
+    if endpoint:
+        # Only appended in process; _flush_response_times_forever batches
+        # the Redis writes
+        record_response_time(endpoint, elapsed_ms)
+    return response
+
 # Include AI router
 if AI_SERVICES_AVAILABLE and ai_router:
     app.include_router(ai_router, prefix="/api/v1")
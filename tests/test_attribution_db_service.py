@@ -4,18 +4,20 @@ Tests all database operations for attribution engine
 """
 import pytest
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import uuid
 
 from app.database import Base
+from app.attribution import db_service as db_service_module
 from app.attribution.db_service import AttributionDatabaseService
 from app.attribution.db_models import (
     AttributionTouchpoint,
     AttributionConversion,
     AttributionJourney,
     AttributionResult,
-    AttributionModelState
+    AttributionModelState,
+    ensure_touchpoint_partitions
 )
 from app.attribution.event_schema import (
     TouchpointEvent,
@@ -46,6 +48,8 @@ def test_db():
 @pytest.fixture
 def db_service(test_db):
     """Create database service instance"""
+    # Model states are cached per process; start each test from a clean cache
+    db_service_module._model_state_cache.clear()
     return AttributionDatabaseService(test_db)
 
 
@@ -97,7 +101,7 @@ def sample_journey(sample_touchpoint, sample_conversion):
         TouchpointEvent(
             event_id="test_event_2",
             user_id="user_123",
-            event_type=EventType.VIEW,
+            event_type=EventType.CONTENT_VIEW,
             platform=Platform.GOOGLE_SEARCH,
             timestamp=datetime.now() + timedelta(hours=1),
             campaign_id="campaign_002"
@@ -135,7 +139,7 @@ def test_get_touchpoints_for_journey(db_service, sample_touchpoint):
     touchpoint2 = TouchpointEvent(
         event_id="test_event_2",
         user_id="user_123",
-        event_type=EventType.VIEW,
+        event_type=EventType.CONTENT_VIEW,
         platform=Platform.GOOGLE_SEARCH,
         timestamp=datetime.now() + timedelta(hours=1)
     )
@@ -196,6 +200,101 @@ def test_get_touchpoints_for_user_with_date_range(db_service):
     assert touchpoints[0].id == "new_event"
 
 
+def test_save_touchpoints_bulk(db_service):
+    """Test saving many touchpoints in one batch"""
+    journey_id = "journey_001"
+    now = datetime.now()
+
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"bulk_event_{i}",
+            user_id="user_123",
+            event_type=EventType.CLICK,
+            platform=Platform.META if i % 2 else Platform.GOOGLE_ADS,
+            timestamp=now + timedelta(minutes=i)
+        )
+        for i in range(5)
+    ]
+
+    saved = db_service.save_touchpoints_bulk(touchpoints, journey_id)
+
+    assert saved == 5
+    stored = db_service.get_touchpoints_for_journey(journey_id)
+    assert [tp.id for tp in stored] == [f"bulk_event_{i}" for i in range(5)]
+    assert db_service.save_touchpoints_bulk([], journey_id) == 0
+
+    # Re-sent touchpoints are skipped without failing the new ones
+    retry = touchpoints[3:] + [touchpoints[0].model_copy(update={"event_id": "bulk_event_5"})]
+    db_service.save_touchpoints_bulk(retry, journey_id)
+    assert len(db_service.get_touchpoints_for_journey(journey_id)) == 6
+
+
+def test_save_touchpoints_for_journeys(db_service):
+    """Test saving one batch of touchpoints that spans several journeys"""
+    now = datetime.now()
+    touchpoints = [
+        (
+            TouchpointEvent(
+                event_id=f"mixed_event_{i}",
+                user_id=f"user_{i % 2}",
+                event_type=EventType.CLICK,
+                platform=Platform.META,
+                timestamp=now + timedelta(minutes=i)
+            ),
+            f"journey_{i % 2}"
+        )
+        for i in range(5)
+    ]
+
+    assert db_service.save_touchpoints_for_journeys(touchpoints) == 5
+    stored = db_service.get_touchpoints_for_journey("journey_1")
+    assert [tp.id for tp in stored] == ["mixed_event_1", "mixed_event_3"]
+    assert db_service.save_touchpoints_for_journeys([]) == 0
+
+
+def test_touchpoint_db_to_model_round_trip(db_service):
+    """Test unvalidated rehydration matches a fully validated model"""
+    db_touchpoint = AttributionTouchpoint(
+        id="evt_rt",
+        journey_id="journey_rt",
+        user_id="user_rt",
+        event_type=EventType.CLICK.value,
+        platform=Platform.LINKEDIN.value,
+        timestamp=datetime(2025, 1, 1, 12, 0, 0),
+        campaign_id="camp_rt",
+        time_spent=42.0,
+        custom_data=None
+    )
+
+    touchpoint = db_service._touchpoint_db_to_model(db_touchpoint)
+    validated = TouchpointEvent(**touchpoint.model_dump())
+
+    assert touchpoint.platform is Platform.LINKEDIN
+    assert touchpoint.event_type is EventType.CLICK
+    assert touchpoint.time_on_page == 42.0
+    assert touchpoint.model_dump() == validated.model_dump()
+
+
+def test_unit_of_work_commits_once(db_service, test_db, sample_touchpoint):
+    """Test writes inside a unit of work are committed together on exit"""
+    with db_service.unit_of_work():
+        db_service.save_touchpoint(sample_touchpoint, "journey_001")
+        assert test_db.in_transaction()
+
+    test_db.expire_all()
+    assert len(db_service.get_touchpoints_for_journey("journey_001")) == 1
+
+
+def test_unit_of_work_rolls_back_on_error(db_service, sample_touchpoint):
+    """Test a failing unit of work discards its flushed writes"""
+    with pytest.raises(RuntimeError):
+        with db_service.unit_of_work():
+            db_service.save_touchpoint(sample_touchpoint, "journey_001")
+            raise RuntimeError("boom")
+
+    assert db_service.get_touchpoints_for_journey("journey_001") == []
+
+
 # ==================== CONVERSION TESTS ====================
 
 def test_save_conversion(db_service, sample_conversion):
@@ -281,6 +380,37 @@ def test_get_journey_for_user(db_service, sample_journey):
     assert journey.user_id == "user_123"
 
 
+def test_get_journeys_for_users(db_service, test_db):
+    """Test fetching the latest journey of many users at once"""
+    for journey_id, user_id, created_at, converted in [
+        ("journey_u1_old", "user_1", datetime(2025, 1, 1), True),
+        ("journey_u1_new", "user_1", datetime(2025, 2, 1), True),
+        ("journey_u2", "user_2", datetime(2025, 1, 15), False),
+    ]:
+        test_db.add(AttributionJourney(
+            id=journey_id,
+            user_id=user_id,
+            converted=converted,
+            created_at=created_at,
+            first_touch_at=created_at,
+            last_touch_at=created_at
+        ))
+    test_db.commit()
+
+    latest = db_service.get_journeys_for_users(["user_1", "user_2", "user_3"], active_only=False)
+
+    assert {user: j.id for user, j in latest.items()} == {
+        "user_1": "journey_u1_new",
+        "user_2": "journey_u2"
+    }
+    assert set(db_service.get_journeys_for_users(["user_1", "user_2"])) == {"user_2"}
+
+    # The single-user lookup agrees with the batch one
+    assert db_service.get_journey_for_user("user_1", active_only=False).id == "journey_u1_new"
+    assert db_service.get_journey_for_user("user_1") is None
+    assert db_service.get_journeys_for_users([]) == {}
+
+
 def test_build_journey_from_db(db_service, sample_journey, sample_touchpoint):
     """Test building CustomerJourney object from database"""
     # Create journey
@@ -304,6 +434,49 @@ def test_build_journey_from_db(db_service, sample_journey, sample_touchpoint):
     assert rebuilt_journey.converted == sample_journey.converted
 
 
+def test_build_journeys_from_db(db_service, sample_journey):
+    """Test building many CustomerJourney objects in one batch"""
+    db_journey = db_service.create_or_update_journey(sample_journey)
+    db_service.save_touchpoints_bulk(sample_journey.touchpoints, db_journey.id)
+
+    rebuilt = db_service.build_journeys_from_db([db_journey.id, "missing_journey"])
+
+    assert len(rebuilt) == 1
+    assert rebuilt[0].user_id == sample_journey.user_id
+    assert len(rebuilt[0].touchpoints) == len(sample_journey.touchpoints)
+    assert db_service.build_journeys_from_db([]) == []
+
+
+def test_get_journey_columns(db_service):
+    """Test loading touchpoints as column arrays matches CustomerJourney.to_columns"""
+    base_time = datetime(2025, 1, 1)
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"evt_col_{i}",
+            user_id="user_col",
+            event_type=EventType.CLICK,
+            platform=platform,
+            timestamp=base_time + timedelta(hours=3 - i),
+            campaign_id=f"camp_{i}"
+        )
+        for i, platform in enumerate([Platform.META, Platform.GOOGLE_ADS, Platform.EMAIL])
+    ]
+    journey = CustomerJourney.from_touchpoints("user_col", touchpoints)
+    db_service.save_touchpoints_bulk(touchpoints, "journey_a")
+    db_service.save_touchpoints_bulk(
+        [touchpoints[0].model_copy(update={"event_id": "evt_col_b"})], "journey_b"
+    )
+
+    columns = db_service.get_journey_columns(["journey_a", "journey_b", "missing"])
+
+    assert set(columns) == {"journey_a", "journey_b"}
+    expected = journey.to_columns()
+    for name, values in expected.items():
+        assert list(columns["journey_a"][name]) == list(values)
+    assert list(columns["journey_a"]["platforms"]) == ["email", "google_ads", "meta"]
+    assert len(columns["journey_b"]["timestamps"]) == 1
+
+
 def test_get_recent_journeys(db_service, sample_journey):
     """Test retrieving recent journeys"""
     # Create multiple journeys
@@ -327,6 +500,87 @@ def test_get_recent_journeys(db_service, sample_journey):
     assert converted_journeys[0].converted == True
 
 
+def test_iter_journeys(db_service, test_db):
+    """Test streaming journeys in chunks"""
+    for i in range(5):
+        test_db.add(AttributionJourney(
+            id=f"journey_stream_{i}",
+            user_id="user_stream",
+            converted=i % 2 == 0,
+            first_touch_at=datetime(2025, 1, 1),
+            last_touch_at=datetime(2025, 1, 2)
+        ))
+    test_db.commit()
+
+    streamed = db_service.iter_journeys(chunk_size=2)
+    assert not isinstance(streamed, list)
+    assert len({j.id for j in streamed}) == 5
+
+    converted = list(db_service.iter_journeys(converted_only=True, chunk_size=2))
+    assert len(converted) == 3
+    assert len(list(db_service.iter_journeys(limit=2))) == 2
+
+
+def test_iter_customer_journeys(db_service, test_db):
+    """Test streaming built journeys chunk by chunk"""
+    touchpoints = []
+    for i in range(5):
+        test_db.add(AttributionJourney(
+            id=f"journey_build_{i}",
+            user_id=f"user_build_{i}",
+            converted=False,
+            first_touch_at=datetime(2025, 1, 1),
+            last_touch_at=datetime(2025, 1, 2)
+        ))
+        # Journey i gets i touchpoints
+        touchpoints.extend(
+            (
+                TouchpointEvent(
+                    event_id=f"build_event_{i}_{n}",
+                    user_id=f"user_build_{i}",
+                    event_type=EventType.CLICK,
+                    platform=Platform.META,
+                    timestamp=datetime(2025, 1, 1) + timedelta(minutes=n)
+                ),
+                f"journey_build_{i}"
+            )
+            for n in range(i)
+        )
+    db_service.save_touchpoints_for_journeys(touchpoints)
+    test_db.commit()
+
+    streamed = db_service.iter_customer_journeys(chunk_size=2)
+    assert not isinstance(streamed, list)
+    assert sorted(len(j.touchpoints) for j in streamed) == [1, 2, 3, 4]
+
+    long_journeys = db_service.iter_customer_journeys(min_touchpoints=3, chunk_size=2)
+    assert sorted(j.user_id for j in long_journeys) == ["user_build_3", "user_build_4"]
+
+
+def test_get_full_journey_for_user(db_service, test_db):
+    """Test the latest journey row comes back already built"""
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"full_event_{i}",
+            user_id="user_full",
+            event_type=EventType.CLICK,
+            platform=platform,
+            timestamp=datetime(2025, 1, 1) + timedelta(hours=i)
+        )
+        for i, platform in enumerate([Platform.META, Platform.LINKEDIN])
+    ]
+    journey = CustomerJourney.from_touchpoints("user_full", touchpoints)
+    db_service.create_or_update_journey(journey)
+    db_service.save_touchpoints_bulk(touchpoints, journey.journey_id)
+    test_db.commit()
+
+    db_journey, built = db_service.get_full_journey_for_user("user_full")
+
+    assert db_journey.id == journey.journey_id
+    assert [t.event_id for t in built.touchpoints] == ["full_event_0", "full_event_1"]
+    assert db_service.get_full_journey_for_user("user_missing") == (None, None)
+
+
 # ==================== ATTRIBUTION RESULT TESTS ====================
 
 def test_save_attribution_result(db_service, sample_journey):
@@ -399,6 +653,78 @@ def test_get_attribution_results_for_journey(db_service, sample_journey):
     assert results[0].model_type == "shapley"
 
 
+def test_platform_and_campaign_performance(db_service, test_db):
+    """Test SQL-side aggregation of stored attribution results"""
+    now = datetime.utcnow()
+    for i, meta_credit in enumerate([0.6, 0.8]):
+        test_db.add(AttributionResult(
+            id=f"result_{i}",
+            journey_id=f"journey_{i}",
+            model_type="shapley",
+            converted=True,
+            analyzed_at=now,
+            platform_attribution=[
+                {"platform": "meta", "credit": meta_credit, "touchpoint_count": 1,
+                 "revenue_attributed": 100.0 * meta_credit, "cost": 20.0},
+                {"platform": "google_search", "credit": 1 - meta_credit, "touchpoint_count": 1,
+                 "revenue_attributed": 100.0 * (1 - meta_credit), "cost": None}
+            ],
+            campaign_attribution=[
+                {"campaign_id": "camp_1", "campaign_name": "Spring", "platform": "meta",
+                 "credit": meta_credit, "touchpoint_count": 1, "revenue_attributed": 100.0 * meta_credit,
+                 "cost": 20.0, "first_touch_count": 1, "last_touch_count": 0, "middle_touch_count": 0}
+            ]
+        ))
+    test_db.commit()
+
+    window = (now - timedelta(days=1), now + timedelta(days=1))
+    platforms = {p["platform"]: p for p in db_service.get_platform_performance(*window)}
+
+    assert platforms["meta"]["total_credit"] == pytest.approx(1.4)
+    assert platforms["meta"]["revenue_attributed"] == pytest.approx(140.0)
+    assert platforms["meta"]["journey_count"] == 2
+    assert platforms["meta"]["roi"] == pytest.approx(3.5)
+    assert platforms["google_search"]["roi"] is None
+
+    campaigns = db_service.get_campaign_performance(*window, platform="meta")
+    assert len(campaigns) == 1
+    assert campaigns[0]["campaign_id"] == "camp_1"
+    assert campaigns[0]["first_touch_count"] == 2
+    assert campaigns[0]["roas"] == pytest.approx(3.5)
+
+    assert db_service.get_campaign_performance(*window, platform="google_search") == []
+
+
+def test_save_attribution_result_single_round_trip(db_service, test_db):
+    """Test saving a result issues one INSERT and no follow-up SELECT"""
+    statements = []
+    engine = test_db.get_bind()
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+
+    result = AttributionResultModel(
+        journey_id="journey_rt",
+        user_id="user_rt",
+        model_type=AttributionModelType.SHAPLEY,
+        platform_attribution=[
+            PlatformAttribution(platform=Platform.META, credit=1.0, touchpoint_count=1)
+        ],
+        campaign_attribution=[],
+        converted=True,
+        total_touchpoints=1,
+        unique_platforms=1
+    )
+    db_result = db_service.save_attribution_result(result, "journey_rt")
+    assert db_result.analyzed_at == result.analyzed_at
+    event.remove(engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO attribution_results")
+
+
 # ==================== MODEL STATE TESTS ====================
 
 def test_save_model_state(db_service):
@@ -467,6 +793,53 @@ def test_model_state_deactivation(db_service):
     assert active_state.training_journeys_count == 200
 
 
+def test_active_model_state_is_cached(db_service, test_db):
+    """Test active model state is served from cache until a new state is saved"""
+    db_service.save_model_state(
+        model_type="markov",
+        model_state={"version": 1},
+        training_journeys_count=100
+    )
+    first = db_service.get_active_model_state("markov")
+
+    # Out-of-band change is not visible while the cached snapshot is live
+    test_db.query(AttributionModelState).update({"training_journeys_count": 999})
+    assert db_service.get_active_model_state("markov").training_journeys_count == 100
+
+    # Each caller gets its own copy; edits never reach the cache
+    first.model_state["version"] = 42
+    assert db_service.get_active_model_state("markov").model_state["version"] == 1
+
+    db_service.save_model_state(
+        model_type="markov",
+        model_state={"version": 2},
+        training_journeys_count=200
+    )
+    assert db_service.get_active_model_state("markov").model_state["version"] == 2
+
+
+def test_model_state_cache_skips_misses_and_refreshes_on_commit(db_service, test_db):
+    """Test a missing state is not cached and a commit drops a stale entry"""
+    assert db_service.get_active_model_state("markov") is None
+    db_service.save_model_state(
+        model_type="markov",
+        model_state={"version": 1},
+        training_journeys_count=100
+    )
+    assert db_service.get_active_model_state("markov").model_state["version"] == 1
+
+    # A reader caching between the save's flush and its commit is cleared
+    # again once the commit lands
+    db_service.save_model_state(
+        model_type="markov",
+        model_state={"version": 2},
+        training_journeys_count=200
+    )
+    db_service_module._model_state_cache[("markov", None)] = "stale"
+    test_db.commit()
+    assert db_service.get_active_model_state("markov").model_state["version"] == 2
+
+
 # ==================== INTEGRATION TESTS ====================
 
 def test_complete_attribution_flow(db_service, sample_touchpoint, sample_conversion):
@@ -519,5 +892,56 @@ def test_complete_attribution_flow(db_service, sample_touchpoint, sample_convers
     assert results[0].converted == True
 
 
+# ==================== PARTITION TESTS ====================
+
+class _RecordingPostgresConnection:
+    """Stands in for a PostgreSQL connection; records SQL, answers lookups"""
+
+    class dialect:
+        name = "postgresql"
+
+    def __init__(self, existing, stranded_months):
+        self.existing = set(existing)
+        self.stranded_months = stranded_months
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "to_regclass(:name)" in sql:
+            value = params["name"] if params["name"] in self.existing else None
+        elif "to_regclass" in sql:
+            value = "attribution_touchpoints_default"
+        elif "SELECT EXISTS" in sql:
+            value = params["lower"][:7] in self.stranded_months
+        else:
+            value = None
+        return type("Result", (), {"scalar": lambda _self: value})()
+
+
+def test_partitions_adopt_rows_stranded_in_default():
+    """Test a missing month is created, moving its rows out of the default"""
+    connection = _RecordingPostgresConnection(
+        existing={"attribution_touchpoints_2025_01"}, stranded_months={"2025-02"}
+    )
+
+    created = ensure_touchpoint_partitions(connection, months_ahead=2, start=datetime(2025, 1, 15))
+
+    assert created == [
+        "attribution_touchpoints_2025_01",
+        "attribution_touchpoints_2025_02",
+        "attribution_touchpoints_2025_03"
+    ]
+    ddl = [sql for sql in connection.statements if not sql.startswith("SELECT")]
+    assert not any("2025_01" in sql for sql in ddl)
+    assert "DETACH PARTITION" in ddl[0]
+    assert "attribution_touchpoints_2025_02" in ddl[1]
+    assert "DELETE FROM attribution_touchpoints_default" in ddl[2]
+    assert "ATTACH PARTITION attribution_touchpoints_default DEFAULT" in ddl[3]
+    # A month with nothing stranded is a plain CREATE
+    assert ddl[4].startswith("CREATE TABLE IF NOT EXISTS attribution_touchpoints_2025_03")
+    assert len(ddl) == 5
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
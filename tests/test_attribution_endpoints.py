@@ -3,21 +3,32 @@ Integration tests for Attribution API Endpoints
 Tests the complete HTTP API for attribution engine
 """
 import pytest
+from cachetools import TTLCache
 from fastapi.testclient import TestClient
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.main import app
 from app.database import Base, get_db
-from app.attribution.event_schema import Platform
+from app.attribution.db_service import AttributionDatabaseService
+from app.attribution.event_schema import CustomerJourney, EventType, Platform, TouchpointEvent
+from app.attribution.models import AttributionModelType, AttributionResult, PlatformAttribution
+from app import attribution_endpoints
+from app.attribution_endpoints import get_shapley_model, SHAPLEY_MAX_TOUCHPOINTS
 
 
 # Test database setup
 @pytest.fixture(scope="function")
 def test_db():
     """Create a fresh in-memory SQLite database for each test"""
-    engine = create_engine("sqlite:///:memory:")
+    # One connection shared across threads: sync endpoints run in the threadpool
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
     Base.metadata.create_all(engine)
     SessionLocal = sessionmaker(bind=engine)
     session = SessionLocal()
@@ -43,6 +54,17 @@ def client(test_db):
     return TestClient(app)
 
 
+# ==================== EVENT ID TESTS ====================
+
+def test_event_ids_are_unique_per_call():
+    """Test IDs for the same user and second still differ"""
+    timestamp = datetime(2025, 1, 1, 12, 0, 0)
+    ids = {attribution_endpoints._event_id("user_1", timestamp) for _ in range(1000)}
+
+    assert len(ids) == 1000
+    assert all(i.startswith(f"user_1_{int(timestamp.timestamp())}_") for i in ids)
+
+
 # ==================== HEALTH CHECK TESTS ====================
 
 def test_health_check(client):
@@ -297,6 +319,54 @@ def test_analyze_journey_not_found(client):
     assert "No journey found" in response.json()["detail"]
 
 
+def test_long_journeys_use_uncapped_shapley_model():
+    """Test journeys over the default cap are scored in full, not sampled"""
+    default = get_shapley_model(SHAPLEY_MAX_TOUCHPOINTS)
+    long_journeys = get_shapley_model(SHAPLEY_MAX_TOUCHPOINTS + 1)
+
+    assert default is get_shapley_model()
+    assert default.max_touchpoints == SHAPLEY_MAX_TOUCHPOINTS
+    assert long_journeys is not default
+    assert long_journeys.max_touchpoints >= 200
+    assert get_shapley_model(200) is long_journeys
+
+
+async def test_repeat_analysis_reuses_cached_result(monkeypatch):
+    """Test an unchanged journey is scored and saved only once per model"""
+    monkeypatch.setattr(attribution_endpoints, "_result_cache", TTLCache(maxsize=8, ttl=60))
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db_service = AttributionDatabaseService(db)
+
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"cache_event_{i}",
+            user_id="cache_user",
+            event_type=EventType.CLICK,
+            platform=platform,
+            timestamp=datetime(2025, 1, 1) + timedelta(hours=i)
+        )
+        for i, platform in enumerate([Platform.META, Platform.GOOGLE_ADS])
+    ]
+    journey = CustomerJourney.from_touchpoints("cache_user", touchpoints)
+    with db_service.unit_of_work():
+        db_service.create_or_update_journey(journey)
+        db_service.save_touchpoints_bulk(touchpoints[:1], journey.journey_id)
+
+    request = attribution_endpoints.AnalyzeJourneyRequest(user_id="cache_user")
+    first = await attribution_endpoints.analyze_journey(request, db)
+    assert await attribution_endpoints.analyze_journey(request, db) is first
+    assert len(db_service.get_attribution_results_for_journey(journey.journey_id)) == 1
+
+    # A new touchpoint changes the fingerprint, so the journey is rescored
+    with db_service.unit_of_work():
+        db_service.save_touchpoints_bulk(touchpoints[1:], journey.journey_id)
+    updated = await attribution_endpoints.analyze_journey(request, db)
+    assert updated.total_touchpoints == 2
+    db.close()
+
+
 # ==================== BATCH ANALYSIS TESTS ====================
 
 def test_analyze_batch(client):
@@ -335,6 +405,52 @@ def test_analyze_batch(client):
     assert "insights" in data
 
 
+def test_aggregate_ranks_platforms_and_insights():
+    """Test totals are summed per platform and insights ranked by frequency"""
+    def result(platform, revenue, insights):
+        return AttributionResult(
+            model_type=AttributionModelType.SHAPLEY,
+            platform_attribution=[PlatformAttribution(
+                platform=platform, credit=1.0, touchpoint_count=1, revenue_attributed=revenue
+            )],
+            converted=True,
+            total_touchpoints=1,
+            unique_platforms=1,
+            insights=insights
+        )
+
+    aggregated = attribution_endpoints._aggregate_attribution_results([
+        result(Platform.META, 100.0, ["rare", "common"]),
+        result(Platform.META, 50.0, ["common", "frequent"]),
+        result(Platform.GOOGLE_ADS, 120.0, ["frequent", "common"]),
+    ])
+
+    assert aggregated["platforms"][0] == {
+        "platform": "meta", "credit": 2.0, "revenue": 150.0, "count": 2
+    }
+    assert aggregated["insights"] == ["common", "frequent", "rare"]
+
+
+async def test_background_attribution_opens_own_session(monkeypatch):
+    """Test the background task uses and closes a session of its own"""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    closed = []
+
+    class TrackingSession(Session):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    monkeypatch.setattr(
+        attribution_endpoints, "SessionLocal", sessionmaker(bind=engine, class_=TrackingSession)
+    )
+
+    await attribution_endpoints._analyze_and_save_attribution("missing_journey")
+
+    assert len(closed) == 1
+
+
 # ==================== MARKOV TRAINING TESTS ====================
 
 def test_train_markov(client):
@@ -0,0 +1,123 @@
+"""
+Unit tests for the GA4 Measurement Protocol client
+"""
+import json
+
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.attribution.platform_integrations.google_analytics import (
+    GA4MeasurementProtocolClient,
+    GA4_MAX_EVENTS_PER_REQUEST
+)
+
+
+@pytest.fixture
+def requests_sent():
+    return []
+
+
+@pytest.fixture
+def ga4_client(requests_sent):
+    """GA4 client whose HTTP traffic is captured instead of sent"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_sent.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    client = GA4MeasurementProtocolClient(
+        measurement_id="G-TEST", api_secret="secret", use_aiohttp=False
+    )
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url,
+        transport=httpx.MockTransport(handler)
+    )
+    return client
+
+
+async def test_helper_events_share_requests(ga4_client, requests_sent):
+    """Test buffered events are coalesced per user, 25 events per request"""
+    for i in range(GA4_MAX_EVENTS_PER_REQUEST + 5):
+        await ga4_client.send_page_view(
+            "client_1", "user_1", f"https://example.com/{i}", buffer=True
+        )
+    await ga4_client.send_lead("client_2", None, value=10.0, buffer=True)
+
+    await ga4_client.flush()
+
+    sizes = sorted(len(payload["events"]) for payload in requests_sent)
+    assert sizes == [1, 5, GA4_MAX_EVENTS_PER_REQUEST]
+    lead = next(p for p in requests_sent if p["client_id"] == "client_2")
+    assert lead["events"][0]["name"] == "generate_lead"
+    assert "user_id" not in lead
+
+    await ga4_client.aclose()
+
+
+async def test_helpers_send_before_returning_by_default(ga4_client, requests_sent):
+    """Test unbuffered helpers send before returning"""
+    sent = await ga4_client.send_purchase("client_1", "user_1", "txn_1", 99.0)
+
+    assert sent
+    assert len(requests_sent) == 1
+    assert requests_sent[0]["events"][0]["params"]["transaction_id"] == "txn_1"
+
+    await ga4_client.aclose()
+
+
+async def test_helpers_report_failed_sends():
+    """Test an unbuffered helper returns False when GA4 rejects the request"""
+    client = GA4MeasurementProtocolClient(
+        measurement_id="G-TEST", api_secret="secret", use_aiohttp=False
+    )
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url,
+        transport=httpx.MockTransport(lambda request: httpx.Response(400))
+    )
+
+    assert await client.send_lead("client_1", "user_1", value=5.0) is False
+
+    await client.aclose()
+
+
+async def test_close_flushes_buffered_events(ga4_client, requests_sent):
+    """Test closing the client sends anything still buffered"""
+    await ga4_client.send_add_to_cart(
+        "client_1", "user_1", items=[{"item_id": "sku"}], buffer=True
+    )
+    assert requests_sent == []
+
+    await ga4_client.aclose()
+
+    assert len(requests_sent) == 1
+
+
+async def test_aiohttp_transport_sends_orjson_payload():
+    """Test the aiohttp transport posts to the collect endpoint"""
+    received = []
+
+    async def collect(request: web.Request) -> web.Response:
+        received.append((request.query["measurement_id"], await request.json()))
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post("/mp/collect", collect)
+    server = TestServer(app)
+    await server.start_server()
+
+    client = GA4MeasurementProtocolClient(
+        measurement_id="G-TEST", api_secret="secret", use_aiohttp=True
+    )
+    client.base_url = str(server.make_url(""))
+    try:
+        assert await client.send_lead("client_1", "user_1", value=5.0)
+    finally:
+        await client.aclose()
+        await server.close()
+
+    assert received == [("G-TEST", {
+        "client_id": "client_1",
+        "events": [{"name": "generate_lead", "params": {"value": 5.0, "currency": "USD"}}],
+        "user_id": "user_1"
+    })]
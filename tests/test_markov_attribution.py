@@ -0,0 +1,251 @@
+"""
+Unit tests for the Markov chain attribution model
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+
+from app.attribution.event_schema import (
+    TouchpointEvent,
+    ConversionEvent,
+    CustomerJourney,
+    Platform,
+    EventType
+)
+from app.attribution.markov import MarkovChainAttributionModel
+
+
+def _journey(user_id: str, platforms, converted: bool) -> CustomerJourney:
+    start = datetime(2025, 1, 1)
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"{user_id}_{i}",
+            user_id=user_id,
+            event_type=EventType.CLICK,
+            platform=platform,
+            timestamp=start + timedelta(hours=i)
+        )
+        for i, platform in enumerate(platforms)
+    ]
+    conversion = None
+    if converted:
+        conversion = ConversionEvent(
+            conversion_id=f"{user_id}_conversion",
+            user_id=user_id,
+            conversion_type="purchase",
+            timestamp=start + timedelta(hours=len(platforms)),
+            revenue=100.0
+        )
+    return CustomerJourney.from_touchpoints(user_id, touchpoints, conversion)
+
+
+@pytest.fixture
+def training_journeys():
+    """Meta-led journeys convert, Google-only journeys mostly do not"""
+    journeys = []
+    for i in range(6):
+        journeys.append(_journey(f"a{i}", [Platform.META, Platform.GOOGLE_ADS], True))
+        journeys.append(_journey(f"b{i}", [Platform.GOOGLE_ADS], i == 0))
+    return journeys
+
+
+@pytest.fixture
+def trained_model(training_journeys):
+    model = MarkovChainAttributionModel(min_support=1)
+    model.train(training_journeys)
+    return model
+
+
+def test_train_learns_transition_probabilities(trained_model):
+    """Test transition probabilities are normalised counts per state"""
+    assert trained_model.is_trained
+    assert trained_model.transitions[("START", "meta")] == pytest.approx(0.5)
+    assert trained_model.transitions[("START", "google_ads")] == pytest.approx(0.5)
+    assert trained_model.transitions[("meta", "google_ads")] == pytest.approx(1.0)
+    # google_ads closes 12 journeys, 7 of which convert
+    assert trained_model.transitions[("google_ads", "CONVERSION")] == pytest.approx(7 / 12)
+    assert trained_model.state_counts["google_ads"] == 12
+    assert trained_model.conversion_probs["google_ads"] == pytest.approx(7 / 12)
+    # Journeys are never chained into one another
+    assert ("CONVERSION", "START") not in trained_model.transitions
+
+
+def test_retrain_replaces_previous_transitions(trained_model):
+    """Test retraining does not keep transitions from the previous data"""
+    trained_model.train([_journey("c0", [Platform.LINKEDIN], True)])
+
+    assert set(trained_model.transitions) == {
+        ("START", "linkedin"),
+        ("linkedin", "CONVERSION")
+    }
+
+
+def test_attribution_credits_sum_to_one(trained_model):
+    """Test removal-effect credits are normalised across the journey"""
+    journey = _journey("d0", [Platform.META, Platform.GOOGLE_ADS], True)
+
+    result = trained_model.calculate_attribution(journey)
+
+    credits = {p.platform: p.credit for p in result.platform_attribution}
+    assert sum(credits.values()) == pytest.approx(1.0)
+    assert set(credits) == {Platform.META, Platform.GOOGLE_ADS}
+
+
+def test_repeated_platform_credits_still_sum_to_one():
+    """Test a platform's share is split over its touchpoints, not repeated"""
+    path = [Platform.META, Platform.GOOGLE_ADS, Platform.META]
+    journeys = [_journey(f"r{i}", path, True) for i in range(3)]
+    journeys += [_journey(f"g{i}", [Platform.GOOGLE_ADS], False) for i in range(3)]
+    model = MarkovChainAttributionModel(min_support=1)
+    model.train(journeys)
+    journey = _journey("d1", path, True)
+    effects = model._removal_effects(journey, [Platform.META, Platform.GOOGLE_ADS])
+
+    result = model.calculate_attribution(journey)
+
+    credits = {p.platform: p for p in result.platform_attribution}
+    assert sum(p.credit for p in credits.values()) == pytest.approx(1.0)
+    assert credits[Platform.META].touchpoint_count == 2
+    assert credits[Platform.META].credit == pytest.approx(
+        effects[Platform.META] / sum(effects.values())
+    )
+
+
+def test_batched_removal_matches_filtered_paths(trained_model):
+    """Test each removal row equals scoring the journey without that platform"""
+    platforms = [Platform.META, Platform.GOOGLE_ADS, Platform.META, Platform.LINKEDIN]
+    journey = _journey("e0", platforms, True)
+
+    for platform in set(platforms):
+        remaining = [p for p in platforms if p != platform]
+        expected = trained_model._calculate_conversion_probability(
+            _journey("e1", remaining, True)
+        )
+        assert trained_model._calculate_conversion_probability(
+            journey, remove_platform=platform
+        ) == pytest.approx(expected)
+
+    only_meta = _journey("e2", [Platform.META], True)
+    assert trained_model._calculate_conversion_probability(
+        only_meta, remove_platform=Platform.META
+    ) == 0.0
+
+
+def test_path_scores_are_memoised_until_retrained(trained_model):
+    """Test repeated paths hit the cache and retraining invalidates it"""
+    path = [Platform.META, Platform.GOOGLE_ADS]
+    first = trained_model._calculate_conversion_probability(_journey("f0", path, True))
+    trained_model._calculate_conversion_probability(_journey("f1", path, True))
+
+    assert trained_model._path_probabilities.cache_info().hits == 1
+
+    trained_model.train([_journey("f2", path, False), _journey("f3", path, True)])
+
+    assert trained_model._path_probabilities.cache_info().currsize == 0
+    assert trained_model._calculate_conversion_probability(
+        _journey("f4", path, True)
+    ) != pytest.approx(first)
+
+
+def test_critical_platform_ties_go_to_first_touch(trained_model):
+    """Test the most-critical insight is deterministic when effects tie"""
+    journey = _journey("g0", [Platform.TIKTOK, Platform.LINKEDIN], True)
+
+    for _ in range(3):
+        result = trained_model.calculate_attribution(journey)
+        assert result.insights[0].startswith("Tiktok was most critical")
+
+
+def test_top_paths_ranked_by_conversion_probability(trained_model):
+    """Test top paths are states ordered by their transition into CONVERSION"""
+    trained_model.train([
+        _journey("h0", [Platform.META], True),
+        _journey("h1", [Platform.LINKEDIN], True),
+        _journey("h2", [Platform.LINKEDIN], False),
+        _journey("h3", [Platform.TIKTOK], False)
+    ])
+
+    assert trained_model.get_top_paths() == [(["meta"], 1.0), (["linkedin"], 0.5)]
+    assert trained_model.get_top_paths(1) == [(["meta"], 1.0)]
+
+
+def test_bulk_scoring_matches_single_journeys(trained_model):
+    """Test bulk path scoring agrees with scoring journeys one at a time"""
+    journeys = [
+        _journey("i0", [Platform.META, Platform.GOOGLE_ADS], True),
+        _journey("i1", [Platform.GOOGLE_ADS], False),
+        _journey("i3", [Platform.LINKEDIN, Platform.META, Platform.META], True)
+    ]
+
+    scores = trained_model.conversion_probabilities(journeys)
+
+    expected = [trained_model._calculate_conversion_probability(j) for j in journeys]
+    assert scores.tolist() == pytest.approx(expected)
+
+
+def test_update_matches_training_on_all_journeys(training_journeys):
+    """Test incremental updates give the same model as one full training run"""
+    new_journeys = [
+        _journey("j0", [Platform.LINKEDIN, Platform.META], True),
+        _journey("j1", [Platform.META], False)
+    ]
+    incremental = MarkovChainAttributionModel(min_support=1)
+    incremental.train(training_journeys)
+    incremental.update(new_journeys)
+
+    full = MarkovChainAttributionModel(min_support=1)
+    full.train(training_journeys + new_journeys)
+
+    assert incremental.transitions == pytest.approx(full.transitions)
+    assert incremental.state_counts == full.state_counts
+    assert incremental.conversion_probs == pytest.approx(full.conversion_probs)
+
+
+def test_state_round_trip_restores_model(trained_model):
+    """Test a saved snapshot is JSON-safe and rebuilds the same model"""
+    state = json.loads(json.dumps(trained_model.to_state()))
+    restored = MarkovChainAttributionModel.from_state(state)
+
+    assert restored.is_trained
+    assert restored.transitions == pytest.approx(trained_model.transitions)
+    assert restored.state_counts == trained_model.state_counts
+    assert restored.conversion_probs == pytest.approx(trained_model.conversion_probs)
+
+    empty = MarkovChainAttributionModel.from_state(MarkovChainAttributionModel().to_state())
+    assert not empty.is_trained
+
+
+def test_train_consumes_a_journey_stream(training_journeys, trained_model):
+    """Test training from a one-shot generator matches training from a list"""
+    streamed = MarkovChainAttributionModel(min_support=1)
+    streamed.train(journey for journey in training_journeys)
+
+    assert streamed.journey_count == len(training_journeys)
+    assert streamed.transitions == pytest.approx(trained_model.transitions)
+
+    streamed.update(iter([_journey("s0", [Platform.META], True)]))
+    assert streamed.journey_count == len(training_journeys) + 1
+
+
+def test_low_support_states_use_overall_conversion_rate():
+    """Test states below min_support fall back to the overall average"""
+    model = MarkovChainAttributionModel(min_support=3)
+    model.train(
+        [_journey(f"k{i}", [Platform.META], i < 2) for i in range(4)]
+        + [_journey("k4", [Platform.TIKTOK], True)]
+    )
+
+    # 3 conversions over 10 transitions out of any state
+    assert model.conversion_probs["tiktok"] == pytest.approx(3 / 10)
+    assert model.conversion_probs["meta"] == pytest.approx(2 / 4)
+
+
+def test_single_platform_journey_gets_full_credit(trained_model):
+    """Test a one-channel journey gives that channel all credit, split evenly"""
+    journey = _journey("l0", [Platform.GOOGLE_ADS] * 3, True)
+
+    result = trained_model.calculate_attribution(journey)
+
+    assert len(result.platform_attribution) == 1
+    assert result.platform_attribution[0].credit == pytest.approx(1.0)
+    assert trained_model._path_probabilities.cache_info().misses == 0
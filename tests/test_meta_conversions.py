@@ -0,0 +1,220 @@
+"""
+Unit tests for the Meta Conversions API client
+"""
+import asyncio
+import hashlib
+import json
+
+import httpx
+import pytest
+
+from app.attribution.platform_integrations import meta_conversions
+from app.attribution.platform_integrations.meta_conversions import (
+    MetaCircuitOpenError,
+    MetaConversionsAPIClient,
+    MetaConversionEvent,
+    MetaCustomData,
+    MetaUserData,
+    _EventQueue
+)
+
+
+def _event(i: int) -> MetaConversionEvent:
+    return MetaConversionEvent(
+        event_name="Lead",
+        event_time=1735689600 + i,
+        user_data=MetaUserData(external_id=f"user_{i}"),
+        event_id=f"event_{i}"
+    )
+
+
+async def test_concurrent_events_share_one_request():
+    """Test events submitted together go out in one batch"""
+    batches = []
+
+    async def send_batch(events):
+        batches.append([e.event_id for e in events])
+        return {"events_received": len(events)}
+
+    queue = _EventQueue(send_batch, max_events=3, flush_interval=0.05)
+    results = await asyncio.gather(*(queue.submit(_event(i)) for i in range(5)))
+
+    assert batches == [["event_0", "event_1", "event_2"], ["event_3", "event_4"]]
+    # Each submitter sees its own event received, not the batch count
+    assert results == [{"events_received": 1}] * 5
+
+    await queue.stop()
+
+
+async def test_batch_failure_reaches_every_submitter():
+    """Test a failed request raises for each event in the batch"""
+    async def send_batch(events):
+        raise RuntimeError("boom")
+
+    queue = _EventQueue(send_batch, flush_interval=0.01)
+    results = await asyncio.gather(
+        queue.submit(_event(0)), queue.submit(_event(1)), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    await queue.stop()
+
+
+async def test_rejected_batch_is_bisected_to_the_invalid_event():
+    """Test a 4xx batch is resent in halves so only the bad event fails"""
+    batches = []
+
+    async def send_batch(events):
+        batches.append([e.event_id for e in events])
+        if any(e.event_id == "event_2" for e in events):
+            request = httpx.Request("POST", "https://graph.facebook.com")
+            raise httpx.HTTPStatusError(
+                "invalid", request=request, response=httpx.Response(400, request=request)
+            )
+        return {"events_received": len(events)}
+
+    queue = _EventQueue(send_batch, flush_interval=0.05)
+    results = await asyncio.gather(
+        *(queue.submit(_event(i)) for i in range(4)), return_exceptions=True
+    )
+
+    assert isinstance(results[2], httpx.HTTPStatusError)
+    assert [results[i] for i in (0, 1, 3)] == [{"events_received": 1}] * 3
+    assert batches == [
+        ["event_0", "event_1", "event_2", "event_3"],
+        ["event_0", "event_1"],
+        ["event_2", "event_3"],
+        ["event_2"],
+        ["event_3"]
+    ]
+
+    await queue.stop()
+
+
+def test_event_data_includes_optional_fields():
+    """Test a data entry carries the event's optional fields"""
+    event = _event(0)
+    event.event_source_url = "https://example.com/signup"
+
+    data = MetaConversionsAPIClient._event_data(event)
+
+    assert data["event_id"] == "event_0"
+    assert data["event_source_url"] == "https://example.com/signup"
+    assert "custom_data" not in data
+    assert len(data["user_data"]["external_id"]) == 64
+
+
+async def test_send_events_posts_one_request():
+    """Test send_events puts every event in one payload on the shared client"""
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["content-type"] == "application/json"
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"events_received": len(payloads[-1]["data"])})
+
+    client = MetaConversionsAPIClient(pixel_id="123", access_token="token")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    result = await client.send_events([_event(0), _event(1)])
+
+    assert result == {"events_received": 2}
+    assert [d["event_id"] for d in payloads[0]["data"]] == ["event_0", "event_1"]
+    assert payloads[0]["access_token"] == "token"
+
+    await client.aclose()
+    assert client._client is None
+
+
+def test_user_data_hashes_normalised_pii():
+    """Test PII is normalised before hashing and repeat values hash alike"""
+    first = MetaUserData(email=" Jane@Example.com ", phone="+1 (555) 010-2000").to_meta_format()
+    second = MetaUserData(email="jane@example.com", phone="15550102000").to_meta_format()
+
+    assert first == second
+    assert first["em"] == hashlib.sha256(b"jane@example.com").hexdigest()
+    # Non-ASCII separators are stripped as well
+    assert MetaUserData(phone="1\u2013555\u2013010\u20132000").to_meta_format() == {"ph": second["ph"]}
+
+
+def test_user_payload_is_cached_until_a_field_changes():
+    """Test the hashed payload is built once and rebuilt after edits"""
+    user = MetaUserData(email="jane@example.com")
+
+    assert user.meta_payload is user.meta_payload
+    assert user == MetaUserData(email="jane@example.com")
+
+    user.email = "john@example.com"
+    assert user.meta_payload["em"] == hashlib.sha256(b"john@example.com").hexdigest()
+
+    copy = user.model_copy(update={"email": "jo@example.com"})
+    assert copy.meta_payload["em"] == hashlib.sha256(b"jo@example.com").hexdigest()
+
+
+def test_custom_data_dump_is_cached_until_a_field_changes():
+    """Test custom data is dumped once and re-dumped after edits"""
+    event = _event(0)
+    event.custom_data = MetaCustomData(value=10.0)
+
+    first = MetaConversionsAPIClient._event_data(event)["custom_data"]
+    assert first == {"value": 10.0, "currency": "USD"}
+    assert MetaConversionsAPIClient._event_data(event)["custom_data"] is first
+
+    event.custom_data.order_id = "order_1"
+    assert event.custom_data.meta_dict["order_id"] == "order_1"
+
+
+def _client_with_responses(statuses, calls):
+    """Meta client whose requests get the given status codes in turn"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, json={"events_received": 1})
+
+    client = MetaConversionsAPIClient(pixel_id="123", access_token="token")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+async def test_transient_errors_are_retried(monkeypatch):
+    """Test 5xx responses are retried and 4xx responses are not"""
+    monkeypatch.setattr(meta_conversions, "META_RETRY_INITIAL_SECONDS", 0.0)
+    calls = []
+    client = _client_with_responses([503, 502, 200], calls)
+
+    assert await client.send_events([_event(0)]) == {"events_received": 1}
+    assert len(calls) == 3
+
+    calls.clear()
+    client._client = _client_with_responses([400], calls)._client
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.send_events([_event(0)])
+    assert len(calls) == 1
+
+    await client.aclose()
+
+
+async def test_circuit_opens_after_repeated_failures(monkeypatch):
+    """Test requests fail fast once Meta has failed fail_max times in a row"""
+    monkeypatch.setattr(meta_conversions, "META_RETRY_INITIAL_SECONDS", 0.0)
+    calls = []
+    client = _client_with_responses([500], calls)
+    client._breaker.fail_max = 2
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.send_events([_event(0)])
+    sent = len(calls)
+
+    with pytest.raises(MetaCircuitOpenError):
+        await client.send_events([_event(0)])
+    assert len(calls) == sent
+
+    # A request after the reset timeout goes through again
+    client._breaker.reset_timeout = 0.0
+    client._client = _client_with_responses([200], calls)._client
+    assert await client.send_events([_event(0)]) == {"events_received": 1}
+    assert not client._breaker.is_open
+
+    await client.aclose()
@@ -0,0 +1,68 @@
+"""
+Unit tests for response time collection
+"""
+from app.core import cache
+
+
+class _RecordingPipeline:
+    """Redis pipeline stand-in that records its commands"""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        self.calls.append(("execute", ()))
+
+
+class _RecordingRedis:
+    def __init__(self):
+        self.calls = []
+
+    def pipeline(self, transaction=True):
+        return _RecordingPipeline(self.calls)
+
+
+def test_timings_are_flushed_in_one_pipeline(monkeypatch):
+    """Test recording does no I/O and a flush writes every sample at once"""
+    redis = _RecordingRedis()
+    monkeypatch.setattr(cache, "redis_client", redis)
+    cache._pending_timings.clear()
+
+    cache.record_response_time("/a", 12.5)
+    cache.record_response_time("/a", 20.0)
+    cache.record_response_time("/b", 3.0)
+    assert redis.calls == []
+
+    assert cache.flush_response_times() == 3
+
+    commands = [name for name, _ in redis.calls]
+    assert commands.count("execute") == 1
+    assert commands.count("zadd") == 2
+    zadds = {args[0]: args[1] for name, args in redis.calls if name == "zadd"}
+    assert len(zadds["timings:/a"]) == 2
+    assert ("sadd", (cache.TIMINGS_ENDPOINTS_KEY, "/a", "/b")) in redis.calls
+
+    # Nothing pending means no round trip
+    redis.calls.clear()
+    assert cache.flush_response_times() == 0
+    assert redis.calls == []
+
+
+def test_failed_flush_reports_nothing_written(monkeypatch, capsys):
+    """Test a Redis failure is reported and no samples are counted as flushed"""
+    class _FailingPipeline(_RecordingPipeline):
+        def execute(self):
+            raise ConnectionError("redis down")
+
+    redis = _RecordingRedis()
+    redis.pipeline = lambda transaction=True: _FailingPipeline(redis.calls)
+    monkeypatch.setattr(cache, "redis_client", redis)
+    cache._pending_timings.clear()
+
+    cache.record_response_time("/a", 12.5)
+
+    assert cache.flush_response_times() == 0
+    assert "Response time flush error: redis down" in capsys.readouterr().out
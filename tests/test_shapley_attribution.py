@@ -0,0 +1,132 @@
+"""
+Unit tests for the Shapley value attribution model
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from app.attribution.event_schema import (
+    TouchpointEvent,
+    ConversionEvent,
+    CustomerJourney,
+    Platform,
+    EventType
+)
+from app.attribution.shapley import ShapleyAttributionModel, ShapleyAttributionBatch
+
+
+def _journey(user_id: str, platforms, converted: bool = True) -> CustomerJourney:
+    start = datetime(2025, 1, 1)
+    touchpoints = [
+        TouchpointEvent(
+            event_id=f"{user_id}_{i}",
+            user_id=user_id,
+            event_type=EventType.CLICK,
+            platform=platform,
+            timestamp=start + timedelta(hours=i)
+        )
+        for i, platform in enumerate(platforms)
+    ]
+    conversion = None
+    if converted:
+        conversion = ConversionEvent(
+            conversion_id=f"{user_id}_conversion",
+            user_id=user_id,
+            conversion_type="purchase",
+            timestamp=start + timedelta(hours=len(platforms)),
+            revenue=100.0
+        )
+    return CustomerJourney.from_touchpoints(user_id, touchpoints, conversion)
+
+
+PATHS = [
+    [Platform.META],
+    [Platform.META, Platform.GOOGLE_ADS],
+    [Platform.META, Platform.META],
+    [Platform.META, Platform.META, Platform.GOOGLE_ADS],
+    [Platform.LINKEDIN, Platform.META, Platform.TIKTOK, Platform.META, Platform.LINKEDIN],
+    [Platform.GOOGLE_ADS] * 4
+]
+
+
+def test_shapley_values_weight_position_diversity_and_switches():
+    """Test the three heuristic rules on a small journey"""
+    journey = _journey("a0", [Platform.META, Platform.META, Platform.GOOGLE_ADS])
+
+    values = ShapleyAttributionModel()._calculate_shapley_values(journey.touchpoints, journey)
+
+    # first touch, repeated platform
+    assert values[0] == pytest.approx(0.3)
+    # middle touch, repeated platform, no switch
+    assert values[1] == pytest.approx(0.2)
+    # last touch, unique platform, switch
+    assert values[2] == pytest.approx(0.7)
+
+
+def test_batch_kernel_matches_single_journey_values():
+    """Test the vectorised batch values equal the per-journey calculation"""
+    model = ShapleyAttributionModel()
+    journeys = [_journey(f"b{i}", path) for i, path in enumerate(PATHS)]
+
+    batch_values = model._batch_shapley_values([j.touchpoints for j in journeys])
+
+    for journey, values in zip(journeys, batch_values):
+        expected = model._calculate_shapley_values(journey.touchpoints, journey)
+        assert values == pytest.approx(expected)
+
+
+def test_batch_attribution_keeps_journey_order():
+    """Test batch results line up with the input, including non-converters"""
+    journeys = [
+        _journey("c0", PATHS[3]),
+        _journey("c1", PATHS[1], converted=False),
+        _journey("c2", PATHS[2])
+    ]
+
+    results = ShapleyAttributionBatch().calculate_batch_attribution(journeys)
+
+    assert [r.journey_id for r in results] == [j.journey_id for j in journeys]
+    assert [r.converted for r in results] == [True, False, True]
+    single = ShapleyAttributionModel().calculate_attribution(journeys[2])
+    assert results[2].platform_attribution == single.platform_attribution
+
+
+def test_calculate_attributions_matches_single_journeys():
+    """Test attributing many journeys at once gives per-journey results"""
+    model = ShapleyAttributionModel()
+    journeys = [_journey(f"f{i}", path) for i, path in enumerate(PATHS + PATHS)]
+
+    results = model.calculate_attributions(journeys)
+
+    for journey, result in zip(journeys, results):
+        single = model.calculate_attribution(journey)
+        assert [p.platform for p in result.platform_attribution] == \
+            [p.platform for p in single.platform_attribution]
+        assert [p.credit for p in result.platform_attribution] == \
+            pytest.approx([p.credit for p in single.platform_attribution])
+        assert result.insights == single.insights
+
+
+@pytest.mark.parametrize("max_count", [10, 40])
+def test_sampling_keeps_ends_and_spreads_middle(max_count):
+    """Test long journeys keep first/last touch and evenly spaced middles"""
+    platforms = [Platform.META, Platform.GOOGLE_ADS, Platform.LINKEDIN] * 40
+    journey = _journey("d0", platforms)
+
+    sampled = ShapleyAttributionModel()._sample_touchpoints(journey.touchpoints, max_count)
+
+    step = (len(platforms) - 2) / (max_count - 2)
+    expected = [0, *(int(1 + i * step) for i in range(max_count - 2)), len(platforms) - 1]
+    assert [t.event_id for t in sampled] == [f"d0_{i}" for i in expected]
+
+
+def test_batch_scores_each_platform_sequence_once():
+    """Test journeys with the same platform sequence share one values dict"""
+    journeys = [_journey(f"e{i}", PATHS[i % 2 + 3]) for i in range(4)]
+
+    batch_values = ShapleyAttributionModel()._batch_shapley_values(
+        [j.touchpoints for j in journeys]
+    )
+
+    assert batch_values[0] is batch_values[2]
+    assert batch_values[1] is batch_values[3]
+    assert batch_values[0] != batch_values[1]
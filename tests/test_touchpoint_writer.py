@@ -0,0 +1,94 @@
+"""
+Unit tests for the buffered touchpoint writer
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.attribution.db_models import AttributionTouchpoint
+from app.attribution.event_schema import TouchpointEvent, Platform, EventType
+from app.attribution.touchpoint_writer import TouchpointWriter
+
+
+@pytest.fixture
+def session_factory():
+    """In-memory SQLite shared with the writer's worker thread"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def _touchpoint(i: int) -> TouchpointEvent:
+    return TouchpointEvent(
+        event_id=f"buffered_{i}",
+        user_id="user_123",
+        event_type=EventType.CLICK,
+        platform=Platform.META,
+        timestamp=datetime(2025, 1, 1) + timedelta(minutes=i)
+    )
+
+
+async def test_writer_batches_and_flushes(session_factory):
+    """Test queued touchpoints are written in batches across journeys"""
+    writer = TouchpointWriter(session_factory, batch_size=3, max_wait_seconds=0.05)
+    writer.start()
+
+    for i in range(7):
+        await writer.enqueue(_touchpoint(i), f"journey_{i % 2}")
+    await writer.flush()
+
+    db = session_factory()
+    assert db.query(AttributionTouchpoint).count() == 7
+    assert db.query(AttributionTouchpoint).filter_by(journey_id="journey_0").count() == 4
+    db.close()
+
+    await writer.stop()
+    assert not writer.running
+
+
+async def test_writer_stop_drains_queue(session_factory):
+    """Test stopping the writer persists everything still queued"""
+    writer = TouchpointWriter(session_factory, batch_size=500, max_wait_seconds=10)
+    writer.start()
+
+    await writer.enqueue(_touchpoint(0), "journey_0")
+    await writer.stop()
+
+    db = session_factory()
+    assert db.query(AttributionTouchpoint).count() == 1
+    db.close()
+
+
+async def test_writer_retries_failed_batches(session_factory):
+    """Test a failing batch is retried, and counted as dropped once attempts run out"""
+    failures = {"left": 1}
+
+    def flaky_factory():
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("database unavailable")
+        return session_factory()
+
+    writer = TouchpointWriter(flaky_factory, max_wait_seconds=0.01, retry_seconds=0.0)
+    writer.start()
+
+    await writer.enqueue(_touchpoint(0), "journey_0")
+    await writer.flush()
+    assert writer.stats == {"queued": 0, "written": 1, "dropped": 0}
+
+    failures["left"] = writer.max_attempts
+    await writer.enqueue(_touchpoint(1), "journey_0")
+    await writer.flush()
+    assert writer.stats == {"queued": 0, "written": 1, "dropped": 1}
+
+    await writer.stop()
+    db = session_factory()
+    assert db.query(AttributionTouchpoint).count() == 1
+    db.close()